@@ -0,0 +1,113 @@
+import os
+
+import pandas as pd
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from Queries import as_statement, queries
+
+
+class AsyncDatabase:
+    """
+    asyncio counterpart of Database built on SQLAlchemy's create_async_engine. Every call checks its own connection
+    out of the engine's pool, so many coroutines can query concurrently; bound the concurrency with a semaphore (see
+    AsyncVehicle.gather_vehicles) to stay below pool_size + max_overflow.
+    """
+    pool_size = 5
+    max_overflow = 10
+    pool_recycle = 3600
+    pool_pre_ping = True
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.host = None
+        self.db_name = None
+        self.engine = None
+
+    def create_connection(self):
+        if self.engine is None:
+            self.engine = create_async_engine(self.dsn, **self.engine_options())
+        return self.engine
+
+    def engine_options(self):
+        return {'echo': False, 'pool_size': self.pool_size, 'max_overflow': self.max_overflow,
+                'pool_recycle': self.pool_recycle, 'pool_pre_ping': self.pool_pre_ping}
+
+    def get_engine(self):
+        return self.create_connection()
+
+    async def dispose(self):
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
+
+    async def run_query(self, raw_query, params=None):
+        async with self.get_engine().connect() as connection:
+            results = await self.execute(connection, raw_query, params)
+            return results.fetchall()
+
+    async def run_statement(self, raw_query, params=None):
+        async with self.get_engine().begin() as connection:
+            results = await self.execute(connection, raw_query, params)
+            return results.lastrowid
+
+    async def read_frame(self, raw_query, params=None):
+        async with self.get_engine().connect() as connection:
+            results = await self.execute(connection, raw_query, params)
+            return pd.DataFrame(results.fetchall(), columns=list(results.keys()))
+
+    async def execute(self, connection, raw_query, params=None):
+        statement = as_statement(raw_query)
+        results = await connection.execute(statement, params or {})
+        queries.record(statement, results)
+        return results
+
+    async def stream_query(self, raw_query, params=None, chunk_size=1000):
+        """
+        Async generator yielding lists of at most chunk_size rows, fetched through a server side cursor
+        """
+        async with self.get_engine().connect() as connection:
+            results = await connection.stream(as_statement(raw_query), params or {})
+            async for rows in results.partitions(chunk_size):
+                yield rows
+
+
+class AsyncLocalhost(AsyncDatabase):
+    def __init__(self, db_name):
+        self.username = os.getenv('LOCAL_USER')
+        self.password = os.getenv('LOCAL_PW')
+        if self.username is None:
+            raise EnvironmentError("database credentials are not set in ENV")
+        super().__init__('mysql+aiomysql://{0}:{1}@{2}:3306/{3}'.format(self.username, self.password, '127.0.0.1',
+                                                                         db_name))
+        self.host = '127.0.0.1'
+        self.db_name = db_name
+
+
+class AsyncLocalPG(AsyncDatabase):
+    def __init__(self, db_name):
+        self.username = os.getenv('PG_USER')
+        self.password = os.getenv('PG_PW')
+        if self.username is None:
+            raise EnvironmentError("database credentials are not set in ENV")
+        super().__init__('postgresql+asyncpg://{0}:{1}@{2}:{3}/{4}'.format(self.username, self.password, '127.0.0.1',
+                                                                            5432, db_name))
+        self.host = '127.0.0.1'
+        self.db_name = db_name
+
+
+class AsyncLocalSQLite(AsyncDatabase):
+    """
+    aiosqlite backed AsyncDatabase for local testing, path is a file name or ':memory:'
+    """
+
+    def __init__(self, path=':memory:'):
+        super().__init__('sqlite+aiosqlite:///{0}'.format(path))
+        self.db_name = path
+
+    def engine_options(self):
+        # sqlite uses its own pool classes, which don't take the sizing arguments. An in memory DB only lives as long
+        # as its connection, so every checkout has to share the one connection
+        if self.db_name == ':memory:':
+            return {'echo': False, 'poolclass': StaticPool}
+        return {'echo': False}
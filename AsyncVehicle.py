@@ -0,0 +1,208 @@
+import asyncio
+import json
+
+import pandas as pd
+
+from Cache import database_key, reference_data_cache
+from OpenEvents import EVENT_COLUMNS
+from Queries import queries
+
+
+class AsyncVehicle:
+    """
+    asyncio counterpart of Vehicle for use with an AsyncDatabase. It mirrors Vehicle's public getters (same queries,
+    same return values and the same per instance caching), but every getter is a coroutine.
+    """
+
+    def __init__(self, vehicle_id=None, read_database=None, write_database=None, logger=None):
+        self.active_set_points = None
+        self.active_sensors = None
+        self.open_vehicle_events = None
+        self.vehicle_type = None
+        self.fleet_id = None
+        self.vehicle_id = vehicle_id
+        self.read_database = read_database
+        self.write_database = write_database
+        self.offsets = {}
+        self.set_points = {}
+        self.fleet_name = None
+        self.fleet_vehicle_id = None
+        self.logger = logger
+
+    async def get_vehicle_id(self, unique_id):
+        if self.vehicle_id is None:
+            vehicle_id_result = await self.read_database.run_query(queries['vehicle_id_for_sensor'],
+                                                                   {'unique_id': unique_id})
+            self.vehicle_id = vehicle_id_result[0][0]
+        return self.vehicle_id
+
+    async def get_vehicle_type(self):
+        if self.vehicle_type is None:
+            vehicle_type_result = await self.read_database.run_query(queries['vehicle_type'],
+                                                                     {'vehicle_id': self.vehicle_id})
+            self.vehicle_type = vehicle_type_result[-1][0]
+        return self.vehicle_type
+
+    async def get_fleet_id(self):
+        if not self.fleet_id:
+            fleet_id_result = await self.read_database.run_query(queries['fleet_id'], {'vehicle_id': self.vehicle_id})
+            self.fleet_id = fleet_id_result[0][0]
+        return self.fleet_id
+
+    async def get_fleet_vehicle_id(self):
+        if self.fleet_id and self.fleet_vehicle_id is None:
+            fleet_vehicle_id_result = await self.read_database.run_query(queries['fleet_vehicle_id'],
+                                                                         {'vehicle_id': self.vehicle_id})
+            self.fleet_vehicle_id = fleet_vehicle_id_result[0][0]
+        return self.fleet_vehicle_id
+
+    async def get_fleet_name_for_vehicle(self):
+        if self.fleet_name is None:
+            self.fleet_name = await reference_data_cache.get_or_load_async(
+                self.reference_data_key('fleet_name', self.fleet_id), self.load_fleet_name)
+        return self.fleet_name
+
+    async def load_fleet_name(self):
+        fleet_name_result = await self.read_database.run_query(queries['fleet_name'], {'fleet_id': self.fleet_id})
+        return fleet_name_result[-1][0]
+
+    async def get_sensors_and_setpoints(self, active=False, exclude_pump=True):
+        key = (active, exclude_pump)
+        if key not in self.set_points:
+            name = 'sensors_and_set_points'
+            if active is True:
+                name = 'active_' + name
+            if exclude_pump is True:
+                name = name + '_without_pump'
+            sensors = await self.read_database.run_query(queries[name], {'vehicle_id': self.vehicle_id})
+            self.set_points[key] = pd.DataFrame(sensors, columns=['unique_id', 'set_point'])
+        return self.set_points[key]
+
+    async def get_active_sensors_and_setpoints(self, active=True, exclude_pump=True):
+        set_points = await self.get_sensors_and_setpoints(active, exclude_pump)
+        if active is True and exclude_pump is True:
+            self.active_set_points = set_points
+        return set_points
+
+    async def get_active_sensors(self):
+        if self.active_sensors is None:
+            self.active_sensors = (await self.get_active_sensors_and_setpoints()).unique_id.to_list()
+        return self.active_sensors
+
+    async def get_sensor_pressure_offsets(self, start_of_analysis_date):
+        if start_of_analysis_date not in self.offsets:
+            offsets_result = await self.read_database.run_query(queries['offsets_for_sensors'],
+                                                                {'unique_ids': await self.get_active_sensors(),
+                                                                 'date': start_of_analysis_date})
+            self.offsets[start_of_analysis_date] = pd.DataFrame(offsets_result,
+                                                                columns=['date', 'pressure_offset', 'unique_id'])
+        return self.offsets[start_of_analysis_date]
+
+    async def get_custom_underinflation_thresholds(self, logger):
+        fleet_id = await self.get_fleet_id()
+        key = self.reference_data_key('underinflation', fleet_id)
+        thresholds = await reference_data_cache.get_or_load_async(
+            key, lambda: self.load_custom_underinflation_thresholds(fleet_id, logger))
+        return dict(thresholds)
+
+    async def load_custom_underinflation_thresholds(self, fleet_id, logger):
+        custom_results = await self.read_database.run_query(queries['account_alert_parameters'],
+                                                            {'fleet_id': str(fleet_id)})
+        result = None
+        if len(custom_results) > 0:
+            result = self.find_underinflation_settings(custom_results[0])
+        if result is not None:
+            return result
+        result = await reference_data_cache.get_or_load_async(self.reference_data_key('underinflation', 'GLOBAL'),
+                                                              self.load_global_underinflation_thresholds)
+        if result is None:
+            logger.log_warning("unable to retrieve alert parameters from DB for fleet_id {0}".format(fleet_id))
+            result = {'critical': 0.6, 'major': 0.8, 'minor': 0.85}
+        return result
+
+    async def load_global_underinflation_thresholds(self):
+        global_default = await self.read_database.run_query(queries['global_alert_parameters'])
+        return self.find_underinflation_settings(global_default[0])
+
+    def find_underinflation_settings(self, row):
+        if row is not None:
+            list_of_settings = json.loads(row[0])
+            for setting in list_of_settings:
+                if setting['type'] == 'UNDERINFLATION':
+                    del setting['type']
+                    return setting
+
+    def reference_data_key(self, kind, fleet_id):
+        # same keys as Vehicle.reference_data_key, so sync and async callers share cache entries
+        return kind, database_key(self.read_database), fleet_id
+
+    async def get_open_events(self, unique_id):
+        open_events = await self.read_database.read_frame(queries['open_events_for_sensor'], {'unique_id': unique_id})
+        if open_events.empty:
+            return None
+        return open_events
+
+    async def populate_open_vehicle_events(self):
+        if self.open_vehicle_events is None:
+            # same query as OpenEvents.load_open_vehicle_events, the latest status per event is resolved in SQL
+            open_events = await self.read_database.read_frame(queries['latest_event_statuses_for_vehicles'],
+                                                              {'vehicle_ids': [self.vehicle_id], 'statuses': ['OPEN']})
+            self.open_vehicle_events = open_events[EVENT_COLUMNS[1:]].reset_index(drop=True)
+
+    async def get_open_vehicle_events(self):
+        await self.populate_open_vehicle_events()
+        return self.open_vehicle_events
+
+    async def get_open_events_by_types(self, event_types):
+        await self.populate_open_vehicle_events()
+        filtered_open_events = self.open_vehicle_events[self.open_vehicle_events.event_type.isin(event_types)]
+        if filtered_open_events.empty:
+            return None
+        return filtered_open_events
+
+    async def get_open_ui_events(self):
+        return await self.get_open_events_by_types(["UI"])
+
+    async def get_open_leak_events(self):
+        return await self.get_open_events_by_types(["LEAK"])
+
+    async def get_open_ui_leak_events(self):
+        return await self.get_open_events_by_types(["UI_LEAK"])
+
+    async def get_open_leak_and_ui_leak_events(self):
+        return await self.get_open_events_by_types(["UI_LEAK", "LEAK"])
+
+    async def get_event_id_timestamp(self, event_id):
+        event_timestamp = await self.read_database.run_query(queries['event_timestamp'], {'event_id': event_id})
+        if event_timestamp:
+            return event_timestamp[0].pressure_date
+        return None
+
+    async def get_meta_data_id(self, unique_id):
+        if unique_id:
+            meta_data_id_result = await self.read_database.run_query(queries['meta_data_id'],
+                                                                     {'vehicle_id': self.vehicle_id,
+                                                                      'unique_id': unique_id})
+            return meta_data_id_result[0][0]
+
+    async def set_all_meta_data_to_inactive(self):
+        await self.write_database.run_statement(queries['deactivate_meta_data'], {'vehicle_id': self.vehicle_id})
+        self.set_points = {}
+        self.active_set_points = None
+        self.active_sensors = None
+        self.open_vehicle_events = None
+        self.offsets = {}
+
+
+async def gather_vehicles(fn, vehicle_ids, read_database, write_database=None, concurrency=50, logger=None):
+    """
+    Awaits fn(vehicle) for every vehicle id with at most concurrency coroutines running at once.
+    :return: list of results in the order of vehicle_ids, exceptions are returned in place of the failed results
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(vehicle_id):
+        async with semaphore:
+            return await fn(AsyncVehicle(vehicle_id, read_database, write_database, logger))
+
+    return await asyncio.gather(*(run_one(vehicle_id) for vehicle_id in vehicle_ids), return_exceptions=True)
@@ -0,0 +1,118 @@
+import threading
+
+from Queries import as_statement, queries
+
+
+class BulkWriter:
+    """
+    Unit of work for write paths that would otherwise autocommit one statement per vehicle. Statements are queued and
+    written in transactions of at most batch_size rows:
+        - add_key(statement, 'vehicle_ids', vehicle_id) collects keys for a set based statement with an expanding
+          parameter, e.g. "UPDATE meta_data SET active = 0 WHERE vehicle_id IN :vehicle_ids", and runs it once per batch
+        - add(statement, params) collects parameter sets and runs them with executemany
+
+    A group is flushed as soon as it holds batch_size rows, the rest on flush() or when the with block exits. If the
+    block raises, the rows not flushed yet are discarded, batches flushed before stay committed. The on_write callback
+    of a row runs once the batch holding it is committed, e.g. to drop caches that were read while it was queued.
+
+    Example:
+        with write_database.bulk_writer(batch_size=5000) as writer:
+            for vehicle in vehicles:
+                vehicle.set_all_meta_data_to_inactive(writer=writer)
+        writer.results  # [{'query': 'deactivate_meta_data_for_vehicles', 'rows': 5000, 'affected': 49873}, ...]
+    """
+
+    def __init__(self, database, batch_size=1000):
+        self.database = database
+        self.batch_size = batch_size
+        self.groups = {}
+        self.results = []
+        self.lock = threading.Lock()
+
+    def add_key(self, statement, key_parameter, key, params=None, on_write=None):
+        """
+        :param key_parameter: name of the expanding parameter that receives the batch of keys
+        :param params: the other parameters of the statement, keys are only batched with keys of equal params
+        :param on_write: function without arguments called after the key is written
+        """
+        params = params or {}
+        group_key = ('keys', self.statement_key(statement), key_parameter, tuple(sorted(params.items())))
+        self.queue(group_key, as_statement(statement), key, on_write, key_parameter, params)
+
+    def add(self, statement, params, on_write=None):
+        self.queue(('many', self.statement_key(statement)), as_statement(statement), params, on_write)
+
+    def statement_key(self, statement):
+        # raw SQL strings are wrapped in a new text() per call, so they are grouped by their SQL
+        return statement if isinstance(statement, str) else id(statement)
+
+    def queue(self, group_key, statement, row, on_write=None, key_parameter=None, params=None):
+        with self.lock:
+            group = self.groups.get(group_key)
+            if group is None:
+                group = self.groups[group_key] = {'statement': statement, 'key_parameter': key_parameter,
+                                                  'params': params, 'rows': [], 'keys': set(), 'on_write': []}
+            if on_write is not None:
+                group['on_write'].append(on_write)
+            if key_parameter is None:
+                group['rows'].append(row)
+            elif row not in group['keys']:
+                group['keys'].add(row)
+                group['rows'].append(row)
+            if len(group['rows']) < self.batch_size:
+                return
+            rows, group['rows'], group['keys'] = group['rows'], [], set()
+            callbacks, group['on_write'] = group['on_write'], []
+        self.write(group, rows)
+        self.run_callbacks(callbacks)
+
+    @property
+    def pending(self):
+        with self.lock:
+            return sum(len(group['rows']) for group in self.groups.values())
+
+    def flush(self):
+        """
+        Writes every queued row
+        :return: list of per batch results, dicts with the query name, the rows queued and the rows affected
+        """
+        with self.lock:
+            batches = [(group, group['rows'], group['on_write']) for group in self.groups.values() if group['rows']]
+            self.groups = {}
+        flushed = []
+        for group, rows, callbacks in batches:
+            for start in range(0, len(rows), self.batch_size):
+                flushed.append(self.write(group, rows[start:start + self.batch_size]))
+            self.run_callbacks(callbacks)
+        return flushed
+
+    def run_callbacks(self, callbacks):
+        for callback in callbacks:
+            callback()
+
+    def discard(self):
+        with self.lock:
+            self.groups = {}
+
+    def write(self, group, rows):
+        statement = group['statement']
+        if group['key_parameter'] is None:
+            params = rows
+        else:
+            params = dict(group['params'], **{group['key_parameter']: rows})
+        with self.database.pooled_connection() as connection, connection.begin():
+            result = self.database.execute(statement, params, connection)
+        batch = {'query': queries.names.get(id(statement), str(statement)), 'rows': len(rows),
+                 'affected': result.rowcount}
+        with self.lock:
+            self.results.append(batch)
+        return batch
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.discard()
@@ -0,0 +1,219 @@
+import functools
+import inspect
+import itertools
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from sqlalchemy.engine import make_url
+
+
+def cached(*key_arguments, attributes=(), normalize=None):
+    """
+    Memoizes a method per instance in instance.method_cache, keyed on the method name and the values of
+    key_arguments (every argument when none are given), with defaults applied so f() and f(active=True) share an entry.
+    :param key_arguments: names of the arguments that make up the cache key
+    :param attributes: instance attributes derived from the result, reset to None when the method is invalidated
+    :param normalize: dict of argument name to a function applied to its value in the key, so equal values of different
+    types (e.g. '2021-02-01' and date(2021, 2, 1)) share an entry
+    """
+    normalize = normalize or {}
+
+    def decorator(method):
+        signature = inspect.signature(method)
+        names = key_arguments or tuple(signature.parameters)[1:]
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            key = _cache_key(method.__name__, signature, names, self, args, kwargs, normalize)
+            if key in self.method_cache:
+                return self.method_cache[key]
+            result = method(self, *args, **kwargs)
+            self.method_cache[key] = result
+            return result
+
+        wrapper.signature = signature
+        wrapper.key_arguments = names
+        wrapper.normalize = normalize
+        wrapper.cached_attributes = attributes
+        return wrapper
+    return decorator
+
+
+def invalidates(*method_names):
+    """
+    Marks a write method: once it returns, the cached results of method_names on the same instance are dropped.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            result = method(self, *args, **kwargs)
+            invalidate(self, *method_names)
+            return result
+        return wrapper
+    return decorator
+
+
+def invalidate(instance, *method_names):
+    """
+    Drops cached results of the given @cached methods (all of them when none are given) and resets the attributes
+    derived from them.
+    """
+    if not method_names:
+        method_names = [name for name, _ in _cached_methods(type(instance))]
+    for name in method_names:
+        method = getattr(type(instance), name)
+        for key in [key for key in instance.method_cache if key[0] == name]:
+            del instance.method_cache[key]
+        for attribute in method.cached_attributes:
+            setattr(instance, attribute, None)
+
+
+def prime(instance, method_name, value, **kwargs):
+    """
+    Stores value as the result of instance.method_name(**kwargs) without running it, e.g. after a batch load.
+    """
+    method = getattr(type(instance), method_name)
+    key = _cache_key(method_name, method.signature, method.key_arguments, instance, (), kwargs, method.normalize)
+    instance.method_cache[key] = value
+
+
+def _cached_methods(cls):
+    return [(name, member) for name, member in inspect.getmembers(cls) if hasattr(member, 'cached_attributes')]
+
+
+def _cache_key(name, signature, key_arguments, instance, args, kwargs, normalize):
+    bound = signature.bind_partial(instance, *args, **kwargs)
+    bound.apply_defaults()
+    values = []
+    for argument in key_arguments:
+        value = bound.arguments.get(argument)
+        if argument in normalize and value is not None:
+            value = normalize[argument](value)
+        values.append(_hashable(value))
+    return (name,) + tuple(values)
+
+
+def _hashable(value):
+    if isinstance(value, list):
+        return tuple(value)
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+
+class ReferenceDataCache:
+    """
+    Thread safe, size bounded LRU cache with TTL expiry for reference data shared by many vehicles (fleet thresholds,
+    fleet names). Keys are tuples whose last element is the fleet_id, so invalidate(fleet_id) can drop one fleet.
+    """
+
+    def __init__(self, max_size=1024, ttl_seconds=300, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_load(self, key, loader):
+        """
+        Returns the cached value for key, calling loader() to fetch it on a miss or after the entry expired
+        """
+        found, value = self.lookup(key)
+        if found:
+            return value
+        # loading happens outside the lock so one slow query does not block lookups for other fleets
+        value = loader()
+        self.put(key, value)
+        return value
+
+    async def get_or_load_async(self, key, loader):
+        """
+        get_or_load for coroutine loaders, e.g. from AsyncVehicle
+        """
+        found, value = self.lookup(key)
+        if found:
+            return value
+        value = await loader()
+        self.put(key, value)
+        return value
+
+    def lookup(self, key):
+        """
+        Returns (True, value) for a live entry and (False, None) on a miss, counting either
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, fleet_id=None):
+        """
+        Drops every entry for fleet_id, or the whole cache when fleet_id is None
+        """
+        with self._lock:
+            if fleet_id is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[-1] == fleet_id]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+reference_data_cache = ReferenceDataCache()
+
+# tokens of the in memory DBs' engines, unlike id() never handed to another engine once one is garbage collected
+_engine_tokens = weakref.WeakKeyDictionary()
+_engine_token_counter = itertools.count(1)
+_engine_tokens_lock = threading.Lock()
+
+
+def database_key(database):
+    """
+    Identifies the DB behind database in process wide caches: its URL without driver and password, so sync and async
+    connections to one DB share entries, plus a token of the engine for an in memory SQLite DB, which only exists in
+    its engine
+    """
+    engine = getattr(database, 'engine', None)
+    if engine is not None:
+        url = engine.url
+    elif getattr(database, 'dsn', None) is not None:
+        # AsyncDatabase creates its engine on first use
+        url = make_url(database.dsn)
+    else:
+        # not connected, so nothing can be loaded from it yet
+        return getattr(database, 'host', None), getattr(database, 'db_name', None)
+    key = url.set(drivername=url.get_backend_name()).render_as_string(hide_password=True)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return key, engine_token(engine if engine is not None else database)
+    return key
+
+
+def engine_token(engine):
+    with _engine_tokens_lock:
+        token = _engine_tokens.get(engine)
+        if token is None:
+            token = _engine_tokens[engine] = next(_engine_token_counter)
+    return token
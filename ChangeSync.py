@@ -0,0 +1,165 @@
+import threading
+import time
+from collections import namedtuple
+
+from Queries import queries
+from VehicleBatch import VehicleBatch
+
+Change = namedtuple('Change', ['kind', 'vehicle_id', 'rows'])
+
+
+class ChangeSync:
+    """
+    Keeps the cached state of a fleet of Vehicles current with delta queries instead of full reloads. Every poll reads
+    only the rows above a high water mark per table:
+        - meta_data (id): vehicles with new sensor rows get their sensors, offsets and open events reloaded. A config
+          reprocessing deactivates the old rows and inserts new ones, so it always shows up as new ids; deactivations
+          written through Vehicle.set_all_meta_data_to_inactive invalidate the caches themselves.
+        - event_status (event_status_id): vehicles with a sensor whose event got a new status get their open events
+          reloaded.
+        - leak_detection_pressure_offsets (id): new offsets of start_of_analysis_date are appended to the cached
+          offsets of the vehicle owning the sensor, as the offsets query would return them.
+    Reloads run set based for all changed vehicles at once, see VehicleBatch. Every applied change is passed to the
+    subscribed callbacks as Change(kind, vehicle_id, rows) with kind 'sensors', 'open_events' or 'offsets'.
+
+    Example:
+        batch = VehicleBatch(read_database).load(vehicle_ids, start_of_analysis_date, open_events=True)
+        sync = ChangeSync(read_database, batch, start_of_analysis_date)
+        sync.subscribe(lambda change: print(change))
+        sync.start()
+        sync.poll()  # every few minutes, or sync.run(interval_seconds=60) in a thread
+    """
+
+    def __init__(self, read_database, vehicles, start_of_analysis_date=None):
+        """
+        :param vehicles: VehicleBatch or dict of vehicle_id to Vehicle, updated in place
+        :param start_of_analysis_date: date of the cached offsets, offsets are not synced when None
+        """
+        self.read_database = read_database
+        self.vehicles = vehicles.vehicles if isinstance(vehicles, VehicleBatch) else vehicles
+        self.start_of_analysis_date = start_of_analysis_date
+        self.high_water_marks = {}
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    def subscribe(self, callback):
+        self.callbacks.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        self.callbacks.remove(callback)
+
+    def start(self):
+        """
+        Takes the current high water marks, so only changes after the vehicles were loaded are applied
+        """
+        with self.lock:
+            for table in ('meta_data', 'event_status', 'pressure_offset'):
+                self.high_water_marks[table] = self.newest(table)
+
+    def newest(self, table):
+        return self.read_database.run_query(queries['max_{0}_id'.format(table)])[0][0] or 0
+
+    def poll(self):
+        """
+        Applies the rows written since the last poll
+        :return: list of the Changes applied
+        """
+        with self.lock:
+            if not self.high_water_marks:
+                raise RuntimeError("call start() before poll()")
+            changes = []
+            sensor_vehicle_ids = self.poll_meta_data()
+            if sensor_vehicle_ids:
+                self.reload(sensor_vehicle_ids)
+                changes.extend(Change('sensors', vehicle_id, None) for vehicle_id in sensor_vehicle_ids)
+
+            event_vehicle_ids = [vehicle_id for vehicle_id in self.poll_event_status()
+                                 if vehicle_id not in sensor_vehicle_ids]
+            if event_vehicle_ids:
+                self.batch_of(event_vehicle_ids).load_open_events()
+                changes.extend(Change('open_events', vehicle_id, None) for vehicle_id in event_vehicle_ids)
+
+            for vehicle_id, rows in self.poll_pressure_offsets(sensor_vehicle_ids).items():
+                self.append_offsets(self.vehicles[vehicle_id], rows)
+                changes.append(Change('offsets', vehicle_id, len(rows)))
+
+        for change in changes:
+            for callback in list(self.callbacks):
+                callback(change)
+        return changes
+
+    def run(self, interval_seconds=60, stop_event=None):
+        """
+        Polls every interval_seconds until stop_event is set
+        """
+        stop_event = stop_event or threading.Event()
+        if not self.high_water_marks:
+            self.start()
+        while not stop_event.is_set():
+            started_at = time.monotonic()
+            self.poll()
+            stop_event.wait(max(0.0, interval_seconds - (time.monotonic() - started_at)))
+
+    def delta(self, table, query_name, params=None):
+        """
+        Rows of query_name between the table's high water mark and its current newest id, advancing the mark
+        """
+        since = self.high_water_marks[table]
+        until = self.newest(table)
+        if until <= since:
+            return []
+        rows = self.read_database.run_query(queries[query_name], dict(params or {}, since=since, until=until))
+        self.high_water_marks[table] = until
+        return rows
+
+    def poll_meta_data(self):
+        return [row.vehicle_id for row in self.delta('meta_data', 'meta_data_changes')
+                if row.vehicle_id in self.vehicles]
+
+    def poll_event_status(self):
+        vehicle_by_sensor = self.vehicle_by_sensor()
+        vehicle_ids = {vehicle_by_sensor[row.unique_id] for row in self.delta('event_status', 'event_status_changes')
+                       if row.unique_id in vehicle_by_sensor}
+        return sorted(vehicle_ids)
+
+    def poll_pressure_offsets(self, reloaded_vehicle_ids):
+        if self.start_of_analysis_date is None:
+            return {}
+        vehicle_by_sensor = self.vehicle_by_sensor()
+        rows_by_vehicle = {}
+        for row in self.delta('pressure_offset', 'pressure_offset_changes', {'date': self.start_of_analysis_date}):
+            vehicle_id = vehicle_by_sensor.get(row.unique_id)
+            # reloaded vehicles already have these rows
+            if vehicle_id is not None and vehicle_id not in reloaded_vehicle_ids:
+                rows_by_vehicle.setdefault(vehicle_id, []).append((row.date, row.pressure_offset, row.unique_id))
+        return rows_by_vehicle
+
+    def vehicle_by_sensor(self):
+        return {unique_id: vehicle_id for vehicle_id, vehicle in self.vehicles.items()
+                for unique_id in (vehicle.active_sensors or ())}
+
+    def batch_of(self, vehicle_ids):
+        """
+        VehicleBatch over the already loaded Vehicle objects of vehicle_ids, so its loaders update them in place
+        """
+        batch = VehicleBatch(self.read_database)
+        batch.vehicles = {vehicle_id: self.vehicles[vehicle_id] for vehicle_id in vehicle_ids}
+        return batch
+
+    def reload(self, vehicle_ids):
+        batch = self.batch_of(vehicle_ids)
+        for vehicle in batch:
+            vehicle.invalidate('load_sensors_and_set_points', 'get_sensor_pressure_offsets', 'get_meta_data_id',
+                               'get_sensor_wheel_position', 'get_sensor_index')
+        batch.load_active_sensors_and_setpoints(vehicle_ids)
+        if self.start_of_analysis_date is not None:
+            batch.load_sensor_pressure_offsets(self.start_of_analysis_date)
+        batch.load_open_events()
+
+    def append_offsets(self, vehicle, rows):
+        offsets = vehicle.offsets
+        if offsets is None:
+            offsets = vehicle.get_sensor_pressure_offsets(self.start_of_analysis_date)
+        cached_rows = [tuple(row) for row in offsets.itertuples(index=False)]
+        VehicleBatch(self.read_database).set_offsets(vehicle, cached_rows + rows, self.start_of_analysis_date)
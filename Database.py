@@ -1,39 +1,269 @@
+import copy
+import glob
+import hashlib
 import os
+import pickle
 import re
+import sqlite3
+import stat
+import tempfile
+import threading
+from contextlib import contextmanager
 
+import pandas as pd
 import sqlalchemy
-from sqlalchemy import create_engine
+from sqlalchemy import MetaData, create_engine, event
 from sqlalchemy.ext.automap import automap_base
 from sqlalchemy.orm import Session
-from sqlalchemy.exc import IntegrityError, InternalError, OperationalError
+from sqlalchemy.exc import InternalError, OperationalError
+from sqlalchemy.pool import StaticPool
+
+from BulkWriter import BulkWriter
+from Queries import as_statement, queries
+from SqlLoader import SqlScriptLoader, translate_mysql_to_sqlite
+
+
+# process wide engine registry, so every Database pointing at the same DSN shares one engine and its connection pool
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_shared_engine(dsn, **engine_options):
+    """
+    Returns the engine registered for dsn and engine_options, creating it on first use
+    """
+    key = (dsn, tuple(sorted(engine_options.items())))
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = create_engine(dsn, **engine_options)
+            _engines[key] = engine
+    return engine
+
+
+# automapped bases by (DSN, tables, schema fingerprint), shared by every Database in the process
+_reflected_bases = {}
+_reflection_lock = threading.Lock()
+
+
+def dispose_shared_engines():
+    """
+    Closes the pooled connections of every registered engine and empties the registry, e.g. after a fork
+    """
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+def private_directory(path):
+    """
+    Creates path with mode 0o700 if it is missing
+    :return: whether path is a directory owned by the current user that nobody else can write to
+    """
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+    except OSError:
+        return False
+    return owned_and_private(path)
+
+
+def owned_and_private(path):
+    if not hasattr(os, 'getuid'):
+        return True  # Windows has no uids, its temp dir is per user
+    status = os.lstat(path)
+    return status.st_uid == os.getuid() and not stat.S_ISLNK(status.st_mode) and \
+        not status.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
 
 
 class Database:
+    # connection pool settings used by create_engine_for, can be overridden per instance before create_connection
+    pool_size = 5
+    max_overflow = 10
+    pool_recycle = 3600
+    pool_pre_ping = True
+    # set on the copies made by worker_copy, which share the engine but must not dispose it
+    is_worker_copy = False
+    session = None
+
     def create_connection(self):
         if self.username is None:
             raise EnvironmentError("database credentials are not set in ENV")
-        self.engine = create_engine('mysql+pymysql://{0}:{1}@{2}:3306/{3}'.format(self.username, self.password,
-                                                                                  self.host, self.db_name), echo=False)
+        self.engine = self.create_engine_for('mysql+pymysql://{0}:{1}@{2}:3306/{3}'.format(self.username, self.password,
+                                                                                           self.host, self.db_name))
+        self.close_connection()
         self.connection = self.engine.connect()
         self.session = Session(self.engine)
 
+    def create_engine_for(self, dsn, **engine_options):
+        return get_shared_engine(dsn, echo=False, pool_size=self.pool_size, max_overflow=self.max_overflow,
+                                 pool_recycle=self.pool_recycle, pool_pre_ping=self.pool_pre_ping, **engine_options)
+
+    def ensure_connection(self):
+        """
+        Creates the connection only if there is no usable one yet, unlike create_connection which always reconnects
+        """
+        if getattr(self, 'connection', None) is None or self.connection.closed:
+            self.create_connection()
+
+    def close_connection(self):
+        if getattr(self, 'connection', None) is not None:
+            self.connection.close()
+
+    def checkout_connection(self):
+        """
+        Checks out a separate connection from the shared pool, e.g. for a worker thread. The caller has to close it.
+        """
+        return self.engine.connect()
+
+    def worker_copy(self):
+        """
+        Returns a shallow copy of this Database sharing its engine, but with its own pooled connection, so it can be
+        used from another thread without sharing cursors. Release it with close_connection.
+        """
+        worker = copy.copy(self)
+        worker.connection = self.checkout_connection()
+        worker.session = None
+        worker.is_worker_copy = True
+        return worker
+
+    @contextmanager
+    def pooled_connection(self):
+        connection = self.checkout_connection()
+        try:
+            yield connection
+        finally:
+            connection.close()
+
     def get_engine(self):
         return self.engine
 
-    def run_query(self, raw_query):
-        results = self.connection.execute(sqlalchemy.text(raw_query))
+    def run_query(self, raw_query, params=None):
+        """
+        :param raw_query: SQL string, or a statement from the Queries registry
+        :param params: bound parameter values
+        """
+        results = self.execute(raw_query, params)
         return results.fetchall()
 
-    def run_statement(self, raw_query):
-        results = self.connection.execute(sqlalchemy.text(raw_query))
+    def run_statement(self, raw_query, params=None):
+        results = self.execute(raw_query, params)
         return results.lastrowid
 
-    def create_base_with_session(self):
-        base = automap_base()
-        base.prepare(self.engine, reflect=True)
+    def read_frame(self, raw_query, params=None):
+        results = self.execute(raw_query, params)
+        return pd.DataFrame.from_records(results.fetchall(), columns=list(results.keys()), coerce_float=True)
+
+    def execute(self, raw_query, params=None, connection=None):
+        statement = as_statement(raw_query)
+        results = (connection or self.connection).execute(statement, params or {})
+        queries.record(statement, results)
+        return results
+
+    def stream_query(self, raw_query, params=None, chunk_size=1000):
+        """
+        Generator yielding lists of at most chunk_size rows, fetched through a server side cursor so the result set is
+        never fully in memory. The query runs on its own pooled connection, because an unbuffered MySQL cursor blocks
+        its connection until it is exhausted; closing the generator early releases it.
+        """
+        with self.pooled_connection() as connection:
+            results = self.execute(raw_query, params, connection.execution_options(stream_results=True))
+            for rows in results.partitions(chunk_size):
+                yield rows
+
+    def read_frame_chunks(self, raw_query, params=None, chunk_size=10000):
+        """
+        Same as stream_query, but yields a DataFrame per chunk
+        """
+        with self.pooled_connection() as connection:
+            results = self.execute(raw_query, params, connection.execution_options(stream_results=True))
+            columns = list(results.keys())
+            for rows in results.partitions(chunk_size):
+                yield pd.DataFrame(rows, columns=columns)
+
+    def bulk_writer(self, batch_size=1000):
+        """
+        BulkWriter batching statements on this database into transactions of at most batch_size rows
+        """
+        return BulkWriter(self, batch_size)
+
+    def profile(self, classes=None):
+        """
+        Starts an Instrumentation.Profiler on this database's engine (and the public methods of classes, Vehicle by
+        default). Use it as a context manager, the hooks are removed on exit.
+        """
+        from Instrumentation import Profiler
+        return Profiler().enabled(self, classes=classes)
+
+    def create_base_with_session(self, tables=None, cache_dir=None):
+        """
+        Automaps the DB's tables into ORM classes. The reflected schema is cached in the process and pickled to
+        cache_dir (SCHEMA_CACHE_DIR or a per user directory in the temp dir), keyed by DSN, requested tables and a
+        fingerprint of the schema, so only the first worker after a schema change pays for the reflection. Loading a
+        pickle runs code, so the file cache is only used in a directory nobody but the current user can write to.
+        :param tables: names of the tables to map (tables they reference by foreign key come along), all when None
+        :return: automap base, Session
+        """
+        tables = tuple(sorted(tables)) if tables is not None else None
+        key = (self.engine.url.render_as_string(hide_password=True), tables, self.schema_fingerprint())
+        with _reflection_lock:
+            base = _reflected_bases.get(key)
+            if base is None:
+                base = automap_base(metadata=self.reflect_metadata(key, cache_dir))
+                base.prepare()
+                _reflected_bases[key] = base
         self.session = Session(self.engine)
         return base, self.session
 
+    def reflect_metadata(self, key, cache_dir=None):
+        dsn, tables, fingerprint = key
+        cache_dir = cache_dir or os.getenv('SCHEMA_CACHE_DIR') or os.path.join(
+            tempfile.gettempdir(), 'schema_cache-{0}'.format(os.getuid() if hasattr(os, 'getuid') else 'user'))
+        cache_path = os.path.join(cache_dir, hashlib.sha256(repr(key).encode()).hexdigest() + '.pickle')
+        trusted = private_directory(cache_dir)
+        if trusted and os.path.exists(cache_path) and owned_and_private(cache_path):
+            try:
+                with open(cache_path, 'rb') as cache_file:
+                    return pickle.load(cache_file)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass  # a partly written or stale cache file, reflect again
+
+        metadata = MetaData()
+        metadata.reflect(self.engine, only=list(tables) if tables is not None else None)
+        if not trusted:
+            return metadata
+        # written under a temporary name and renamed, so concurrent workers never read a partial file
+        building = '{0}.{1}.tmp'.format(cache_path, os.getpid())
+        with os.fdopen(os.open(building, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as cache_file:
+            pickle.dump(metadata, cache_file)
+        os.replace(building, cache_path)
+        return metadata
+
+    def schema_fingerprint(self):
+        """
+        Hash of the DB's column and key definitions, one cheap query instead of reflecting every table
+        """
+        dialect = self.engine.dialect.name
+        if dialect == 'sqlite':
+            query = "SELECT type, name, sql FROM sqlite_master ORDER BY type, name"
+        elif dialect == 'postgresql':
+            query = "SELECT c.table_name, c.column_name, c.data_type, c.is_nullable, k.constraint_name " \
+                    "FROM information_schema.columns c LEFT JOIN information_schema.key_column_usage k " \
+                    "ON k.table_schema = c.table_schema AND k.table_name = c.table_name " \
+                    "AND k.column_name = c.column_name WHERE c.table_schema = current_schema() " \
+                    "ORDER BY c.table_name, c.ordinal_position, k.constraint_name"
+        else:
+            query = "SELECT c.table_name, c.column_name, c.column_type, c.is_nullable, c.column_key, " \
+                    "k.referenced_table_name, k.referenced_column_name " \
+                    "FROM information_schema.columns c LEFT JOIN information_schema.key_column_usage k " \
+                    "ON k.table_schema = c.table_schema AND k.table_name = c.table_name " \
+                    "AND k.column_name = c.column_name WHERE c.table_schema = DATABASE() " \
+                    "ORDER BY c.table_name, c.ordinal_position, k.constraint_name"
+        digest = hashlib.sha256()
+        for row in self.run_query(query):
+            digest.update(repr(tuple(row)).encode())
+        return digest.hexdigest()
+
 class Localhost(Database):
     def __init__(self, db_name):
 
@@ -53,30 +283,34 @@ class Localhost(Database):
     def cleanUpDB(self):
         if self.session:
             self.session.close()
-        self.connection.close()
-        self.engine.dispose()
+        # only this instance's connection: the engine and its pool are shared by every instance for the same DSN and
+        # are closed by dispose_shared_engines
+        self.close_connection()
 
     def create_connection(self):
         if self.username is None:
             raise EnvironmentError("database credentials are not set in ENV")
 
+        self.close_connection()
         try:
-            self.engine = create_engine('mysql+pymysql://{0}:{1}@{2}:3306/{3}'.format(self.username, self.password,
-                                                                                      self.host, self.db_name),
-                                        echo=False)
+            self.engine = self.create_engine_for('mysql+pymysql://{0}:{1}@{2}:3306/{3}'.format(self.username,
+                                                                                               self.password,
+                                                                                               self.host, self.db_name))
             self.connection = self.engine.connect()
         except (InternalError, OperationalError) as e:
             if re.search('Unknown database', str(e)):
-                self.engine = create_engine('mysql+pymysql://{0}:{1}@{2}:3306/'.format(self.username, self.password,
-                                                                                       self.host), echo=False)
+                self.engine = self.create_engine_for('mysql+pymysql://{0}:{1}@{2}:3306/'.format(self.username,
+                                                                                                self.password,
+                                                                                                self.host))
                 self.connection = self.engine.connect()
             else:
                 raise e
 
     def refresh_database(self):
         result = self.connection.execute("SHOW DATABASES;")
-        existing_databases = result.fetchall()
-        if (str(self.db_name)) in str(existing_databases):
+        existing_databases = [row[0] for row in result.fetchall()]
+        # exact match, so snapshots named <db_name>_snap_<hash> don't count as db_name
+        if self.db_name in existing_databases:
             self.connection.execute("DROP DATABASE {}".format(self.db_name))
         self.connection.execute("CREATE DATABASE {};".format(self.db_name))
         self.connection.execute("USE {};".format(self.db_name))
@@ -84,35 +318,119 @@ class Localhost(Database):
     # TODO make this contextual based on caller and abstract
 
     def populate_db(self, sql_data_file_path='../common/_database_setup/vehicle_and_fleet_meta_data.sql',
-                    disable_foreign_keys=False):
-        fd = open(sql_data_file_path, 'r')
-        sql_file = fd.read()
-        fd.close()
-
+                    disable_foreign_keys=False, batch_size=1000):
+        """
+        Streams the statements of a .sql file into the DB, batching INSERTs into multi row statements and transactions
+        :return: SqlLoader.LoadReport with row counts, rows/sec and the statements that failed on an IntegrityError
+        """
         # disable foreign keys
         if disable_foreign_keys is True:
             remove_foreign_key_constraints = 'SET FOREIGN_KEY_CHECKS = 0;'
             self.connection.execute(remove_foreign_key_constraints)
 
-        sql_commands = sql_file.split(";")[:-1]
-        for command in sql_commands:
-            try:
-                self.connection.execute(command)
-            except IntegrityError as err:
-                print("attempting to execute {0} failed with {1}".format(command, err))
+        try:
+            report = self.sql_loader(batch_size).load(sql_data_file_path)
+        finally:
+            # re-enable foreign keys once data is inserted.
+            if disable_foreign_keys is True:
+                remove_foreign_key_constraints = 'SET FOREIGN_KEY_CHECKS =1;'
+                self.connection.execute(remove_foreign_key_constraints)
+        return report
 
-        # re-enable foreign keys once data is inserted.
-        if disable_foreign_keys is True:
-            remove_foreign_key_constraints = 'SET FOREIGN_KEY_CHECKS =1;'
-            self.connection.execute(remove_foreign_key_constraints)
+    def sql_loader(self, batch_size=1000):
+        return SqlScriptLoader(self.connection, batch_size=batch_size)
+
+    def create_schema(self, tables_file_path):
+        """
+        Drops and recreates the DB, then runs the CREATE statements in tables_file_path
+        """
+        self.refresh_database()
+        return self.sql_loader().load(tables_file_path)
 
     def setupDb(self, sql_data_file_path=None, tables_file_path='../_database_setup/grace_production_schema.sql',
-                disable_foreign_keys=False):
+                disable_foreign_keys=False, use_snapshot=False):
+        """
+        :param use_snapshot: build the populated DB once as a snapshot and clone it on later calls, instead of running
+        the schema and data files every time. Snapshots are keyed by the paths of both files and a hash of their
+        contents, so editing either of them rebuilds the snapshot and drops the outdated one of the same files.
+        """
         self.create_connection()
+        if use_snapshot:
+            self.restore_snapshot(sql_data_file_path, tables_file_path, disable_foreign_keys)
+            return
         self.create_schema(tables_file_path)
         if sql_data_file_path is not None:
             self.populate_db(sql_data_file_path, disable_foreign_keys)
 
+    def snapshot_name(self, sql_data_file_path, tables_file_path, disable_foreign_keys):
+        """
+        <db_name>_snap_<source>_<fingerprint>: source identifies the files and options, fingerprint their contents
+        """
+        paths = (tables_file_path, sql_data_file_path)
+        source = hashlib.sha256(repr((disable_foreign_keys, [path and os.path.realpath(path) for path in paths]))
+                                .encode())
+        digest = hashlib.sha256(str(disable_foreign_keys).encode())
+        for path in paths:
+            if path is not None:
+                with open(path, 'rb') as sql_file:
+                    for block in iter(lambda: sql_file.read(1024 * 1024), b''):
+                        digest.update(block)
+        return '{0}_snap_{1}_{2}'.format(self.db_name, source.hexdigest()[:8], digest.hexdigest()[:12])
+
+    def stale_snapshot_pattern(self, snapshot_name):
+        """
+        LIKE pattern of the snapshots of the same source as snapshot_name, whatever their fingerprint
+        """
+        return snapshot_name[:snapshot_name.rindex('_') + 1].replace('_', '\\_') + '%'
+
+    def restore_snapshot(self, sql_data_file_path, tables_file_path, disable_foreign_keys=False):
+        snapshot_name = self.snapshot_name(sql_data_file_path, tables_file_path, disable_foreign_keys)
+        if not self.snapshot_exists(snapshot_name):
+            self.build_snapshot(snapshot_name, sql_data_file_path, tables_file_path, disable_foreign_keys)
+        self.clone_snapshot(snapshot_name)
+
+    def build_snapshot(self, snapshot_name, sql_data_file_path, tables_file_path, disable_foreign_keys):
+        self.drop_stale_snapshots(snapshot_name)
+        snapshot = type(self)(snapshot_name)
+        snapshot.setupDb(sql_data_file_path, tables_file_path, disable_foreign_keys)
+        # written last, so a snapshot whose build was interrupted is never cloned
+        snapshot.run_statement("CREATE TABLE _snapshot_complete (id INT)")
+        snapshot.cleanUpDB()
+
+    def snapshot_exists(self, snapshot_name):
+        result = self.connection.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = '{0}' "
+                                         "AND table_name = '_snapshot_complete'".format(snapshot_name))
+        return result.first() is not None
+
+    def drop_stale_snapshots(self, snapshot_name):
+        """
+        Drops the snapshots built from the same files as snapshot_name before they changed, other files' snapshots of
+        the same db_name stay
+        """
+        stale = self.connection.execute("SHOW DATABASES LIKE '{0}'".format(self.stale_snapshot_pattern(snapshot_name)))
+        for (database_name,) in stale.fetchall():
+            if database_name != snapshot_name:
+                self.connection.execute("DROP DATABASE {0}".format(database_name))
+
+    def clone_snapshot(self, snapshot_name):
+        """
+        MySQL has no CREATE DATABASE ... TEMPLATE, so the tables are recreated from SHOW CREATE TABLE (which keeps
+        indexes and foreign keys) and filled with INSERT ... SELECT, all on the server.
+        """
+        self.refresh_database()
+        tables = self.connection.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = '{0}' "
+                                         "AND table_type = 'BASE TABLE' AND table_name != '_snapshot_complete'"
+                                         .format(snapshot_name)).fetchall()
+        self.connection.execute('SET FOREIGN_KEY_CHECKS = 0;')
+        try:
+            for (table_name,) in tables:
+                create_table = self.connection.execute("SHOW CREATE TABLE {0}.{1}".format(snapshot_name,
+                                                                                          table_name)).first()[1]
+                self.connection.execute(create_table)
+                self.connection.execute("INSERT INTO {0} SELECT * FROM {1}.{0}".format(table_name, snapshot_name))
+        finally:
+            self.connection.execute('SET FOREIGN_KEY_CHECKS = 1;')
+
 class LocalPG(Localhost):
     def __init__(self, db_name):
         self.host = '127.0.0.1'
@@ -132,18 +450,20 @@ class LocalPG(Localhost):
     def create_connection(self):
         if self.username is None:
             raise EnvironmentError("database credentials are not set in ENV")
+        self.close_connection()
         try:
-            self.engine = create_engine('postgresql+psycopg2://{0}:{1}@{2}:{3}/{4}'.format(self.username, self.password,
-                                                                                           self.host, self.port,
-                                                                                           self.db_name), echo=False,
-                                        isolation_level='AUTOCOMMIT')
+            self.engine = self.create_engine_for('postgresql+psycopg2://{0}:{1}@{2}:{3}/{4}'.format(self.username,
+                                                                                                    self.password,
+                                                                                                    self.host, self.port,
+                                                                                                    self.db_name),
+                                                 isolation_level='AUTOCOMMIT')
             self.connection = self.engine.connect()
             self.run_statement('SET search_path = {0}'.format(self.search_path))
         except (InternalError, OperationalError) as e:
             if re.search('does not exist', str(e)):
-                self.engine = create_engine(
+                self.engine = self.create_engine_for(
                     'postgresql+psycopg2://{0}:{1}@{2}:{3}/'.format(self.username, self.password,
-                                                                    self.host, self.port), echo=False,
+                                                                    self.host, self.port),
                     isolation_level='AUTOCOMMIT')
 
                 self.connection = self.engine.connect()
@@ -160,8 +480,8 @@ class LocalPG(Localhost):
         self.connection.autocommit = True
         self.connection.execute("commit")
         result = self.connection.execute("SELECT datname FROM pg_database;")
-        existing_databases = result.fetchall()
-        if (str(self.db_name)) in str(existing_databases):
+        existing_databases = [row[0] for row in result.fetchall()]
+        if self.db_name in existing_databases:
             self.postgres_connection.execute("revoke connect on database {} from public".format(self.db_name))
             self.postgres_connection.execute("SELECT pg_terminate_backend(pg_stat_activity.pid) FROM pg_stat_activity "
                                               "WHERE pg_stat_activity.datname = '{}'"
@@ -170,12 +490,55 @@ class LocalPG(Localhost):
         self.postgres_connection.execute("CREATE DATABASE {};".format(self.db_name))
         self.connection = self.engine.connect()
 
+    def sql_loader(self, batch_size=1000):
+        # Postgres treats backslashes in standard strings literally and # as an operator
+        return SqlScriptLoader(self.connection, batch_size=batch_size, backslash_escapes=False, hash_comments=False)
+
+    def build_snapshot(self, snapshot_name, sql_data_file_path, tables_file_path, disable_foreign_keys):
+        self.drop_stale_snapshots(snapshot_name)
+        snapshot = type(self)(snapshot_name)
+        snapshot.setupDb(sql_data_file_path, tables_file_path, disable_foreign_keys)
+        snapshot.cleanUpDB()
+        # database comments are not copied by CREATE DATABASE ... TEMPLATE, so the clones don't inherit the marker
+        self.postgres_connection.execute("COMMENT ON DATABASE {0} IS 'snapshot complete'".format(snapshot_name))
+
+    def snapshot_exists(self, snapshot_name):
+        result = self.postgres_connection.execute("SELECT shobj_description(oid, 'pg_database') FROM pg_database "
+                                                  "WHERE datname = '{0}'".format(snapshot_name)).first()
+        return result is not None and result[0] == 'snapshot complete'
+
+    def drop_stale_snapshots(self, snapshot_name):
+        stale = self.postgres_connection.execute("SELECT datname FROM pg_database WHERE datname LIKE '{0}' "
+                                                 "AND datname != '{1}'".format(self.stale_snapshot_pattern(snapshot_name),
+                                                                               snapshot_name)).fetchall()
+        for (database_name,) in stale:
+            self.terminate_connections(database_name)
+            self.postgres_connection.execute("DROP DATABASE {0}".format(database_name))
+
+    def clone_snapshot(self, snapshot_name):
+        """
+        CREATE DATABASE ... TEMPLATE copies the snapshot's files, which is much faster than replaying SQL
+        """
+        self.close_connection()
+        self.engine.dispose()
+        self.terminate_connections(self.db_name)
+        self.terminate_connections(snapshot_name)
+        self.postgres_connection.execute("DROP DATABASE IF EXISTS {0}".format(self.db_name))
+        self.postgres_connection.execute("CREATE DATABASE {0} TEMPLATE {1}".format(self.db_name, snapshot_name))
+        self.create_connection()
+
+    def terminate_connections(self, database_name):
+        self.postgres_connection.execute("SELECT pg_terminate_backend(pg_stat_activity.pid) FROM pg_stat_activity "
+                                         "WHERE pg_stat_activity.datname = '{0}' "
+                                         "and pid <> pg_backend_pid();".format(database_name))
+
 
     def create_postgres_connection(self):
-        postgres_engine = create_engine('postgresql+psycopg2://{0}:{1}@{2}:{3}/{4}'.format(self.username, self.password,
-                                                                                       self.host, self.port,
-                                                                                       'postgres'), echo=False,
-                                                                                        isolation_level='AUTOCOMMIT')
+        postgres_engine = self.create_engine_for('postgresql+psycopg2://{0}:{1}@{2}:{3}/{4}'.format(self.username,
+                                                                                                    self.password,
+                                                                                                    self.host, self.port,
+                                                                                                    'postgres'),
+                                                 isolation_level='AUTOCOMMIT')
         postgres_connection = postgres_engine.connect()
         return postgres_engine, postgres_connection
 
@@ -191,4 +554,126 @@ class LocalPG(Localhost):
         self.connection.execute("SELECT pg_catalog.setval(pg_get_serial_sequence('{0}', '{1}'), MAX({1})) FROM {0};".format(table_name, primary_key))
 
     def set_search_path(self, search_path='halo_connect_customer_data'):
-        self.search_path = search_path
\ No newline at end of file
+        self.search_path = search_path
+
+def register_sqlite_functions(dbapi_connection, connection_record=None):
+    """
+    Adds the MySQL functions used by Vehicle's queries to an sqlite3 connection, with MySQL's NULL semantics
+    """
+    dbapi_connection.create_function('CONCAT', -1, lambda *values: None if None in values
+                                     else ''.join(str(value) for value in values))
+
+
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record=None):
+    # SQLite ignores foreign keys unless asked to, MySQL enforces them
+    dbapi_connection.execute('PRAGMA foreign_keys = ON')
+
+
+class LocalSQLite(Localhost):
+    """
+    Localhost stand in on SQLite, for tests and offline analytics without a DB server. db_name is a file path or
+    ':memory:'. The MySQL schema and fixture files are translated on load (see SqlLoader.translate_mysql_to_sqlite) and
+    the MySQL functions Vehicle uses are registered on every connection.
+
+    An in memory DB lives in a single connection that every checkout shares, so use a file for multi threaded work.
+    """
+    # where setupDb(use_snapshot=True) keeps its snapshot files, the temp dir when None
+    snapshot_directory = None
+
+    def __init__(self, db_name=':memory:'):
+        self.host = None
+        self.port = None
+        self.username = None
+        self.password = None
+        self.db_name = db_name
+        self.engine = None
+        self.connection = None
+        self.session = None
+
+    def create_connection(self):
+        self.close_connection()
+        if self.engine is None:
+            self.engine = self.create_engine_for('sqlite:///{0}'.format(self.db_name))
+        self.connection = self.engine.connect()
+
+    def create_engine_for(self, dsn, **engine_options):
+        if self.db_name == ':memory:':
+            # every in memory DB is private to its LocalSQLite, so it isn't put in the shared registry
+            engine = create_engine(dsn, echo=False, poolclass=StaticPool,
+                                   connect_args={'check_same_thread': False}, **engine_options)
+        else:
+            # SQLite's pools don't take the sizing options
+            engine = get_shared_engine(dsn, echo=False, **engine_options)
+        for listener in (register_sqlite_functions, enable_sqlite_foreign_keys):
+            if not event.contains(engine, 'connect', listener):
+                event.listen(engine, 'connect', listener)
+        return engine
+
+    def cleanUpDB(self):
+        if self.session:
+            self.session.close()
+        if self.connection is not None:
+            self.connection.close()
+        if not self.is_worker_copy and self.engine is not None and self.db_name == ':memory:':
+            self.engine.dispose()
+
+    def refresh_database(self):
+        """
+        Drops every table, view, index and trigger, an SQLite file is a single database
+        """
+        schema = self.connection.execute("SELECT type, name FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' "
+                                         "AND type IN ('table', 'view', 'trigger')").fetchall()
+        self.connection.exec_driver_sql('PRAGMA foreign_keys = OFF')
+        try:
+            for object_type, name in schema:
+                self.connection.exec_driver_sql('DROP {0} IF EXISTS "{1}"'.format(object_type.upper(), name))
+        finally:
+            self.connection.exec_driver_sql('PRAGMA foreign_keys = ON')
+
+    def populate_db(self, sql_data_file_path='../common/_database_setup/vehicle_and_fleet_meta_data.sql',
+                    disable_foreign_keys=False, batch_size=1000):
+        if disable_foreign_keys is True:
+            self.connection.exec_driver_sql('PRAGMA foreign_keys = OFF')
+        try:
+            return self.sql_loader(batch_size).load(sql_data_file_path)
+        finally:
+            if disable_foreign_keys is True:
+                self.connection.exec_driver_sql('PRAGMA foreign_keys = ON')
+
+    def sql_loader(self, batch_size=1000):
+        return SqlScriptLoader(self.connection, batch_size=batch_size, translate=translate_mysql_to_sqlite)
+
+    def snapshot_name(self, sql_data_file_path, tables_file_path, disable_foreign_keys):
+        name = super().snapshot_name(sql_data_file_path, tables_file_path, disable_foreign_keys)
+        stem = 'memory' if self.db_name == ':memory:' else os.path.splitext(os.path.basename(self.db_name))[0]
+        directory = self.snapshot_directory or tempfile.gettempdir()
+        return os.path.join(directory, stem + name[len(self.db_name):] + '.sqlite')
+
+    def build_snapshot(self, snapshot_name, sql_data_file_path, tables_file_path, disable_foreign_keys):
+        self.drop_stale_snapshots(snapshot_name)
+        # built under a temporary name and renamed, so a snapshot whose build was interrupted is never cloned
+        building = '{0}.{1}.tmp'.format(snapshot_name, os.getpid())
+        snapshot = LocalSQLite(building)
+        snapshot.setupDb(sql_data_file_path, tables_file_path, disable_foreign_keys)
+        snapshot.cleanUpDB()
+        snapshot.engine.dispose()
+        os.replace(building, snapshot_name)
+
+    def snapshot_exists(self, snapshot_name):
+        return os.path.exists(snapshot_name)
+
+    def drop_stale_snapshots(self, snapshot_name):
+        source = snapshot_name[:snapshot_name.rindex('_') + 1]
+        for path in glob.glob(glob.escape(source) + '*.sqlite'):
+            if path != snapshot_name:
+                os.remove(path)
+
+    def clone_snapshot(self, snapshot_name):
+        """
+        Copies the snapshot page by page with SQLite's backup API, which works for file and in memory targets alike
+        """
+        source = sqlite3.connect(snapshot_name)
+        try:
+            source.backup(self.connection.connection.dbapi_connection)
+        finally:
+            source.close()
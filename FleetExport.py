@@ -0,0 +1,227 @@
+import glob
+import os
+import shutil
+
+import pandas as pd
+
+from OpenEvents import EVENT_COLUMNS, load_open_vehicle_events
+from Queries import queries
+
+DATASETS = ('vehicles', 'set_points', 'offsets', 'open_events')
+CATEGORICAL_COLUMNS = ('unique_id', 'event_type', 'status', 'severity', 'vehicle_type')
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+
+class FleetExport:
+    """
+    Exports the data behind Vehicle's getters for a whole fleet (or all fleets) as columnar files, so analytics can
+    rebuild fleet snapshots without one DB round trip per vehicle and getter. Vehicles are streamed in chunks of
+    chunk_size; every chunk becomes one file per dataset and partition:
+
+        <root>/<dataset>/fleet_id=<fleet_id>/date=<date>/part-<chunk>.parquet
+
+    with the datasets vehicles, set_points (active non pump sensors), offsets (leak_detection_pressure_offsets of date)
+    and open_events. unique_id, event_type, status, severity and vehicle_type are stored as categoricals. A partition
+    is replaced as a whole when the same fleet and date are exported again, in every dataset: one that has no rows
+    anymore (e.g. all open events closed) is removed.
+
+    Parquet and Feather files need pyarrow, which is not a requirement of the rest of the package.
+
+    Example:
+        FleetExport(read_database, '/data/fleet').export('2021-02-01', fleet_ids=[7])
+        batch = FleetExport(None, '/data/fleet').read_snapshot('2021-02-01', fleet_ids=[7])
+        batch[vehicle_id].get_active_sensors()  # no DB needed
+    """
+    formats = {'parquet': 'parquet', 'feather': 'feather'}
+
+    def __init__(self, read_database, root, file_format='parquet', chunk_size=1000):
+        if file_format not in self.formats:
+            raise ValueError("unknown format {0}".format(file_format))
+        self.read_database = read_database
+        self.root = root
+        self.file_format = file_format
+        self.chunk_size = chunk_size
+
+    def export(self, date, fleet_ids=None):
+        """
+        :param date: start_of_analysis_date of the offsets, also the date partition of every dataset
+        :param fleet_ids: fleets to export, every fleet when None
+        :return: dict of dataset to rows written
+        """
+        require_pyarrow()
+        partition_date = partition_date_for(date)
+        staging = os.path.join(self.root, '.staging-{0}-{1}'.format(partition_date, os.getpid()))
+        shutil.rmtree(staging, ignore_errors=True)
+        counts = dict.fromkeys(DATASETS, 0)
+        exported_fleet_ids = None if fleet_ids is None else set(fleet_ids)
+        try:
+            for chunk_number, vehicle_ids in enumerate(self.vehicle_id_chunks(fleet_ids)):
+                frames = self.load_chunk(vehicle_ids, date)
+                if exported_fleet_ids is not None:
+                    exported_fleet_ids.update(None if pd.isna(fleet_id) else int(fleet_id)
+                                              for fleet_id in frames['vehicles'].fleet_id.unique())
+                for dataset, frame in frames.items():
+                    counts[dataset] += len(frame)
+                    self.write_partitions(staging, dataset, frame, partition_date, chunk_number)
+            self.publish(staging, partition_date, exported_fleet_ids)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return counts
+
+    def vehicle_id_chunks(self, fleet_ids):
+        if fleet_ids is None:
+            statements = [(queries['all_vehicle_ids'], None)]
+        else:
+            statements = [(queries['vehicle_ids_for_fleet'], {'fleet_id': fleet_id}) for fleet_id in fleet_ids]
+        for statement, params in statements:
+            for rows in self.read_database.stream_query(statement, params, self.chunk_size):
+                yield [row.vehicle_id for row in rows]
+
+    def load_chunk(self, vehicle_ids, date):
+        """
+        Set based queries for one chunk of vehicles, mirroring what VehicleBatch.load caches per vehicle
+        :return: dict of dataset to DataFrame, every frame with a fleet_id column
+        """
+        meta_data = self.read_database.read_frame(queries['vehicle_meta_data_for_vehicles'],
+                                                  {'vehicle_ids': vehicle_ids})
+        # rows are in id order per vehicle, so the same rules as Vehicle.get_vehicle_type (last row) and get_fleet_id
+        # (first non archived row) apply
+        vehicle_types = meta_data.drop_duplicates('vehicle_id', keep='last')[['vehicle_id', 'vehicle_type']]
+        fleets = meta_data[meta_data.archived == 0].drop_duplicates('vehicle_id')[['vehicle_id', 'fleet_id',
+                                                                                    'fleet_vehicle_id']]
+        vehicles = vehicle_types.merge(fleets, on='vehicle_id', how='left')
+        fleet_ids = [int(fleet_id) for fleet_id in vehicles.fleet_id.dropna().unique()]
+        fleet_names = self.read_database.read_frame(queries['fleet_names_for_fleets'], {'fleet_ids': fleet_ids}) \
+            if fleet_ids else pd.DataFrame(columns=['fleet_id', 'fleet_name'])
+        vehicles = vehicles.merge(fleet_names, on='fleet_id', how='left')
+        fleet_of_vehicle = vehicles[['vehicle_id', 'fleet_id']]
+
+        set_points = self.read_database.read_frame(queries['active_sensors_and_set_points_for_vehicles'],
+                                                   {'vehicle_ids': vehicle_ids})
+        # every (unique_id, vehicle_id) pair, a sensor that moved can still be active on more than one vehicle
+        vehicle_of_sensor = set_points[['unique_id', 'vehicle_id']].drop_duplicates()
+        unique_ids = vehicle_of_sensor.unique_id.unique().tolist()
+        offsets = [self.read_database.read_frame(queries['offsets_for_sensors'],
+                                                 {'unique_ids': unique_ids[start:start + self.chunk_size],
+                                                  'date': date})
+                   for start in range(0, len(unique_ids), self.chunk_size)]
+        offsets = pd.concat(offsets, ignore_index=True) if offsets else \
+            pd.DataFrame(columns=['date', 'pressure_offset', 'unique_id'])
+        offsets = offsets.merge(vehicle_of_sensor, on='unique_id')[['vehicle_id', 'date', 'pressure_offset',
+                                                                    'unique_id']]
+        offsets['date'] = pd.to_datetime(offsets.date)
+
+        open_events = load_open_vehicle_events(self.read_database, vehicle_ids, chunk_size=self.chunk_size)
+        open_events = open_events.reset_index()[EVENT_COLUMNS]
+
+        frames = {'vehicles': vehicles,
+                  'set_points': set_points.merge(fleet_of_vehicle, on='vehicle_id', how='left'),
+                  'offsets': offsets.merge(fleet_of_vehicle, on='vehicle_id', how='left'),
+                  'open_events': open_events.merge(fleet_of_vehicle, on='vehicle_id', how='left')}
+        return {dataset: with_dtypes(frame) for dataset, frame in frames.items()}
+
+    def write_partitions(self, root, dataset, frame, partition_date, chunk_number):
+        if frame.empty:
+            return
+        extension = self.formats[self.file_format]
+        for fleet_id, partition in frame.groupby(frame.fleet_id.fillna(-1).astype('int64')):
+            directory = partition_directory(root, dataset, None if fleet_id == -1 else fleet_id, partition_date)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, 'part-{0:05d}.{1}'.format(chunk_number, extension))
+            partition = partition.reset_index(drop=True)
+            if self.file_format == 'parquet':
+                partition.to_parquet(path, index=False)
+            else:
+                partition.to_feather(path)
+
+    def publish(self, staging, partition_date, fleet_ids):
+        """
+        Removes the partitions of partition_date of a previous export for fleet_ids (every fleet when None) from every
+        dataset, including the ones nothing was staged for, then moves every staged partition into root
+        """
+        for dataset in DATASETS:
+            if fleet_ids is None:
+                targets = glob.glob(partition_directory(self.root, dataset, '*', partition_date))
+            else:
+                targets = [partition_directory(self.root, dataset, fleet_id, partition_date) for fleet_id in fleet_ids]
+            for target in targets:
+                shutil.rmtree(target, ignore_errors=True)
+        for directory in glob.glob(os.path.join(staging, '*', '*', '*')):
+            target = os.path.join(self.root, os.path.relpath(directory, staging))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(directory, target)
+
+    def read_dataset(self, dataset, date, fleet_ids=None):
+        """
+        :return: DataFrame of dataset for date (and fleet_ids), empty when nothing was exported
+        """
+        require_pyarrow()
+        if dataset not in DATASETS:
+            raise ValueError("unknown dataset {0}".format(dataset))
+        partition_date = partition_date_for(date)
+        if fleet_ids is None:
+            directories = glob.glob(partition_directory(self.root, dataset, '*', partition_date))
+        else:
+            directories = [partition_directory(self.root, dataset, fleet_id, partition_date) for fleet_id in fleet_ids]
+        paths = sorted(path for directory in directories
+                       for path in glob.glob(os.path.join(directory, '*.' + self.formats[self.file_format])))
+        reader = pd.read_parquet if self.file_format == 'parquet' else pd.read_feather
+        frames = [reader(path) for path in paths]
+        if not frames:
+            return pd.DataFrame()
+        # files have their own categories, concat falls back to object columns
+        return with_dtypes(pd.concat(frames, ignore_index=True))
+
+    def read_snapshot(self, date, fleet_ids=None, read_database=None, write_database=None):
+        """
+        Rebuilds the Vehicles of an export with their caches filled in, see VehicleBatch.load_frames
+        :param date: date of the export, the offsets are cached for get_sensor_pressure_offsets(date)
+        :return: VehicleBatch
+        """
+        from VehicleBatch import VehicleBatch
+        vehicles = self.read_dataset('vehicles', date, fleet_ids)
+        if vehicles.empty:
+            return VehicleBatch(read_database, write_database)
+        set_points = self.read_dataset('set_points', date, fleet_ids)
+        offsets = self.read_dataset('offsets', date, fleet_ids)
+        if offsets.empty:
+            offsets = pd.DataFrame(columns=['vehicle_id', 'date', 'pressure_offset', 'unique_id'])
+        else:
+            offsets['date'] = offsets.date.dt.date
+        open_events = self.read_dataset('open_events', date, fleet_ids)
+        if open_events.empty:
+            open_events = pd.DataFrame(columns=EVENT_COLUMNS)
+        open_events = open_events[EVENT_COLUMNS].set_index('vehicle_id')
+        if set_points.empty:
+            set_points = pd.DataFrame(columns=['vehicle_id', 'unique_id', 'set_point'])
+        return VehicleBatch(read_database, write_database).load_frames(vehicles, set_points, offsets, date,
+                                                                       open_events)
+
+
+def with_dtypes(frame):
+    frame = frame.copy()
+    for column in CATEGORICAL_COLUMNS:
+        if column in frame:
+            frame[column] = frame[column].astype('category')
+    for column in ('vehicle_id', 'event_id', 'event_status_id'):
+        if column in frame and not frame[column].isna().any():
+            frame[column] = frame[column].astype('int64')
+    if 'fleet_id' in frame:
+        frame['fleet_id'] = frame.fleet_id.astype('Int64')
+    return frame
+
+
+def partition_date_for(date):
+    return pd.Timestamp(date).strftime('%Y-%m-%d')
+
+
+def partition_directory(root, dataset, fleet_id, partition_date):
+    return os.path.join(root, dataset, 'fleet_id={0}'.format(NULL_PARTITION if fleet_id is None else fleet_id),
+                        'date={0}'.format(partition_date))
+
+
+def require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError("FleetExport writes Parquet/Feather through pyarrow, install it with pip install pyarrow")
@@ -0,0 +1,262 @@
+import numpy as np
+import pandas as pd
+
+from OpenEvents import EVENT_COLUMNS
+
+NO_FLEET = -1
+
+
+class FleetSnapshot:
+    """
+    Read only, array backed store of the data Vehicle caches, for keeping a whole fleet resident in memory. Every
+    dataset is held as contiguous NumPy columns sorted by vehicle, with a bounds array giving each vehicle's row
+    range (rows of vehicle i are bounds[i]:bounds[i + 1]), and every string column is interned to integer codes
+    into one shared vocabulary per column. snapshot[vehicle_id] returns a VehicleView, a __slots__ object that answers
+    the Vehicle getters from these arrays.
+
+    Example:
+        snapshot = FleetSnapshot.load(read_database, vehicle_ids, start_of_analysis_date='2021-02-01')
+        snapshot[vehicle_id].get_active_sensors()
+        snapshot.nbytes()
+    """
+
+    def __init__(self, vehicles, set_points, offsets=None, open_events=None, start_of_analysis_date=None):
+        """
+        Takes the same frames as VehicleBatch.load_frames, open_events with a vehicle_id column or index
+        """
+        vehicles = vehicles.drop_duplicates('vehicle_id').sort_values('vehicle_id')
+        self.vehicle_ids = vehicles.vehicle_id.to_numpy(dtype='int64')
+        self.vehicle_type_codes, self.vehicle_types = self.factorize(vehicles.vehicle_type)
+        self.fleet_ids = vehicles.fleet_id.astype('float64').fillna(NO_FLEET).to_numpy(dtype='int64')
+        self.fleet_vehicle_id_codes, self.fleet_vehicle_ids = self.factorize(vehicles.fleet_vehicle_id)
+        self.fleet_names = {int(fleet_id): fleet_name for fleet_id, fleet_name
+                            in zip(vehicles.fleet_id, vehicles.fleet_name)
+                            if not pd.isna(fleet_id) and not pd.isna(fleet_name)}
+        self.start_of_analysis_date = None if start_of_analysis_date is None else pd.Timestamp(start_of_analysis_date)
+
+        if offsets is None:
+            offsets = pd.DataFrame(columns=['vehicle_id', 'date', 'pressure_offset', 'unique_id'])
+        if open_events is None:
+            open_events = pd.DataFrame(columns=EVENT_COLUMNS)
+        elif 'vehicle_id' not in open_events:
+            open_events = open_events.reset_index()
+        self.unique_ids = pd.Index(pd.unique(np.concatenate([
+            set_points.unique_id.astype(object).to_numpy(), offsets.unique_id.astype(object).to_numpy(),
+            open_events.unique_id.astype(object).to_numpy()])))
+
+        set_points = self.sorted_by_vehicle(set_points)
+        self.sensor_bounds = self.bounds(set_points)
+        self.sensor_codes = self.unique_id_codes(set_points)
+        self.set_points = set_points.set_point.to_numpy()
+
+        offsets = self.sorted_by_vehicle(offsets)
+        self.offset_bounds = self.bounds(offsets)
+        self.offset_codes = self.unique_id_codes(offsets)
+        self.offset_dates = offsets.date.astype(object).to_numpy()
+        self.pressure_offsets = offsets.pressure_offset.to_numpy(dtype='float64')
+
+        open_events = self.sorted_by_vehicle(open_events)
+        self.event_bounds = self.bounds(open_events)
+        self.event_codes = self.unique_id_codes(open_events)
+        self.event_ids = open_events.event_id.to_numpy(dtype='int64')
+        self.event_status_ids = open_events.event_status_id.to_numpy(dtype='int64')
+        self.event_type_codes, self.event_types = self.factorize(open_events.event_type)
+        self.severity_codes, self.severities = self.factorize(open_events.severity)
+        self.status_codes, self.statuses = self.factorize(open_events.status)
+        self.status_created_at = pd.to_datetime(open_events.status_created_at).to_numpy()
+
+    @classmethod
+    def load(cls, read_database, vehicle_ids, start_of_analysis_date=None, chunk_size=1000):
+        """
+        Builds the snapshot from the DB with the set based queries of FleetExport, chunk_size vehicles at a time
+        """
+        from FleetExport import FleetExport
+        export = FleetExport(read_database, None, chunk_size=chunk_size)
+        vehicle_ids = [int(vehicle_id) for vehicle_id in dict.fromkeys(vehicle_ids)]
+        frames = {}
+        for start in range(0, len(vehicle_ids), chunk_size):
+            for dataset, frame in export.load_chunk(vehicle_ids[start:start + chunk_size],
+                                                    start_of_analysis_date).items():
+                frames.setdefault(dataset, []).append(frame)
+        if not frames:
+            return cls(pd.DataFrame(columns=['vehicle_id', 'vehicle_type', 'fleet_id', 'fleet_vehicle_id',
+                                             'fleet_name']),
+                       pd.DataFrame(columns=['vehicle_id', 'unique_id', 'set_point']),
+                       start_of_analysis_date=start_of_analysis_date)
+        frames = {dataset: pd.concat(chunks, ignore_index=True) for dataset, chunks in frames.items()}
+        return cls(frames['vehicles'], frames['set_points'], frames['offsets'], frames['open_events'],
+                   start_of_analysis_date)
+
+    @classmethod
+    def from_export(cls, export, date, fleet_ids=None):
+        """
+        Builds the snapshot from the files of a FleetExport
+        """
+        frames = {dataset: export.read_dataset(dataset, date, fleet_ids)
+                  for dataset in ('vehicles', 'set_points', 'offsets', 'open_events')}
+        if frames['vehicles'].empty:
+            frames['vehicles'] = pd.DataFrame(columns=['vehicle_id', 'vehicle_type', 'fleet_id', 'fleet_vehicle_id',
+                                                       'fleet_name'])
+        if frames['set_points'].empty:
+            frames['set_points'] = pd.DataFrame(columns=['vehicle_id', 'unique_id', 'set_point'])
+        if frames['offsets'].empty:
+            frames['offsets'] = None
+        else:
+            frames['offsets']['date'] = frames['offsets'].date.dt.date
+        if frames['open_events'].empty:
+            frames['open_events'] = None
+        return cls(frames['vehicles'], frames['set_points'], frames['offsets'], frames['open_events'], date)
+
+    def factorize(self, values):
+        codes, labels = pd.factorize(values.astype(object))
+        return codes.astype('int32'), np.asarray(labels, dtype=object)
+
+    def sorted_by_vehicle(self, frame):
+        """
+        Drops rows of vehicles that are not in the snapshot and stable sorts the rest by vehicle, keeping the order of
+        the rows within a vehicle
+        """
+        vehicle_ids = frame.vehicle_id.to_numpy(dtype='int64')
+        positions = np.searchsorted(self.vehicle_ids, vehicle_ids)
+        known = positions < len(self.vehicle_ids)
+        known[known] = self.vehicle_ids[positions[known]] == vehicle_ids[known]
+        order = np.argsort(positions[known], kind='stable')
+        frame = frame[known].iloc[order].reset_index(drop=True)
+        frame['position'] = positions[known][order]
+        return frame
+
+    def bounds(self, frame):
+        return np.searchsorted(frame.position.to_numpy(), np.arange(len(self.vehicle_ids) + 1)).astype('int64')
+
+    def unique_id_codes(self, frame):
+        return self.unique_ids.get_indexer(frame.unique_id.astype(object)).astype('int32')
+
+    def position(self, vehicle_id):
+        position = int(np.searchsorted(self.vehicle_ids, vehicle_id))
+        if position == len(self.vehicle_ids) or self.vehicle_ids[position] != vehicle_id:
+            raise KeyError(vehicle_id)
+        return position
+
+    def __getitem__(self, vehicle_id):
+        return VehicleView(self, self.position(vehicle_id))
+
+    def __contains__(self, vehicle_id):
+        try:
+            self.position(vehicle_id)
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self):
+        return len(self.vehicle_ids)
+
+    def __iter__(self):
+        for position in range(len(self.vehicle_ids)):
+            yield VehicleView(self, position)
+
+    def nbytes(self):
+        """
+        Memory held by the arrays, the vocabularies' strings not included
+        """
+        return sum(value.nbytes for value in vars(self).values() if isinstance(value, np.ndarray))
+
+
+class VehicleView:
+    """
+    One vehicle of a FleetSnapshot, answering the read getters of Vehicle. Sensors, set points and offsets come back
+    as they are returned by Vehicle; get_sensor_codes, get_set_points and has_open_events answer from the arrays
+    without building any DataFrame.
+    """
+    __slots__ = ('snapshot', 'position')
+
+    def __init__(self, snapshot, position):
+        self.snapshot = snapshot
+        self.position = position
+
+    def __repr__(self):
+        return 'VehicleView(vehicle_id={0})'.format(self.vehicle_id)
+
+    @property
+    def vehicle_id(self):
+        return int(self.snapshot.vehicle_ids[self.position])
+
+    def rows(self, bounds):
+        return slice(bounds[self.position], bounds[self.position + 1])
+
+    def get_vehicle_type(self):
+        return self.snapshot.vehicle_types[self.snapshot.vehicle_type_codes[self.position]]
+
+    def get_fleet_id(self):
+        fleet_id = int(self.snapshot.fleet_ids[self.position])
+        return None if fleet_id == NO_FLEET else fleet_id
+
+    def get_fleet_vehicle_id(self):
+        code = self.snapshot.fleet_vehicle_id_codes[self.position]
+        return None if code < 0 else self.snapshot.fleet_vehicle_ids[code]
+
+    def get_fleet_name_for_vehicle(self):
+        return self.snapshot.fleet_names.get(self.get_fleet_id())
+
+    def get_sensor_codes(self):
+        """
+        Codes of the active non pump sensors into snapshot.unique_ids, a view on the snapshot's array
+        """
+        return self.snapshot.sensor_codes[self.rows(self.snapshot.sensor_bounds)]
+
+    def get_set_points(self):
+        return self.snapshot.set_points[self.rows(self.snapshot.sensor_bounds)]
+
+    def get_active_sensors(self):
+        return self.snapshot.unique_ids[self.get_sensor_codes()].tolist()
+
+    def get_active_sensors_and_setpoints(self, active=True, exclude_pump=True):
+        if active is not True or exclude_pump is not True:
+            raise ValueError("a FleetSnapshot only holds the active non pump sensors")
+        return pd.DataFrame({'unique_id': self.get_active_sensors(), 'set_point': self.get_set_points().tolist()},
+                            columns=['unique_id', 'set_point'])
+
+    def get_sensor_pressure_offsets(self, start_of_analysis_date):
+        if self.snapshot.start_of_analysis_date != pd.Timestamp(start_of_analysis_date):
+            raise ValueError("snapshot holds the offsets of {0}".format(self.snapshot.start_of_analysis_date))
+        rows = self.rows(self.snapshot.offset_bounds)
+        return pd.DataFrame({'date': self.snapshot.offset_dates[rows],
+                             'pressure_offset': self.snapshot.pressure_offsets[rows],
+                             'unique_id': self.snapshot.unique_ids[self.snapshot.offset_codes[rows]]},
+                            columns=['date', 'pressure_offset', 'unique_id'])
+
+    def has_open_events(self, event_types=None):
+        rows = self.rows(self.snapshot.event_bounds)
+        if event_types is None:
+            return rows.stop > rows.start
+        return bool(np.isin(self.snapshot.event_types[self.snapshot.event_type_codes[rows]], event_types).any())
+
+    def get_open_vehicle_events(self):
+        rows = self.rows(self.snapshot.event_bounds)
+        snapshot = self.snapshot
+        return pd.DataFrame({'event_id': snapshot.event_ids[rows],
+                             'event_status_id': snapshot.event_status_ids[rows],
+                             'unique_id': snapshot.unique_ids[snapshot.event_codes[rows]],
+                             'event_type': snapshot.event_types[snapshot.event_type_codes[rows]],
+                             'severity': snapshot.severities[snapshot.severity_codes[rows]],
+                             'status': snapshot.statuses[snapshot.status_codes[rows]],
+                             'status_created_at': snapshot.status_created_at[rows]},
+                            columns=EVENT_COLUMNS[1:])
+
+    def filter_open_events_by_types(self, event_types):
+        # same contract as Vehicle.filter_open_events_by_types: None instead of an empty frame
+        if not self.has_open_events(event_types):
+            return None
+        open_events = self.get_open_vehicle_events()
+        return open_events[open_events.event_type.isin(event_types)]
+
+    def get_open_ui_events(self):
+        return self.filter_open_events_by_types(["UI"])
+
+    def get_open_leak_events(self):
+        return self.filter_open_events_by_types(["LEAK"])
+
+    def get_open_ui_leak_events(self):
+        return self.filter_open_events_by_types(["UI_LEAK"])
+
+    def get_open_leak_and_ui_leak_events(self):
+        return self.filter_open_events_by_types(["UI_LEAK", "LEAK"])
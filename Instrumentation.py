@@ -0,0 +1,237 @@
+import functools
+import inspect
+import json
+import math
+import random
+import re
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.default import CACHE_HIT
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAMETER_LIST = re.compile(r'\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(statement):
+    """
+    Normalizes a SQL statement so every execution of the same query shape maps to one key: literals and bound
+    parameters become ?, IN lists of any length collapse to (...) and whitespace is squashed
+    """
+    statement = _STRING_LITERAL.sub('?', statement)
+    statement = _NUMBER_LITERAL.sub('?', statement)
+    statement = _PARAMETER_LIST.sub('(...)', statement)
+    return _WHITESPACE.sub(' ', statement).strip()
+
+
+class LatencyStats:
+    """
+    Counters and a bounded reservoir of latency samples for one query fingerprint or method
+    """
+
+    def __init__(self, max_samples):
+        self.max_samples = max_samples
+        self.calls = 0
+        self.rows = 0
+        self.bytes = 0
+        self.cache_hits = 0
+        self.total_seconds = 0.0
+        self.samples = []
+
+    def add(self, seconds, rows=0, size=0, cache_hit=False):
+        self.calls += 1
+        self.rows += rows
+        self.bytes += size
+        self.cache_hits += cache_hit
+        self.total_seconds += seconds
+        if len(self.samples) < self.max_samples:
+            self.samples.append(seconds)
+        else:
+            # reservoir sampling keeps a uniform sample of every call so far
+            index = random.randrange(self.calls)
+            if index < self.max_samples:
+                self.samples[index] = seconds
+
+    def percentile(self, percent):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        # nearest rank
+        return ordered[max(0, math.ceil(percent / 100.0 * len(ordered)) - 1)]
+
+    def as_dict(self):
+        return {'calls': self.calls, 'rows': self.rows, 'bytes': self.bytes, 'cache_hits': self.cache_hits,
+                'total_seconds': self.total_seconds, 'p50_seconds': self.percentile(50),
+                'p95_seconds': self.percentile(95), 'p99_seconds': self.percentile(99)}
+
+
+class Profiler:
+    """
+    Opt in query and method profiler. While enabled it listens to before/after_cursor_execute and handle_error on the
+    given databases (or on every engine) and wraps the public methods of the given classes; disable() removes every
+    hook again, so nothing is left on the hot path when profiling is off.
+
+    Queries are keyed by fingerprint, with rows (cursor rowcount), bytes (statement and parameter size sent) and
+    compiled cache hits. Methods are keyed by Class.method; a method call that ran no query at all is counted as a
+    cache hit, since it was answered from the Vehicle's cached attributes.
+
+    Example:
+        with Profiler().enabled(read_database, classes=(Vehicle,)) as profiler:
+            run_job()
+        print(profiler.prometheus_text())
+    """
+
+    def __init__(self, max_samples=10000):
+        self.max_samples = max_samples
+        self.queries = {}
+        self.methods = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.targets = []
+        self.patched = []
+
+    @property
+    def is_enabled(self):
+        return bool(self.targets or self.patched)
+
+    def enable(self, *databases, classes=None):
+        """
+        :param databases: Database instances or engines to profile, every engine when none are given
+        :param classes: classes whose public methods are timed, defaults to Vehicle
+        """
+        if self.is_enabled:
+            raise RuntimeError("profiler is already enabled")
+        if classes is None:
+            from Vehicle import Vehicle
+            classes = (Vehicle,)
+
+        targets = [getattr(database, 'engine', database) for database in databases] or [Engine]
+        for target in targets:
+            event.listen(target, 'before_cursor_execute', self.before_cursor_execute)
+            event.listen(target, 'after_cursor_execute', self.after_cursor_execute)
+            event.listen(target, 'handle_error', self.handle_error)
+            self.targets.append(target)
+        for cls in classes:
+            for name, method in list(vars(cls).items()):
+                if name.startswith('_') or not inspect.isfunction(method):
+                    continue
+                setattr(cls, name, self.wrap(cls, name, method))
+                self.patched.append((cls, name, method))
+        return self
+
+    def disable(self):
+        for target in self.targets:
+            event.remove(target, 'before_cursor_execute', self.before_cursor_execute)
+            event.remove(target, 'after_cursor_execute', self.after_cursor_execute)
+            event.remove(target, 'handle_error', self.handle_error)
+        for cls, name, method in self.patched:
+            setattr(cls, name, method)
+        self.targets = []
+        self.patched = []
+
+    def enabled(self, *databases, classes=None):
+        self.enable(*databases, classes=classes)
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disable()
+
+    def reset(self):
+        with self.lock:
+            self.queries.clear()
+            self.methods.clear()
+
+    def before_cursor_execute(self, connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault('profiler_started_at', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, connection, cursor, statement, parameters, context, executemany):
+        started_at = connection.info['profiler_started_at'].pop()
+        seconds = time.perf_counter() - started_at
+        size = len(statement) + (len(repr(parameters)) if parameters else 0)
+        cache_hit = getattr(context, 'cache_hit', None) == CACHE_HIT
+        self.record(self.queries, fingerprint(statement), seconds, max(cursor.rowcount, 0), size, cache_hit)
+        # attribute the query to every profiled method currently running on this thread
+        for frame in getattr(self.local, 'frames', ()):
+            frame[0] += 1
+
+    def handle_error(self, exception_context):
+        # after_cursor_execute doesn't run for a failed statement, drop its start time so the next one isn't timed
+        # against it
+        connection = exception_context.connection
+        started_at = connection.info.get('profiler_started_at') if connection is not None else None
+        if started_at:
+            started_at.pop()
+
+    def wrap(self, cls, name, method):
+        key = '{0}.{1}'.format(cls.__name__, name)
+
+        @functools.wraps(method)
+        def profiled(*args, **kwargs):
+            frames = getattr(self.local, 'frames', None)
+            if frames is None:
+                frames = self.local.frames = []
+            frame = [0]
+            frames.append(frame)
+            started_at = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - started_at
+                frames.pop()
+                self.record(self.methods, key, seconds, cache_hit=frame[0] == 0)
+
+        return profiled
+
+    def record(self, table, key, seconds, rows=0, size=0, cache_hit=False):
+        with self.lock:
+            stats = table.get(key)
+            if stats is None:
+                stats = table[key] = LatencyStats(self.max_samples)
+            stats.add(seconds, rows, size, cache_hit)
+
+    def as_dict(self):
+        with self.lock:
+            return {'queries': {key: stats.as_dict() for key, stats in self.queries.items()},
+                    'methods': {key: stats.as_dict() for key, stats in self.methods.items()}}
+
+    def prometheus_text(self, prefix='python_training'):
+        """
+        Snapshot in the Prometheus text exposition format, latencies as summaries with 0.5/0.95/0.99 quantiles
+        """
+        snapshot = self.as_dict()
+        lines = []
+        for kind, label in (('queries', 'query'), ('methods', 'method')):
+            metric = '{0}_{1}'.format(prefix, label)
+            lines.append('# TYPE {0}_seconds summary'.format(metric))
+            for key, stats in sorted(snapshot[kind].items()):
+                labels = '{0}="{1}"'.format(label, key.replace('\\', '\\\\').replace('"', '\\"'))
+                for quantile in ('0.5', '0.95', '0.99'):
+                    value = stats['p{0}_seconds'.format(int(float(quantile) * 100))]
+                    lines.append('{0}_seconds{{{1},quantile="{2}"}} {3}'.format(metric, labels, quantile, value))
+                lines.append('{0}_seconds_sum{{{1}}} {2}'.format(metric, labels, stats['total_seconds']))
+                lines.append('{0}_seconds_count{{{1}}} {2}'.format(metric, labels, stats['calls']))
+                for counter in ('rows', 'bytes', 'cache_hits'):
+                    lines.append('{0}_{1}_total{{{2}}} {3}'.format(metric, counter, labels, stats[counter]))
+        return '\n'.join(lines) + '\n'
+
+    def json_lines(self):
+        """
+        One JSON object per query fingerprint and method, e.g. to append to a log after every job
+        """
+        snapshot = self.as_dict()
+        timestamp = time.time()
+        for kind, label in (('queries', 'query'), ('methods', 'method')):
+            for key, stats in snapshot[kind].items():
+                yield json.dumps(dict(stats, kind=label, key=key, timestamp=timestamp))
+
+    def write_json_lines(self, path):
+        with open(path, 'a') as log:
+            for line in self.json_lines():
+                log.write(line + '\n')
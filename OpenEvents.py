@@ -0,0 +1,158 @@
+import pandas as pd
+import sqlalchemy
+from sqlalchemy import BigInteger, Column, DateTime, MetaData, String, Table, column, func
+
+from Queries import queries
+
+EVENT_COLUMNS = ['vehicle_id', 'event_id', 'event_status_id', 'unique_id', 'event_type', 'severity', 'status',
+                 'status_created_at']
+
+
+def load_open_vehicle_events(read_database, vehicle_ids, statuses=('OPEN',), strategy='sql', chunk_size=500):
+    """
+    Resolves the latest status of every event on the active sensors of many vehicles at once and keeps the events
+    whose latest status is in statuses.
+    :param strategy: 'sql' resolves the latest status in the DB, 'pandas' fetches every status row and resolves it with
+    idxmax, for DBs where the correlated subquery is slow
+    :return: DataFrame indexed by vehicle_id with the columns of Vehicle.open_vehicle_events
+    """
+    vehicle_ids = list(dict.fromkeys(int(vehicle_id) for vehicle_id in vehicle_ids))
+    frames = []
+    for start in range(0, len(vehicle_ids), chunk_size):
+        params = {'vehicle_ids': vehicle_ids[start:start + chunk_size]}
+        if strategy == 'sql':
+            if statuses:
+                params['statuses'] = list(statuses)
+                frames.append(read_database.read_frame(queries['latest_event_statuses_for_vehicles'], params))
+            else:
+                frames.append(read_database.read_frame(queries['latest_events_for_vehicles'], params))
+        elif strategy == 'pandas':
+            all_statuses = read_database.read_frame(queries['all_event_statuses_for_vehicles'], params)
+            frames.append(latest_event_statuses(all_statuses, statuses))
+        else:
+            raise ValueError("unknown strategy {0}".format(strategy))
+
+    events = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=EVENT_COLUMNS)
+    return events[EVENT_COLUMNS].set_index('vehicle_id')
+
+
+def latest_event_statuses(events, statuses=None):
+    """
+    Keeps the row with the highest event_status_id per event (and vehicle), optionally only if its status is in
+    statuses
+    """
+    if events.empty:
+        return events
+    latest = events.loc[events.groupby(['vehicle_id', 'event_id']).event_status_id.idxmax()]
+    if statuses:
+        latest = latest[latest.status.isin(statuses)]
+    return latest.sort_values(['vehicle_id', 'unique_id', 'event_id'])
+
+
+def open_events_for_vehicle(open_events, vehicle_id):
+    """
+    Rows of a load_open_vehicle_events result for one vehicle, shaped like Vehicle.open_vehicle_events
+    """
+    return open_events[open_events.index == vehicle_id].reset_index(drop=True)
+
+
+def open_events_by_vehicle(open_events, vehicle_ids):
+    """
+    Splits a load_open_vehicle_events result into the open_vehicle_events of many vehicles in one pass, instead of an
+    open_events_for_vehicle mask per vehicle
+    :return: dict of vehicle_id to DataFrame, empty for the vehicles without open events
+    """
+    groups = {vehicle_id: events.reset_index(drop=True)
+              for vehicle_id, events in open_events.groupby(level=0, sort=False)}
+    empty = open_events.iloc[:0].reset_index(drop=True)
+    return {vehicle_id: groups[vehicle_id] if vehicle_id in groups else empty.copy() for vehicle_id in vehicle_ids}
+
+
+class OpenEventsTable:
+    """
+    Library managed table holding the latest status of every OPEN/SUSPECTED event, refreshed incrementally from
+    event_status, so open event lookups become an indexed read of a small table. refresh() only looks at status rows
+    above the event_status_id high water mark stored in open_events_state, so it can run every few minutes.
+
+    Example:
+        table = OpenEventsTable(database)
+        table.create()
+        table.refresh()
+        vehicle.get_open_events(unique_id, open_events_table=table)
+    """
+    statuses = ('OPEN', 'SUSPECTED')
+
+    def __init__(self, database, table_name='open_events'):
+        self.database = database
+        self.metadata = MetaData()
+        self.table = Table(table_name, self.metadata,
+                           Column('event_id', BigInteger, primary_key=True, autoincrement=False),
+                           Column('event_status_id', BigInteger),
+                           Column('unique_id', String(64), index=True),
+                           Column('event_type', String(32)),
+                           Column('severity', String(32)),
+                           Column('status', String(32)),
+                           Column('status_created_at', DateTime),
+                           Column('pressure_date', DateTime))
+        self.state = Table(table_name + '_state', self.metadata,
+                           Column('high_water_mark', BigInteger))
+        # built once, so every lookup is served from SQLAlchemy's compiled cache
+        self.open_events_query = sqlalchemy.text(
+            "SELECT event_id, unique_id, event_type, severity, status, status_created_at, pressure_date "
+            "FROM {0} WHERE unique_id = :unique_id ORDER BY event_id".format(table_name))
+        # refresh's statements on this table around the registered queries, the values stay bound parameters
+        changed_events = queries['changed_events'].columns(column('event_id'))
+        self.count_changed_events = sqlalchemy.select(func.count()).select_from(changed_events.subquery())
+        self.delete_changed_events = self.table.delete().where(self.table.c.event_id.in_(changed_events))
+        self.insert_latest_statuses = self.table.insert().from_select(
+            ['event_id', 'event_status_id', 'unique_id', 'event_type', 'severity', 'status', 'status_created_at',
+             'pressure_date'],
+            queries['latest_statuses_of_changed_events'].columns(*(column(name) for name in (
+                'event_id', 'event_status_id', 'unique_id', 'event_type', 'severity', 'status', 'ts_created',
+                'pressure_date'))))
+
+    def create(self):
+        self.metadata.create_all(self.database.engine, checkfirst=True)
+
+    def drop(self):
+        self.metadata.drop_all(self.database.engine, checkfirst=True)
+
+    def high_water_mark(self):
+        high_water_mark = self.database.connection.execute(sqlalchemy.select(self.state.c.high_water_mark)).scalar()
+        return high_water_mark or 0
+
+    def refresh(self):
+        """
+        Applies the event_status rows written since the last refresh
+        :return: number of events whose latest status changed
+        """
+        connection = self.database.connection
+        last_seen = self.high_water_mark()
+        newest = connection.execute(queries['max_event_status_id']).scalar() or 0
+        if newest <= last_seen:
+            return 0
+
+        delta = {'since': last_seen, 'until': newest}
+        with connection.begin():
+            changed = connection.execute(self.count_changed_events, delta).scalar()
+            connection.execute(self.delete_changed_events, delta)
+            connection.execute(self.insert_latest_statuses, dict(delta, statuses=list(self.statuses)))
+            connection.execute(self.state.delete())
+            connection.execute(self.state.insert().values(high_water_mark=newest))
+        return changed
+
+    def rebuild(self):
+        connection = self.database.connection
+        with connection.begin():
+            connection.execute(self.table.delete())
+            connection.execute(self.state.delete())
+        return self.refresh()
+
+    def open_events(self, unique_id):
+        """
+        Same columns as Vehicle.get_open_events, None when the sensor has no open events
+        """
+        open_events = self.database.read_frame(self.open_events_query, {'unique_id': unique_id})
+        if open_events.empty:
+            return None
+        return open_events
@@ -0,0 +1,226 @@
+import threading
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine.default import CACHE_HIT
+from sqlalchemy.sql import ClauseElement
+
+
+class QueryRegistry:
+    """
+    Named, bound parameter SQL statements. Every statement object is built once and reused for every call, so
+    SQLAlchemy's compiled cache serves it after the first execution (expanding IN parameters included) instead of
+    compiling a new string per literal, and values are always sent as bound parameters.
+
+    Example:
+        rows = database.run_query(queries['offsets_for_sensors'], {'unique_ids': unique_ids, 'date': date})
+        queries.stats()  # {'offsets_for_sensors': {'executions': 1, 'cache_hits': 0, 'hit_rate': 0.0}, ...}
+    """
+
+    def __init__(self):
+        self.queries = {}
+        self.names = {}
+        self.executions = {}
+        self.cache_hits = {}
+        self.lock = threading.Lock()
+
+    def register(self, name, sql, expanding=()):
+        """
+        :param expanding: names of the parameters that take a list of values, e.g. "unique_id IN :unique_ids"
+        """
+        statement = text(sql)
+        if expanding:
+            statement = statement.bindparams(*(bindparam(parameter, expanding=True) for parameter in expanding))
+        self.queries[name] = statement
+        self.names[id(statement)] = name
+        return statement
+
+    def __getitem__(self, name):
+        return self.queries[name]
+
+    def __contains__(self, name):
+        return name in self.queries
+
+    def record(self, statement, result):
+        """
+        Counts an execution of a registered statement and whether its compiled form came from the cache
+        """
+        name = self.names.get(id(statement))
+        if name is None:
+            return
+        cache_hit = getattr(result.context, 'cache_hit', None) == CACHE_HIT
+        with self.lock:
+            self.executions[name] = self.executions.get(name, 0) + 1
+            self.cache_hits[name] = self.cache_hits.get(name, 0) + cache_hit
+
+    def stats(self):
+        """
+        :return: dict of query name to executions, cache_hits and hit_rate, plus a 'total' entry
+        """
+        with self.lock:
+            stats = {name: self.query_stats(self.executions[name], self.cache_hits[name]) for name in self.executions}
+            stats['total'] = self.query_stats(sum(self.executions.values()), sum(self.cache_hits.values()))
+        return stats
+
+    def query_stats(self, executions, cache_hits):
+        return {'executions': executions, 'cache_hits': cache_hits,
+                'hit_rate': cache_hits / executions if executions else 0.0}
+
+    def reset_stats(self):
+        with self.lock:
+            self.executions.clear()
+            self.cache_hits.clear()
+
+
+def as_statement(query):
+    """
+    Wraps raw SQL strings in text(), registered statements and other SQLAlchemy constructs are returned as they are
+    """
+    if isinstance(query, ClauseElement):
+        return query
+    return text(query)
+
+
+queries = QueryRegistry()
+
+# Vehicle
+queries.register('vehicle_id_for_sensor',
+                 "SELECT vehicle_id FROM meta_data WHERE unique_id = :unique_id AND active = 1")
+queries.register('vehicle_type',
+                 "SELECT vehicle_type FROM vehicle_meta_data WHERE vehicle_id = :vehicle_id")
+queries.register('fleet_id',
+                 "SELECT fleet_id FROM vehicle_meta_data WHERE vehicle_id = :vehicle_id AND archived = 0")
+queries.register('fleet_vehicle_id',
+                 "SELECT fleet_vehicle_id FROM vehicle_meta_data WHERE vehicle_id = :vehicle_id AND archived = 0")
+queries.register('fleet_name',
+                 "SELECT fleet_name FROM fleet_meta_data WHERE fleet_id = :fleet_id")
+queries.register('cycle_number',
+                 "SELECT cycle_number FROM meta_data WHERE vehicle_id = :vehicle_id")
+queries.register('sensors_and_set_points',
+                 "SELECT unique_id, set_point FROM meta_data WHERE vehicle_id = :vehicle_id")
+queries.register('active_sensors_and_set_points',
+                 "SELECT unique_id, set_point FROM meta_data WHERE vehicle_id = :vehicle_id AND active = 1")
+queries.register('sensors_and_set_points_without_pump',
+                 "SELECT unique_id, set_point FROM meta_data WHERE vehicle_id = :vehicle_id AND type != 'P'")
+queries.register('active_sensors_and_set_points_without_pump',
+                 "SELECT unique_id, set_point FROM meta_data WHERE vehicle_id = :vehicle_id AND active = 1 "
+                 "AND type != 'P'")
+queries.register('offsets_for_sensors',
+                 "SELECT date, pressure_offset, unique_id FROM leak_detection_pressure_offsets "
+                 "WHERE unique_id IN :unique_ids AND date = :date", expanding=('unique_ids',))
+queries.register('meta_data_id',
+                 "SELECT MAX(id) FROM meta_data WHERE vehicle_id = :vehicle_id AND unique_id = :unique_id AND active = 1")
+queries.register('event_timestamp',
+                 "SELECT pressure_date FROM event_table WHERE event_id = :event_id")
+queries.register('deactivate_meta_data',
+                 "UPDATE meta_data SET active = 0 WHERE vehicle_id = :vehicle_id")
+queries.register('deactivate_meta_data_for_vehicles',
+                 "UPDATE meta_data SET active = 0 WHERE vehicle_id IN :vehicle_ids", expanding=('vehicle_ids',))
+queries.register('account_alert_parameters',
+                 "SELECT settings FROM custom_alert_parameters WHERE scope_type = 'ACCOUNT' AND scope_id = :fleet_id "
+                 "LIMIT 1")
+queries.register('global_alert_parameters',
+                 "SELECT settings FROM custom_alert_parameters WHERE scope_type = 'GLOBAL' LIMIT 1")
+
+# VehicleBatch
+# in id order per vehicle, so the first and last row rules of Vehicle's getters pick the same rows
+queries.register('vehicle_meta_data_for_vehicles',
+                 "SELECT vehicle_id, vehicle_type, fleet_id, fleet_vehicle_id, archived FROM vehicle_meta_data "
+                 "WHERE vehicle_id IN :vehicle_ids ORDER BY vehicle_id, id", expanding=('vehicle_ids',))
+queries.register('fleet_names_for_fleets',
+                 "SELECT fleet_id, fleet_name FROM fleet_meta_data WHERE fleet_id IN :fleet_ids",
+                 expanding=('fleet_ids',))
+queries.register('active_sensors_and_set_points_for_vehicles',
+                 "SELECT vehicle_id, unique_id, set_point FROM meta_data WHERE vehicle_id IN :vehicle_ids "
+                 "AND active = 1 AND type != 'P' ORDER BY id", expanding=('vehicle_ids',))
+
+# FleetExport
+queries.register('vehicle_ids_for_fleet',
+                 "SELECT DISTINCT vehicle_id FROM vehicle_meta_data WHERE fleet_id = :fleet_id AND archived = 0 "
+                 "ORDER BY vehicle_id")
+queries.register('all_vehicle_ids',
+                 "SELECT DISTINCT vehicle_id FROM vehicle_meta_data WHERE archived = 0 ORDER BY vehicle_id")
+
+# ChangeSync, every delta is read up to a high water mark taken first, so rows committed meanwhile wait for the
+# next poll instead of being skipped
+queries.register('max_meta_data_id', "SELECT MAX(id) FROM meta_data")
+queries.register('max_event_status_id', "SELECT MAX(event_status_id) FROM event_status")
+queries.register('max_pressure_offset_id', "SELECT MAX(id) FROM leak_detection_pressure_offsets")
+queries.register('meta_data_changes',
+                 "SELECT DISTINCT vehicle_id FROM meta_data WHERE id > :since AND id <= :until")
+queries.register('event_status_changes',
+                 "SELECT DISTINCT event_table.unique_id FROM event_status es "
+                 "JOIN event_table ON event_table.event_id = es.event_id "
+                 "WHERE es.event_status_id > :since AND es.event_status_id <= :until")
+queries.register('pressure_offset_changes',
+                 "SELECT id, date, pressure_offset, unique_id FROM leak_detection_pressure_offsets "
+                 "WHERE id > :since AND id <= :until AND date = :date ORDER BY id")
+
+# SensorIndex
+_SENSOR_INDEX = "SELECT id, vehicle_id, unique_id, CONCAT(side, axle, position, type) AS wheel_position, set_point, " \
+                "type, active FROM meta_data "
+queries.register('sensor_index_for_vehicles',
+                 _SENSOR_INDEX + "WHERE vehicle_id IN :vehicle_ids ORDER BY id", expanding=('vehicle_ids',))
+queries.register('sensor_index_for_fleet',
+                 _SENSOR_INDEX + "WHERE vehicle_id IN (SELECT vehicle_id FROM vehicle_meta_data "
+                 "WHERE fleet_id = :fleet_id AND archived = 0) ORDER BY id")
+
+# SensorDirectory, the fleet of a vehicle is taken from its non archived vehicle_meta_data row
+_SENSOR_OWNERS = "SELECT meta_data.id, meta_data.unique_id, meta_data.vehicle_id, fleets.fleet_id FROM meta_data " \
+                 "LEFT JOIN (SELECT vehicle_id, MIN(fleet_id) AS fleet_id FROM vehicle_meta_data WHERE archived = 0 " \
+                 "GROUP BY vehicle_id) fleets ON fleets.vehicle_id = meta_data.vehicle_id WHERE meta_data.active = 1 "
+queries.register('active_sensor_owners', _SENSOR_OWNERS + "ORDER BY meta_data.id")
+queries.register('active_sensor_owners_for_sensors',
+                 _SENSOR_OWNERS + "AND meta_data.unique_id IN :unique_ids ORDER BY meta_data.id",
+                 expanding=('unique_ids',))
+queries.register('active_sensor_owners_for_vehicles',
+                 _SENSOR_OWNERS + "AND meta_data.vehicle_id IN :vehicle_ids ORDER BY meta_data.id",
+                 expanding=('vehicle_ids',))
+queries.register('active_sensor_owners_since',
+                 _SENSOR_OWNERS + "AND meta_data.id > :since AND meta_data.id <= :until ORDER BY meta_data.id")
+queries.register('active_sensor_counts',
+                 "SELECT vehicle_id, COUNT(*) AS sensors FROM meta_data WHERE active = 1 GROUP BY vehicle_id")
+
+# OpenEvents, the latest status of an event is the row with its highest event_status_id
+_LATEST_STATUS = "(SELECT MAX(latest.event_status_id) FROM event_status latest " \
+                 "WHERE latest.event_id = event_table.event_id)"
+_SENSORS = "(SELECT DISTINCT vehicle_id, unique_id FROM meta_data " \
+           "WHERE vehicle_id IN :vehicle_ids AND active = 1 AND type != 'P') sensors"
+queries.register('open_events_for_sensor',
+                 "SELECT event_table.event_id, event_table.unique_id, event_table.event_type, severity, "
+                 "event_status.status, event_status.ts_created AS status_created_at, pressure_date "
+                 "FROM event_table JOIN event_status USING(event_id) WHERE event_table.unique_id = :unique_id "
+                 "AND event_status.event_status_id = " + _LATEST_STATUS + " "
+                 "AND event_status.status IN ('OPEN','SUSPECTED') ORDER BY event_table.event_id")
+queries.register('latest_event_statuses_for_vehicles',
+                 "SELECT sensors.vehicle_id, event_table.event_id, es.event_status_id, event_table.unique_id, "
+                 "event_table.event_type, es.severity, es.status, es.ts_created AS status_created_at "
+                 "FROM " + _SENSORS + " JOIN event_table ON event_table.unique_id = sensors.unique_id "
+                 "JOIN event_status es ON es.event_id = event_table.event_id "
+                 "WHERE es.event_status_id = " + _LATEST_STATUS + " AND es.status IN :statuses "
+                 "ORDER BY sensors.vehicle_id, event_table.unique_id, event_table.event_id",
+                 expanding=('vehicle_ids', 'statuses'))
+queries.register('latest_events_for_vehicles',
+                 "SELECT sensors.vehicle_id, event_table.event_id, es.event_status_id, event_table.unique_id, "
+                 "event_table.event_type, es.severity, es.status, es.ts_created AS status_created_at "
+                 "FROM " + _SENSORS + " JOIN event_table ON event_table.unique_id = sensors.unique_id "
+                 "JOIN event_status es ON es.event_id = event_table.event_id "
+                 "WHERE es.event_status_id = " + _LATEST_STATUS + " "
+                 "ORDER BY sensors.vehicle_id, event_table.unique_id, event_table.event_id",
+                 expanding=('vehicle_ids',))
+# OpenEventsTable.refresh, the events with a status row in (since, until] and the latest of their statuses up to until
+_CHANGED_EVENTS = "SELECT DISTINCT event_id FROM event_status WHERE event_status_id > :since AND event_status_id <= :until"
+queries.register('changed_events', _CHANGED_EVENTS)
+queries.register('latest_statuses_of_changed_events',
+                 "SELECT event_table.event_id, es.event_status_id, event_table.unique_id, event_table.event_type, "
+                 "es.severity, es.status, es.ts_created, event_table.pressure_date "
+                 "FROM event_table JOIN event_status es ON es.event_id = event_table.event_id "
+                 "WHERE event_table.event_id IN (" + _CHANGED_EVENTS + ") "
+                 "AND es.event_status_id = (SELECT MAX(latest.event_status_id) FROM event_status latest "
+                 "WHERE latest.event_id = event_table.event_id AND latest.event_status_id <= :until) "
+                 "AND es.status IN :statuses", expanding=('statuses',))
+queries.register('all_event_statuses_for_vehicles',
+                 "SELECT sensors.vehicle_id, event_table.event_id, es.event_status_id, event_table.unique_id, "
+                 "event_table.event_type, es.severity, es.status, es.ts_created AS status_created_at "
+                 "FROM " + _SENSORS + " JOIN event_table ON event_table.unique_id = sensors.unique_id "
+                 "JOIN event_status es ON es.event_id = event_table.event_id",
+                 expanding=('vehicle_ids',))
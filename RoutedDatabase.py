@@ -0,0 +1,246 @@
+import copy
+import itertools
+import re
+import threading
+import time
+
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+
+from BulkWriter import BulkWriter
+
+_READ_ONLY = re.compile(r'^\s*(?:\(\s*)*(?:SELECT|WITH|SHOW|DESCRIBE|EXPLAIN)\b', re.IGNORECASE)
+
+
+class ReplicaStats:
+    """
+    Health and latency of one replica, updated by every read routed to it
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.outstanding = 0
+        self.calls = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.average_seconds = None
+        self.unhealthy_until = 0.0
+        self.last_error = None
+
+    def healthy(self, now):
+        return now >= self.unhealthy_until
+
+    def add(self, seconds):
+        self.calls += 1
+        self.total_seconds += seconds
+        # exponentially weighted, so the average follows a replica that slows down
+        self.average_seconds = seconds if self.average_seconds is None else 0.8 * self.average_seconds + 0.2 * seconds
+
+    def as_dict(self, now):
+        return {'name': self.name, 'healthy': self.healthy(now), 'outstanding': self.outstanding, 'calls': self.calls,
+                'errors': self.errors, 'total_seconds': self.total_seconds, 'average_seconds': self.average_seconds,
+                'last_error': self.last_error}
+
+
+class RoutedDatabase:
+    """
+    Database facade over one primary and any number of read replicas, usable as both read_database and write_database
+    of a Vehicle. Reads (run_query, read_frame, stream_query, read_frame_chunks and execute of SELECT statements) are
+    spread over the healthy replicas, writes go to the primary. After a write the reads of the same thread are pinned
+    to the primary for pin_seconds, so they see the write even if the replicas lag behind.
+
+    A replica whose connection fails is taken out of rotation for retry_after seconds and the read is retried on the
+    next replica, then on the primary. Errors of the query itself (syntax errors, constraint violations, ...) are
+    raised without touching the replica's health, see connection_failed. Anything else (engine, connection,
+    create_base_with_session, ...) is the primary's.
+
+    Example:
+        database = RoutedDatabase(primary, [replica_1, replica_2], strategy='least_outstanding')
+        vehicle = Vehicle(vehicle_id, read_database=database, write_database=database)
+        database.replica_stats()
+    """
+    strategies = ('round_robin', 'least_outstanding')
+
+    def __init__(self, primary, replicas=(), strategy='round_robin', pin_seconds=5.0, retry_after=30.0):
+        if strategy not in self.strategies:
+            raise ValueError("unknown strategy {0}".format(strategy))
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.strategy = strategy
+        self.pin_seconds = pin_seconds
+        self.retry_after = retry_after
+        self.stats = [ReplicaStats(self.replica_name(replica, index)) for index, replica in enumerate(self.replicas)]
+        self.primary_stats = ReplicaStats('primary')
+        self.rotation = itertools.count()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def __getattr__(self, name):
+        # only called for attributes RoutedDatabase does not define itself
+        if name in ('primary', 'replicas'):
+            raise AttributeError(name)
+        return getattr(self.primary, name)
+
+    def replica_name(self, replica, index):
+        return '{0}:{1}'.format(index, getattr(replica, 'db_name', None) or type(replica).__name__)
+
+    def run_query(self, raw_query, params=None):
+        return self.read('run_query', raw_query, params)
+
+    def read_frame(self, raw_query, params=None):
+        return self.read('read_frame', raw_query, params)
+
+    def stream_query(self, raw_query, params=None, chunk_size=1000):
+        return self.read_stream('stream_query', raw_query, params, chunk_size)
+
+    def read_frame_chunks(self, raw_query, params=None, chunk_size=10000):
+        return self.read_stream('read_frame_chunks', raw_query, params, chunk_size)
+
+    def run_statement(self, raw_query, params=None):
+        return self.write('run_statement', raw_query, params)
+
+    def execute(self, raw_query, params=None, connection=None):
+        if connection is None and self.is_read(raw_query):
+            return self.read('execute', raw_query, params)
+        return self.write('execute', raw_query, params, connection)
+
+    def worker_copy(self):
+        """
+        Returns a copy of this router over worker copies of the primary and every replica, so a worker thread (see
+        VehicleProcessor) has its own connections and its reads are still routed. Replica health, statistics, rotation
+        and pinning are shared with this router. Release it with close_connection.
+        """
+        worker = copy.copy(self)
+        worker.primary = self.primary.worker_copy()
+        worker.replicas = [replica.worker_copy() for replica in self.replicas]
+        return worker
+
+    def close_connection(self):
+        for database in [self.primary] + self.replicas:
+            database.close_connection()
+
+    def bulk_writer(self, batch_size=1000):
+        return BulkWriter(self, batch_size)
+
+    def pooled_connection(self):
+        self.mark_write()
+        return self.primary.pooled_connection()
+
+    def is_read(self, raw_query):
+        return bool(_READ_ONLY.match(str(raw_query)))
+
+    def mark_write(self):
+        self.local.last_write_at = time.monotonic()
+
+    def pinned_to_primary(self):
+        last_write_at = getattr(self.local, 'last_write_at', None)
+        return last_write_at is not None and time.monotonic() - last_write_at < self.pin_seconds
+
+    def write(self, method, *args):
+        try:
+            return getattr(self.primary, method)(*args)
+        finally:
+            self.mark_write()
+
+    def read(self, method, *args):
+        for database, stats in self.read_targets():
+            with self.lock:
+                stats.outstanding += 1
+            started_at = time.monotonic()
+            try:
+                result = getattr(database, method)(*args)
+            except DBAPIError as error:
+                if database is self.primary or not self.connection_failed(database, error):
+                    raise
+                self.mark_unhealthy(stats, error)
+                continue
+            finally:
+                with self.lock:
+                    stats.outstanding -= 1
+            with self.lock:
+                stats.add(time.monotonic() - started_at)
+            return result
+
+    def read_stream(self, method, raw_query, params, chunk_size):
+        """
+        Streams can't fail over once they yielded rows, so the replica is only chosen, not retried
+        """
+        database, stats = next(self.read_targets())
+        with self.lock:
+            stats.outstanding += 1
+        started_at = time.monotonic()
+        try:
+            yield from getattr(database, method)(raw_query, params, chunk_size)
+        except DBAPIError as error:
+            if database is not self.primary and self.connection_failed(database, error):
+                self.mark_unhealthy(stats, error)
+            raise
+        finally:
+            with self.lock:
+                stats.outstanding -= 1
+                stats.add(time.monotonic() - started_at)
+
+    def read_targets(self):
+        """
+        Yields (database, stats) to try in order: the healthy replicas as ordered by the strategy, then the primary
+        """
+        if not self.pinned_to_primary():
+            yield from self.ordered_replicas()
+        yield self.primary, self.primary_stats
+
+    def ordered_replicas(self):
+        now = time.monotonic()
+        with self.lock:
+            healthy = [index for index, stats in enumerate(self.stats) if stats.healthy(now)]
+            if not healthy:
+                return []
+            if self.strategy == 'round_robin':
+                start = next(self.rotation) % len(healthy)
+                order = healthy[start:] + healthy[:start]
+            else:
+                order = sorted(healthy, key=lambda index: (self.stats[index].outstanding,
+                                                           self.stats[index].average_seconds or 0.0))
+        return [(self.replicas[index], self.stats[index]) for index in order]
+
+    def connection_failed(self, database, error):
+        """
+        Whether error means database can't be reached, rather than that the statement is wrong. OperationalError is
+        both (a lost connection, but also a lock wait timeout, or any error on SQLite), so the replica is probed with
+        SELECT 1 and only counts as failed when that fails too.
+        """
+        if error.connection_invalidated or isinstance(error, InterfaceError):
+            return True
+        if not isinstance(error, OperationalError):
+            return False
+        try:
+            database.run_query('SELECT 1')
+        except DBAPIError:
+            return True
+        return False
+
+    def mark_unhealthy(self, stats, error):
+        with self.lock:
+            stats.errors += 1
+            stats.last_error = str(error.orig if getattr(error, 'orig', None) is not None else error)
+            stats.unhealthy_until = time.monotonic() + self.retry_after
+
+    def check_health(self):
+        """
+        Runs SELECT 1 on every replica, bringing back the ones that answer and taking out the ones that don't
+        :return: replica_stats()
+        """
+        for replica, stats in zip(self.replicas, self.stats):
+            started_at = time.monotonic()
+            try:
+                replica.run_query('SELECT 1')
+            except DBAPIError as error:
+                self.mark_unhealthy(stats, error)
+                continue
+            with self.lock:
+                stats.add(time.monotonic() - started_at)
+                stats.unhealthy_until = 0.0
+        return self.replica_stats()
+
+    def replica_stats(self):
+        now = time.monotonic()
+        with self.lock:
+            return [stats.as_dict(now) for stats in self.stats + [self.primary_stats]]
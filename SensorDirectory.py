@@ -0,0 +1,249 @@
+import threading
+import time
+from collections import namedtuple
+
+from Cache import database_key
+from Queries import queries
+
+SensorOwner = namedtuple('SensorOwner', ['vehicle_id', 'fleet_id'])
+
+
+class Batch:
+    """
+    Cache misses of several threads resolved by one query
+    """
+
+    def __init__(self):
+        self.unique_ids = []
+        self.done = threading.Event()
+        self.error = None
+
+
+class SensorDirectory:
+    """
+    Process wide map of the active unique_ids to their vehicle and fleet, for ingest paths that resolve a sensor per
+    message. Lookups are dict reads; misses are collected for batch_window seconds and resolved with one IN query, and
+    a sensor some thread is already resolving is waited for instead of queried again. Unknown sensors are remembered
+    for missing_ttl seconds. Like get_vehicle_id, a sensor active on several vehicles belongs to the one with its lowest
+    meta_data id.
+
+    refresh() keeps the directory current without a full reload: active meta_data rows above the id high water mark
+    are added, and vehicles whose number of active rows in the DB differs from the directory's (sensors deactivated
+    or reactivated) are reloaded.
+
+    Example:
+        directory = sensor_directory(read_database)
+        directory.load_all()  # optional, otherwise the directory fills up from misses
+        directory.lookup('3421_9DEC42')  # SensorOwner(vehicle_id=2527, fleet_id=7)
+        directory.refresh()  # every few minutes
+    """
+
+    def __init__(self, read_database, batch_window=0.002, missing_ttl=60.0, chunk_size=1000):
+        self.read_database = read_database
+        self.batch_window = batch_window
+        self.missing_ttl = missing_ttl
+        self.chunk_size = chunk_size
+        self.owners = {}
+        self.rows = {}
+        self.vehicle_rows = {}
+        self.fleets = {}
+        self.missing = {}
+        self.inflight = {}
+        self.open_batch = None
+        self.high_water_mark = None
+        self.lock = threading.Lock()
+        # counted without the lock to keep hits lock free, so approximate under concurrent lookups
+        self.stats = {'hits': 0, 'misses': 0, 'queries': 0}
+
+    def __len__(self):
+        return len(self.owners)
+
+    def lookup(self, unique_id):
+        """
+        :return: SensorOwner(vehicle_id, fleet_id), None when unique_id is not an active sensor
+        """
+        owner = self.owners.get(unique_id)
+        if owner is not None:
+            self.stats['hits'] += 1
+            return owner
+        return self.lookup_many([unique_id])[unique_id]
+
+    def vehicle_id(self, unique_id):
+        owner = self.lookup(unique_id)
+        return None if owner is None else owner.vehicle_id
+
+    def lookup_many(self, unique_ids):
+        """
+        :return: dict of unique_id to SensorOwner or None, all misses resolved with one query
+        """
+        owners = {}
+        misses = []
+        for unique_id in unique_ids:
+            owner = self.owners.get(unique_id)
+            if owner is None:
+                misses.append(unique_id)
+            owners[unique_id] = owner
+        self.stats['hits'] += len(owners) - len(misses)
+        if misses:
+            self.stats['misses'] += len(misses)
+            self.resolve(misses)
+            for unique_id in misses:
+                owners[unique_id] = self.owners.get(unique_id)
+        return owners
+
+    def resolve(self, unique_ids):
+        batches = set()
+        leader_batch = None
+        with self.lock:
+            now = time.monotonic()
+            for unique_id in unique_ids:
+                if unique_id in self.owners or self.missing.get(unique_id, 0) > now:
+                    continue
+                batch = self.inflight.get(unique_id)
+                if batch is None:
+                    if self.open_batch is None:
+                        self.open_batch = leader_batch = Batch()
+                    batch = self.open_batch
+                    batch.unique_ids.append(unique_id)
+                    self.inflight[unique_id] = batch
+                batches.add(batch)
+        if leader_batch is not None:
+            self.run_batch(leader_batch)
+        for batch in batches:
+            batch.done.wait()
+            if batch.error is not None:
+                raise batch.error
+
+    def run_batch(self, batch):
+        try:
+            if self.batch_window:
+                # lets the misses of other threads join this batch
+                time.sleep(self.batch_window)
+            with self.lock:
+                if self.open_batch is batch:
+                    self.open_batch = None
+                unique_ids = list(batch.unique_ids)
+            self.ensure_high_water_mark()
+            rows = []
+            for start in range(0, len(unique_ids), self.chunk_size):
+                rows.extend(self.query('active_sensor_owners_for_sensors',
+                                       {'unique_ids': unique_ids[start:start + self.chunk_size]}))
+            with self.lock:
+                self.add_rows(rows)
+                expires_at = time.monotonic() + self.missing_ttl
+                for unique_id in unique_ids:
+                    if unique_id not in self.owners:
+                        self.missing[unique_id] = expires_at
+        except Exception as error:
+            batch.error = error
+        finally:
+            with self.lock:
+                for unique_id in batch.unique_ids:
+                    if self.inflight.get(unique_id) is batch:
+                        del self.inflight[unique_id]
+            batch.done.set()
+
+    def query(self, name, params=None):
+        self.stats['queries'] += 1
+        # lookups run on the callers' threads, so every query checks out its own pooled connection
+        with self.read_database.pooled_connection() as connection:
+            return self.read_database.execute(queries[name], params, connection).fetchall()
+
+    def ensure_high_water_mark(self):
+        # taken before the first load, so refresh() also sees rows written while it ran
+        if self.high_water_mark is None:
+            self.high_water_mark = self.query('max_meta_data_id')[0][0] or 0
+
+    def load_all(self):
+        """
+        Loads every active sensor, streamed in chunks
+        :return: self
+        """
+        self.ensure_high_water_mark()
+        for rows in self.read_database.stream_query(queries['active_sensor_owners'], None, self.chunk_size * 10):
+            with self.lock:
+                self.add_rows(rows)
+        self.stats['queries'] += 1
+        return self
+
+    def refresh(self):
+        """
+        Applies meta_data changes since the last refresh
+        :return: dict with the number of new rows and of reloaded vehicles
+        """
+        self.ensure_high_water_mark()
+        since = self.high_water_mark
+        until = self.query('max_meta_data_id')[0][0] or 0
+        new_rows = self.query('active_sensor_owners_since', {'since': since, 'until': until}) if until > since else []
+        with self.lock:
+            self.add_rows(new_rows)
+        self.high_water_mark = max(since, until)
+
+        counts = {row.vehicle_id: row.sensors for row in self.query('active_sensor_counts')}
+        with self.lock:
+            changed = [vehicle_id for vehicle_id, rows in self.vehicle_rows.items()
+                       if counts.get(vehicle_id, 0) != len(rows)]
+        for start in range(0, len(changed), self.chunk_size):
+            vehicle_ids = changed[start:start + self.chunk_size]
+            rows = self.query('active_sensor_owners_for_vehicles', {'vehicle_ids': vehicle_ids})
+            with self.lock:
+                self.replace_vehicles(vehicle_ids, rows)
+        return {'new_rows': len(new_rows), 'reloaded_vehicles': len(changed)}
+
+    def forget_vehicle(self, vehicle_id):
+        """
+        Drops a vehicle right away, e.g. after deactivating its meta data in this process
+        """
+        with self.lock:
+            self.replace_vehicles([vehicle_id], [])
+
+    def add_rows(self, rows):
+        touched = set()
+        for row in rows:
+            self.rows.setdefault(row.unique_id, {})[row.id] = row.vehicle_id
+            self.vehicle_rows.setdefault(row.vehicle_id, set()).add((row.id, row.unique_id))
+            self.fleets[row.vehicle_id] = row.fleet_id
+            self.missing.pop(row.unique_id, None)
+            touched.add(row.unique_id)
+        self.update_owners(touched)
+
+    def replace_vehicles(self, vehicle_ids, rows):
+        touched = set()
+        for vehicle_id in vehicle_ids:
+            for meta_data_id, unique_id in self.vehicle_rows.pop(vehicle_id, ()):
+                self.rows[unique_id].pop(meta_data_id, None)
+                touched.add(unique_id)
+            self.fleets.pop(vehicle_id, None)
+        self.update_owners(touched)
+        self.add_rows(rows)
+
+    def update_owners(self, unique_ids):
+        for unique_id in unique_ids:
+            rows = self.rows.get(unique_id)
+            if not rows:
+                self.rows.pop(unique_id, None)
+                self.owners.pop(unique_id, None)
+                continue
+            vehicle_id = rows[min(rows)]
+            self.owners[unique_id] = SensorOwner(vehicle_id, self.fleets.get(vehicle_id))
+
+
+_directories = {}
+_directories_lock = threading.Lock()
+
+
+def sensor_directory(read_database, **options):
+    """
+    Returns the process wide SensorDirectory of read_database's DB, creating it on first use
+    """
+    key = database_key(read_database)
+    with _directories_lock:
+        directory = _directories.get(key)
+        if directory is None:
+            directory = _directories[key] = SensorDirectory(read_database, **options)
+    return directory
+
+
+def clear_sensor_directories():
+    with _directories_lock:
+        _directories.clear()
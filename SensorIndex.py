@@ -0,0 +1,125 @@
+import threading
+from collections import namedtuple
+
+from Queries import queries
+
+Sensor = namedtuple('Sensor', ['meta_data_id', 'vehicle_id', 'unique_id', 'wheel_position', 'set_point', 'type',
+                               'active'])
+
+
+class SensorIndex:
+    """
+    In memory index of the meta_data rows of some vehicles or a whole fleet, loaded with one query, so the per sensor
+    lookups of Vehicle (get_meta_data_id, get_sensor_wheel_position, get_vehicle_id, get_active_sensors) are dict
+    lookups instead of round trips. Lookups answer exactly like the queries they replace: the meta data id of a
+    sensor is the highest active id, the vehicle of a sensor the one with its lowest active id.
+
+    Example:
+        index = SensorIndex(read_database).load_fleet(fleet_id)
+        vehicle.use_sensor_index(index)
+        index.wheel_positions(unique_ids)  # {'3421_9DEC42': 'L2OT', ...}
+    """
+
+    def __init__(self, read_database):
+        self.read_database = read_database
+        self.vehicle_ids = set()
+        self.sensors = {}
+        self.meta_data_ids = {}
+        self.first_active = {}
+        self.active_sensors_of_vehicle = {}
+        self.lock = threading.Lock()
+
+    def load_vehicles(self, vehicle_ids):
+        vehicle_ids = [int(vehicle_id) for vehicle_id in dict.fromkeys(vehicle_ids)]
+        if vehicle_ids:
+            rows = self.read_database.run_query(queries['sensor_index_for_vehicles'], {'vehicle_ids': vehicle_ids})
+            self.add(vehicle_ids, rows)
+        return self
+
+    def load_fleet(self, fleet_id):
+        vehicle_ids = [row.vehicle_id for row in
+                       self.read_database.run_query(queries['vehicle_ids_for_fleet'], {'fleet_id': fleet_id})]
+        rows = self.read_database.run_query(queries['sensor_index_for_fleet'], {'fleet_id': fleet_id})
+        self.add(vehicle_ids, rows)
+        return self
+
+    def add(self, vehicle_ids, rows):
+        """
+        Replaces the entries of vehicle_ids with rows, which have to be in meta_data id order
+        """
+        with self.lock:
+            self.discard(vehicle_ids)
+            for vehicle_id in vehicle_ids:
+                self.vehicle_ids.add(vehicle_id)
+                self.active_sensors_of_vehicle[vehicle_id] = []
+            for row in rows:
+                sensor = Sensor(row.id, row.vehicle_id, row.unique_id, row.wheel_position, row.set_point, row.type,
+                                bool(row.active))
+                self.sensors[sensor.meta_data_id] = sensor
+                if not sensor.active:
+                    continue
+                self.meta_data_ids[(sensor.vehicle_id, sensor.unique_id)] = sensor.meta_data_id
+                self.index_first_active(sensor)
+                # same filter and order as Vehicle.get_active_sensors
+                if sensor.type != 'P':
+                    self.active_sensors_of_vehicle.setdefault(sensor.vehicle_id, []).append(sensor.unique_id)
+
+    def drop(self, vehicle_ids):
+        """
+        Removes vehicles from the index, e.g. after their meta_data changed; their lookups go back to the DB
+        """
+        with self.lock:
+            self.discard(vehicle_ids)
+
+    def discard(self, vehicle_ids):
+        vehicle_ids = set(vehicle_ids) & self.vehicle_ids
+        if not vehicle_ids:
+            return
+        self.vehicle_ids -= vehicle_ids
+        self.sensors = {key: sensor for key, sensor in self.sensors.items() if sensor.vehicle_id not in vehicle_ids}
+        self.meta_data_ids = {key: value for key, value in self.meta_data_ids.items() if key[0] not in vehicle_ids}
+        for vehicle_id in vehicle_ids:
+            self.active_sensors_of_vehicle.pop(vehicle_id, None)
+        self.first_active = {}
+        for sensor in self.sensors.values():
+            if sensor.active:
+                self.index_first_active(sensor)
+
+    def index_first_active(self, sensor):
+        first = self.first_active.get(sensor.unique_id)
+        if first is None or sensor.meta_data_id < first.meta_data_id:
+            self.first_active[sensor.unique_id] = sensor
+
+    def covers(self, vehicle_id):
+        return vehicle_id in self.vehicle_ids
+
+    def meta_data_id(self, vehicle_id, unique_id):
+        return self.meta_data_ids.get((vehicle_id, unique_id))
+
+    def sensor(self, vehicle_id, unique_id):
+        """
+        :return: Sensor of the active meta_data row of unique_id on vehicle_id, None when there is none
+        """
+        return self.sensors.get(self.meta_data_id(vehicle_id, unique_id))
+
+    def wheel_position(self, vehicle_id, unique_id):
+        sensor = self.sensor(vehicle_id, unique_id)
+        return None if sensor is None else sensor.wheel_position
+
+    def vehicle_id(self, unique_id):
+        first = self.first_active.get(unique_id)
+        return None if first is None else first.vehicle_id
+
+    def active_sensors(self, vehicle_id):
+        return list(self.active_sensors_of_vehicle.get(vehicle_id, ()))
+
+    def wheel_positions(self, unique_ids, vehicle_id=None):
+        """
+        Bulk wheel positions for enrichment jobs, the sensors' own vehicles are used when vehicle_id is None
+        :return: dict of unique_id to wheel position, None for sensors that are not active in the index
+        """
+        positions = {}
+        for unique_id in unique_ids:
+            owner = self.vehicle_id(unique_id) if vehicle_id is None else vehicle_id
+            positions[unique_id] = self.wheel_position(owner, unique_id)
+        return positions
@@ -0,0 +1,402 @@
+import csv
+import re
+import time
+
+import sqlalchemy
+from sqlalchemy.exc import IntegrityError
+
+_DELIMITER_COMMAND = re.compile(r'^\s*DELIMITER\s+(\S+)\s*$', re.IGNORECASE)
+_INSERT = re.compile(r'^\s*(INSERT\s+(?:IGNORE\s+|OR\s+\w+\s+)?INTO\s+\S+\s*(?:\([^)]*\))?\s*VALUES)\s*(\(.*\))\s*$',
+                     re.IGNORECASE | re.DOTALL)
+# an INSERT with any of these can't have its VALUES list merged with another statement's
+_NOT_MERGEABLE = re.compile(r'\bON\s+DUPLICATE\b|\bRETURNING\b|\bON\s+CONFLICT\b', re.IGNORECASE)
+# sent to the driver untouched: no bind parameter parsing, and no '%' interpolation by format style drivers
+_RAW = {'no_parameters': True}
+
+# MySQL statements without an SQLite equivalent that don't change the data, skipped by translate_mysql_to_sqlite
+_SQLITE_SKIPPED = re.compile(r'^\s*(?:/\*!|SET\s|LOCK\s+TABLES|UNLOCK\s+TABLES|USE\s|CREATE\s+DATABASE|DROP\s+DATABASE|'
+                             r'ALTER\s+TABLE\s+\S+\s+(?:DISABLE|ENABLE)\s+KEYS)', re.IGNORECASE)
+_CREATE_TABLE = re.compile(r'^\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?([`"\w.]+)\s*\((.*)\)[^)]*$',
+                           re.IGNORECASE | re.DOTALL)
+_MYSQL_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'", re.DOTALL)
+_MYSQL_ESCAPES = {'0': '\0', 'b': '\b', 'n': '\n', 'r': '\r', 't': '\t', 'Z': '\x1a'}
+_KEY = re.compile(r'^(UNIQUE\s+|FULLTEXT\s+|SPATIAL\s+)?(?:KEY|INDEX)\s+([`"\w]+)\s*(?:USING\s+\w+\s*)?\((.*)\)',
+                  re.IGNORECASE | re.DOTALL)
+_UNIQUE_KEY = re.compile(r'^UNIQUE\s+(?:KEY|INDEX)\s+[`"\w]+\s*', re.IGNORECASE)
+_PRIMARY_KEY = re.compile(r'^PRIMARY\s+KEY\s*\(\s*([`"\w]+)\s*\)', re.IGNORECASE)
+_COLUMN_NOISE = re.compile(r"\s+(?:(?:UNSIGNED|ZEROFILL|CHARACTER\s+SET\s+\w+|CHARSET\s+\w+|COLLATE\s+\w+|"
+                           r"AUTO_INCREMENT|ON\s+UPDATE\s+CURRENT_TIMESTAMP)\b(?:\(\d*\))?|COMMENT\s+'(?:[^'\\]|\\.|'')*')",
+                           re.IGNORECASE)
+_ENUM = re.compile(r"\b(?:ENUM|SET)\s*\((?:[^()']|'(?:[^'\\]|\\.|'')*')*\)", re.IGNORECASE)
+_INSERT_IGNORE = re.compile(r'^(\s*)INSERT\s+IGNORE\s+INTO', re.IGNORECASE)
+
+
+def iter_sql_statements(lines, backslash_escapes=True, hash_comments=True):
+    """
+    Splits a SQL script into statements while reading it, so the whole file never has to be in memory. Semicolons
+    inside string literals, quoted identifiers and comments don't end a statement, comments are dropped (except MySQL's
+    /*! ... */ executable comments) and DELIMITER lines from mysqldump are honoured.
+    :param lines: iterable of lines, e.g. an open file
+    :param backslash_escapes: MySQL style \\' escapes inside string literals, set to False for Postgres
+    :param hash_comments: MySQL style # comments, set to False for Postgres where # is an operator
+    :return: generator of statements without their trailing delimiter
+    """
+    delimiter = ';'
+    outside = _outside_quotes_pattern(delimiter, hash_comments)
+    inside = {quote_character: re.compile(r'\\|' + quote_character if backslash_escapes else quote_character)
+              for quote_character in ("'", '"', '`')}
+    statement = []
+    # whether statement holds anything but whitespace, so it isn't joined again for every line
+    has_content = False
+    quote = None
+    block_comment = None
+
+    def keep(text):
+        nonlocal has_content
+        statement.append(text)
+        if not has_content and text.strip():
+            has_content = True
+
+    for line in lines:
+        if quote is None and block_comment is None and not has_content:
+            delimiter_command = _DELIMITER_COMMAND.match(line)
+            if delimiter_command:
+                delimiter = delimiter_command.group(1)
+                outside = _outside_quotes_pattern(delimiter, hash_comments)
+                statement = []
+                has_content = False
+                continue
+
+        position = 0
+        while position < len(line):
+            if block_comment is not None:
+                end = line.find('*/', position)
+                if end == -1:
+                    if block_comment == 'keep':
+                        keep(line[position:])
+                    break
+                if block_comment == 'keep':
+                    keep(line[position:end + 2])
+                position = end + 2
+                block_comment = None
+            elif quote is not None:
+                match = inside[quote].search(line, position)
+                if match is None:
+                    keep(line[position:])
+                    break
+                if match.group() == '\\':
+                    keep(line[position:match.end() + 1])
+                    position = match.end() + 1
+                elif line.startswith(quote, match.end()):
+                    # doubled quote, e.g. 'it''s'
+                    keep(line[position:match.end() + 1])
+                    position = match.end() + 1
+                else:
+                    keep(line[position:match.end()])
+                    position = match.end()
+                    quote = None
+            else:
+                match = outside.search(line, position)
+                if match is None:
+                    keep(line[position:])
+                    break
+                token = match.group()
+                if token in ("'", '"', '`'):
+                    keep(line[position:match.end()])
+                    position = match.end()
+                    quote = token
+                elif token == '--' or token == '#':
+                    keep(line[position:match.start()] + '\n')
+                    break
+                elif token == '/*':
+                    keep(line[position:match.start()])
+                    position = match.end()
+                    if line.startswith('!', position):
+                        keep('/*')
+                        block_comment = 'keep'
+                    else:
+                        block_comment = 'drop'
+                else:
+                    keep(line[position:match.start()])
+                    position = match.end()
+                    if has_content:
+                        yield ''.join(statement).strip()
+                    statement = []
+                    has_content = False
+
+    if has_content:
+        yield ''.join(statement).strip()
+
+
+def _outside_quotes_pattern(delimiter, hash_comments):
+    # MySQL only treats -- as a comment when it is followed by whitespace or the end of the line
+    tokens = ["'", '"', '`', r'--(?=\s|$)', r'/\*', re.escape(delimiter)]
+    if hash_comments:
+        tokens.append('#')
+    return re.compile('|'.join(tokens))
+
+
+def translate_mysql_to_sqlite(statement):
+    """
+    Rewrites one statement of a MySQL script (schema dumps and INSERT fixtures) for SQLite: backslash escapes in string
+    literals become standard SQL, CREATE TABLE loses its table options and MySQL only column attributes, AUTO_INCREMENT
+    primary keys become INTEGER PRIMARY KEY AUTOINCREMENT and plain KEYs become CREATE INDEX statements. SET, LOCK
+    TABLES, USE, executable comments and the like are dropped.
+    :return: list of SQLite statements, empty when the statement has no SQLite equivalent
+    """
+    if _SQLITE_SKIPPED.match(statement):
+        return []
+    statement = _MYSQL_STRING.sub(_sqlite_string, statement)
+    statement = _INSERT_IGNORE.sub(r'\1INSERT OR IGNORE INTO', statement)
+    create_table = _CREATE_TABLE.match(statement)
+    if create_table is None:
+        return [statement]
+
+    table_name = create_table.group(1)
+    items = _split_top_level(create_table.group(2))
+    auto_increment = [item.split()[0] for item in items if re.search(r'\bAUTO_INCREMENT\b', item, re.IGNORECASE)]
+    columns = []
+    indexes = []
+    for item in items:
+        key = _KEY.match(item)
+        primary_key = _PRIMARY_KEY.match(item)
+        if _UNIQUE_KEY.match(item):
+            columns.append(_UNIQUE_KEY.sub('UNIQUE ', item))
+        elif key is not None:
+            # index names are per table in MySQL but per database in SQLite; prefix lengths like (191) are dropped
+            indexes.append('CREATE INDEX IF NOT EXISTS `{0}_{1}` ON {2} ({3})'.format(
+                table_name.strip('`"'), key.group(2).strip('`"'), table_name, re.sub(r'\(\d+\)', '', key.group(3))))
+        elif primary_key is not None and primary_key.group(1) in auto_increment:
+            continue
+        elif item.split()[0] in auto_increment:
+            columns.append('{0} INTEGER PRIMARY KEY AUTOINCREMENT'.format(item.split()[0]))
+        else:
+            columns.append(_ENUM.sub('TEXT', _COLUMN_NOISE.sub('', item)))
+    return ['CREATE TABLE {0} (\n  {1}\n)'.format(table_name, ',\n  '.join(columns))] + indexes
+
+
+def _sqlite_string(match):
+    literal = match.group()[1:-1]
+    if '\\' not in literal:
+        return match.group()
+    characters = []
+    position = 0
+    while position < len(literal):
+        character = literal[position]
+        if character == '\\' and position + 1 < len(literal):
+            characters.append(_MYSQL_ESCAPES.get(literal[position + 1], literal[position + 1]))
+            position += 2
+        elif character == "'":
+            # a doubled quote, the tokenizer only lets them through in pairs
+            characters.append("'")
+            position += 2
+        else:
+            characters.append(character)
+            position += 1
+    return "'{0}'".format(''.join(characters).replace("'", "''"))
+
+
+def _split_top_level(body):
+    """
+    Splits the body of a CREATE TABLE on the commas that are not inside parentheses or quotes
+    """
+    items = []
+    depth = 0
+    quote = None
+    current = []
+    for character in body:
+        if quote is not None:
+            if character == quote:
+                quote = None
+        elif character in ("'", '"', '`'):
+            quote = character
+        elif character == '(':
+            depth += 1
+        elif character == ')':
+            depth -= 1
+        elif character == ',' and depth == 0:
+            items.append(''.join(current).strip())
+            current = []
+            continue
+        current.append(character)
+    if ''.join(current).strip():
+        items.append(''.join(current).strip())
+    return items
+
+
+class LoadReport:
+    def __init__(self):
+        self.statements = 0
+        self.rows = 0
+        self.transactions = 0
+        self.errors = []
+        self.started_at = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return "LoadReport(statements={0}, rows={1}, transactions={2}, errors={3}, elapsed={4:.2f}s, " \
+               "rows_per_second={5:.0f})".format(self.statements, self.rows, self.transactions, len(self.errors),
+                                                 self.elapsed, self.rows_per_second)
+
+
+class SqlScriptLoader:
+    """
+    Streams a SQL script into a database. Consecutive INSERTs into the same table and columns are merged into
+    multi row INSERTs, and INSERTs are committed in transactions of batch_size statements instead of one by one. Anything
+    else (DDL, SET, ...) runs on its own. If a batch fails on an IntegrityError it is rolled back and replayed one
+    statement at a time, so only the offending statements are skipped and reported in LoadReport.errors.
+
+    Note: on connections with AUTOCOMMIT isolation (LocalPG) the batches are not transactional, only merged.
+    """
+
+    def __init__(self, connection, batch_size=1000, rows_per_insert=500, max_insert_bytes=1024 * 1024,
+                 backslash_escapes=True, hash_comments=True, translate=None):
+        """
+        :param batch_size: INSERT statements per transaction
+        :param rows_per_insert: maximum number of INSERT statements merged into one multi row INSERT
+        :param max_insert_bytes: maximum size of a merged INSERT, keep it below MySQL's max_allowed_packet
+        :param translate: optional function mapping each statement of the script to a list of statements to run
+        instead, e.g. translate_mysql_to_sqlite
+        """
+        self.connection = connection
+        self.batch_size = batch_size
+        self.rows_per_insert = rows_per_insert
+        self.max_insert_bytes = max_insert_bytes
+        self.backslash_escapes = backslash_escapes
+        self.hash_comments = hash_comments
+        self.translate = translate
+
+    def load(self, sql_file_path):
+        with open(sql_file_path, 'r') as sql_file:
+            statements = iter_sql_statements(sql_file, self.backslash_escapes, self.hash_comments)
+            if self.translate is not None:
+                statements = (translated for statement in statements for translated in self.translate(statement))
+            return self.load_statements(statements)
+
+    def load_statements(self, statements):
+        report = LoadReport()
+        batch = []
+        for statement in statements:
+            report.statements += 1
+            if _INSERT.match(statement) is None:
+                self.run_batch(batch, report)
+                batch = []
+                self.execute_one(statement, report)
+                continue
+            batch.append(statement)
+            if len(batch) >= self.batch_size:
+                self.run_batch(batch, report)
+                batch = []
+        self.run_batch(batch, report)
+        report.elapsed = time.perf_counter() - report.started_at
+        return report
+
+    def run_batch(self, statements, report):
+        if not statements:
+            return
+        try:
+            with self.connection.begin():
+                rows = 0
+                for merged in self.merge_inserts(statements):
+                    rows += max(self.connection.exec_driver_sql(merged, execution_options=_RAW).rowcount, 0)
+            report.rows += rows
+            report.transactions += 1
+        except IntegrityError:
+            for statement in statements:
+                self.execute_one(statement, report)
+
+    def execute_one(self, statement, report):
+        try:
+            result = self.connection.exec_driver_sql(statement, execution_options=_RAW)
+            if _INSERT.match(statement):
+                report.rows += max(result.rowcount, 0)
+        except IntegrityError as err:
+            report.errors.append((statement, err))
+
+    def merge_inserts(self, statements):
+        """
+        Turns consecutive "INSERT INTO t (...) VALUES (...)" statements with the same prefix into one statement
+        """
+        prefix = None
+        values = []
+        size = 0
+        for statement in statements:
+            match = _INSERT.match(statement)
+            if _NOT_MERGEABLE.search(statement):
+                if values:
+                    yield prefix + ' ' + ','.join(values)
+                prefix, values, size = None, [], 0
+                yield statement
+                continue
+            statement_prefix, statement_values = match.group(1), match.group(2)
+            if values and (statement_prefix != prefix or len(values) >= self.rows_per_insert
+                           or size + len(statement_values) > self.max_insert_bytes):
+                yield prefix + ' ' + ','.join(values)
+                values, size = [], 0
+            prefix = statement_prefix
+            values.append(statement_values)
+            size += len(statement_values)
+        if values:
+            yield prefix + ' ' + ','.join(values)
+
+    def load_csv(self, csv_file_path, table, columns=None, delimiter=',', header=True):
+        """
+        Bulk loads a CSV file into table, using LOAD DATA LOCAL INFILE on MySQL (the engine needs
+        connect_args={'local_infile': True}), COPY on Postgres and batched executemany everywhere else.
+        :param columns: column names in file order, read from the header line when not given
+        """
+        report = LoadReport()
+        if columns is None:
+            with open(csv_file_path, newline='') as csv_file:
+                columns = next(csv.reader(csv_file, delimiter=delimiter))
+                header = True
+        column_list = ', '.join(columns)
+        dialect = self.connection.dialect.name
+
+        if dialect == 'mysql':
+            statement = "LOAD DATA LOCAL INFILE '{0}' INTO TABLE {1} FIELDS TERMINATED BY '{2}' " \
+                        "OPTIONALLY ENCLOSED BY '\"' LINES TERMINATED BY '\\n' {3}({4})".format(
+                            csv_file_path, table, delimiter, 'IGNORE 1 LINES ' if header else '', column_list)
+            report.rows = max(self.connection.exec_driver_sql(statement, execution_options=_RAW).rowcount, 0)
+            report.statements = 1
+        elif dialect == 'postgresql':
+            statement = "COPY {0} ({1}) FROM STDIN WITH (FORMAT csv, DELIMITER '{2}', HEADER {3})".format(
+                table, column_list, delimiter, 'true' if header else 'false')
+            dbapi_connection = self.connection.connection
+            with open(csv_file_path, newline='') as csv_file:
+                cursor = dbapi_connection.cursor()
+                cursor.copy_expert(statement, csv_file)
+                report.rows = cursor.rowcount
+                cursor.close()
+            dbapi_connection.commit()
+            report.statements = 1
+        else:
+            insert = sqlalchemy.text("INSERT INTO {0} ({1}) VALUES ({2})".format(
+                table, column_list, ', '.join(':c{0}'.format(i) for i in range(len(columns)))))
+            with open(csv_file_path, newline='') as csv_file:
+                reader = csv.reader(csv_file, delimiter=delimiter)
+                if header:
+                    next(reader, None)
+                rows = []
+                for row in reader:
+                    rows.append({'c{0}'.format(i): value for i, value in enumerate(row)})
+                    if len(rows) >= self.batch_size:
+                        self.executemany(insert, rows, report)
+                        rows = []
+                self.executemany(insert, rows, report)
+
+        report.elapsed = time.perf_counter() - report.started_at
+        return report
+
+    def executemany(self, statement, rows, report):
+        if not rows:
+            return
+        with self.connection.begin():
+            self.connection.execute(statement, rows)
+        report.statements += 1
+        report.transactions += 1
+        report.rows += len(rows)
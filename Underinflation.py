@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+SEVERITIES = ['CRITICAL', 'MAJOR', 'MINOR']
+DEFAULT_THRESHOLDS = {'critical': 0.6, 'major': 0.8, 'minor': 0.85}
+
+
+def classify_underinflation(readings, set_points, offsets=None, thresholds=None):
+    """
+    Assigns an underinflation severity to every pressure reading at once. A reading's pressure minus its sensor's
+    pressure offset, divided by the sensor's set point, is compared with the thresholds of the sensor's fleet:
+    below critical is CRITICAL, below major MAJOR, below minor MINOR, anything else (and sensors without a set point,
+    e.g. the pump) gets no severity.
+    :param readings: DataFrame with unique_id and pressure columns, any other columns are kept
+    :param set_points: DataFrame with unique_id and set_point, and fleet_id when thresholds differ per fleet
+    :param offsets: DataFrame with unique_id and pressure_offset, no offset is applied when None
+    :param thresholds: dict of fleet_id to {'critical', 'major', 'minor'} ratios, as returned by
+    Vehicle.get_custom_underinflation_thresholds; the None entry (or DEFAULT_THRESHOLDS) applies to every other fleet
+    :return: copy of readings with set_point, pressure_offset, pressure_ratio and severity (categorical) columns
+    """
+    thresholds = thresholds or {}
+    sensors = set_points.drop_duplicates('unique_id', keep='last')
+    sensor_rows = pd.Index(sensors.unique_id).get_indexer(readings.unique_id)
+    known = sensor_rows >= 0
+
+    set_point = np.full(len(readings), np.nan)
+    set_point[known] = sensors.set_point.to_numpy(dtype='float64')[sensor_rows[known]]
+
+    pressure_offset = np.zeros(len(readings))
+    if offsets is not None and len(offsets):
+        offsets = offsets.drop_duplicates('unique_id', keep='last')
+        offset_rows = pd.Index(offsets.unique_id).get_indexer(readings.unique_id)
+        has_offset = offset_rows >= 0
+        pressure_offset[has_offset] = offsets.pressure_offset.to_numpy(dtype='float64')[offset_rows[has_offset]]
+
+    critical, major, minor = threshold_arrays(sensors, sensor_rows, known, thresholds)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = (readings.pressure.to_numpy(dtype='float64') - pressure_offset) / set_point
+    ratio[~(set_point > 0)] = np.nan
+
+    # np.select takes the first matching condition, so the most severe one wins
+    severity = np.select([ratio < critical, ratio < major, ratio < minor], SEVERITIES, default=None)
+
+    classified = readings.copy()
+    classified['set_point'] = set_point
+    classified['pressure_offset'] = pressure_offset
+    classified['pressure_ratio'] = ratio
+    classified['severity'] = pd.Categorical(severity, categories=SEVERITIES)
+    return classified
+
+
+def threshold_arrays(sensors, sensor_rows, known, thresholds):
+    """
+    critical, major and minor ratio per reading, looked up by the fleet of the reading's sensor
+    """
+    default = thresholds.get(None, DEFAULT_THRESHOLDS)
+    fleet_ids = [fleet_id for fleet_id in thresholds if fleet_id is not None]
+    # position 0 holds the default, fleet i of fleet_ids is at i + 1
+    table = np.array([[default[level] for level in ('critical', 'major', 'minor')]] +
+                     [[thresholds[fleet_id][level] for level in ('critical', 'major', 'minor')]
+                      for fleet_id in fleet_ids], dtype='float64')
+    threshold_rows = np.zeros(len(sensor_rows), dtype='int64')
+    if fleet_ids and 'fleet_id' in sensors:
+        sensor_thresholds = pd.Index(fleet_ids).get_indexer(sensors.fleet_id) + 1
+        threshold_rows[known] = sensor_thresholds[sensor_rows[known]]
+    return table[threshold_rows, 0], table[threshold_rows, 1], table[threshold_rows, 2]
+
+
+def classify_pressure(pressure, set_point, pressure_offset=0.0, thresholds=None):
+    """
+    Severity of a single reading, the same rules as classify_underinflation
+    """
+    thresholds = thresholds or DEFAULT_THRESHOLDS
+    if not set_point or set_point <= 0:
+        return None
+    ratio = (pressure - pressure_offset) / set_point
+    if ratio < thresholds['critical']:
+        return 'CRITICAL'
+    if ratio < thresholds['major']:
+        return 'MAJOR'
+    if ratio < thresholds['minor']:
+        return 'MINOR'
+    return None
@@ -1,9 +1,17 @@
 from datetime import datetime, timedelta
-import pandas
 import pandas as pd
 import json
 import warnings
 
+from Cache import cached, database_key, invalidates, invalidate, prime, reference_data_cache
+from OpenEvents import load_open_vehicle_events, open_events_for_vehicle
+from Queries import queries
+from SensorIndex import SensorIndex
+
+# cached results that depend on the meta_data rows of the vehicle
+META_DATA_CACHES = ('load_sensors_and_set_points', 'get_sensor_pressure_offsets', 'get_meta_data_id',
+                    'get_sensor_wheel_position', 'get_sensor_index')
+
 
 class Vehicle:
     def __init__(self, vehicle_id=None, read_database=None, write_database=None, logger=None):
@@ -22,13 +30,39 @@ class Vehicle:
         self.fleet_name = None
         self.fleet_vehicle_id = None
         self.meta_data_id = None
+        self.sensor_index = None
         self.logger = logger
+        self.method_cache = {}
+
+    @classmethod
+    def load_many(cls, vehicle_ids, read_database, write_database=None, logger=None, start_of_analysis_date=None):
+        """
+        Builds Vehicles for all vehicle_ids with a few set based queries, see VehicleBatch
+        :return: VehicleBatch, iterable over the hydrated Vehicles and indexable by vehicle_id
+        """
+        from VehicleBatch import VehicleBatch
+        return VehicleBatch(read_database, write_database, logger).load(vehicle_ids, start_of_analysis_date)
+
+    @classmethod
+    def for_sensor(cls, unique_id, read_database, write_database=None, logger=None, directory=None):
+        """
+        Vehicle of an active sensor, resolved through the process wide SensorDirectory instead of a query per call
+        :return: Vehicle with vehicle_id and fleet_id set, None when unique_id is not an active sensor
+        """
+        from SensorDirectory import sensor_directory
+        owner = (directory or sensor_directory(read_database)).lookup(unique_id)
+        if owner is None:
+            return None
+        vehicle = cls(owner.vehicle_id, read_database, write_database, logger)
+        vehicle.fleet_id = owner.fleet_id
+        return vehicle
 
     def get_vehicle_id(self, unique_id):
+        if self.vehicle_id is None and self.sensor_index is not None:
+            self.vehicle_id = self.sensor_index.vehicle_id(unique_id)
         if self.vehicle_id is None:
-            vehicle_id_query = "select vehicle_id from meta_data where unique_id = '{0}' and active = 1".format(
-                unique_id)
-            vehicle_id_result = self.read_database.run_query(vehicle_id_query)
+            vehicle_id_result = self.read_database.run_query(queries['vehicle_id_for_sensor'],
+                                                             {'unique_id': unique_id})
 
             self.vehicle_id = vehicle_id_result[0][0]
 
@@ -36,43 +70,65 @@ class Vehicle:
 
     def get_vehicle_type(self):
         if self.vehicle_type is None:
-            query = "SELECT vehicle_type FROM vehicle_meta_data WHERE vehicle_id = {0}".format(self.vehicle_id)
-            vehicle_type_result = self.read_database.run_query(query)
+            vehicle_type_result = self.read_database.run_query(queries['vehicle_type'], {'vehicle_id': self.vehicle_id})
             self.vehicle_type = vehicle_type_result[-1][0]
         return self.vehicle_type
 
     def get_sensors_and_setpoints(self, active=False, exclude_pump=True):
-        return self.get_sensors_and_set_points_with_parameters(active, exclude_pump, self.set_points)
+        self.set_points = self.get_sensors_and_set_points_with_parameters(active, exclude_pump)
+        return self.set_points
 
-    def get_sensors_and_set_points_with_parameters(self, active, exclude_pump, set_point_attribute):
+    def get_sensors_and_set_points_with_parameters(self, active, exclude_pump, set_point_attribute=None):
         if set_point_attribute is None:
-            query = self.sensor_set_point_query_generator(active, exclude_pump)
-
-            self.sensors = self.read_database.run_query(query)
-            # Returns a dataframe that contains a table of unique_id's in the first column and set_points in the 2nd column
-            set_point_attribute = pd.DataFrame(self.sensors, columns=['unique_id', 'set_point'])
+            set_point_attribute = self.load_sensors_and_set_points(active, exclude_pump)
         return set_point_attribute
 
+    @cached('active', 'exclude_pump',
+            attributes=('set_points', 'active_set_points', 'sensors', 'active_sensors', 'open_vehicle_events'))
+    def load_sensors_and_set_points(self, active, exclude_pump):
+        query = self.sensor_set_point_query_generator(active, exclude_pump)
+
+        self.sensors = self.read_database.run_query(query, {'vehicle_id': self.vehicle_id})
+        # Returns a dataframe that contains a table of unique_id's in the first column and set_points in the 2nd column
+        return pd.DataFrame(self.sensors, columns=['unique_id', 'set_point'])
+
     def sensor_set_point_query_generator(self, active, exclude_pump):
-        query = "SELECT unique_id, set_point FROM meta_data WHERE vehicle_id = {0}".format(self.vehicle_id)
-        #dont forget spaces are important when concatenating strings
+        # one registered statement per filter combination, each takes :vehicle_id
+        name = 'sensors_and_set_points'
         if active is True:
-            query = query + " and active = 1"
+            name = 'active_' + name
         if exclude_pump is True:
-            query = query + " and type != 'P'"
-        return query
+            name = name + '_without_pump'
+        return queries[name]
 
     def get_active_sensors_and_setpoints(self, active=True, exclude_pump=True):
-        return self.get_sensors_and_set_points_with_parameters(active, exclude_pump, self.active_set_points)
+        set_points = self.get_sensors_and_set_points_with_parameters(active, exclude_pump)
+        if active is True and exclude_pump is True:
+            self.active_set_points = set_points
+        return set_points
 
+    # '2021-02-01', date(2021, 2, 1) and datetime(2021, 2, 1) are the same analysis date
+    @cached('start_of_analysis_date', attributes=('offsets',), normalize={'start_of_analysis_date': pd.Timestamp})
     def get_sensor_pressure_offsets(self,start_of_analysis_date):
-        if self.offsets is None:
-            unique_id_string = "','".join(self.get_active_sensors())
-            query = "select date,pressure_offset,unique_id from leak_detection_pressure_offsets where unique_id in ('{0}') and date = '{1}'".format(unique_id_string, start_of_analysis_date)
-            offsets_result = self.read_database.run_query(query)
-            self.offsets = pd.DataFrame(offsets_result, columns=['date', 'pressure_offset', 'unique_id'])
+        offsets_result = self.read_database.run_query(queries['offsets_for_sensors'],
+                                                      {'unique_ids': self.get_active_sensors(),
+                                                       'date': start_of_analysis_date})
+        self.offsets = pd.DataFrame(offsets_result, columns=['date', 'pressure_offset', 'unique_id'])
         return self.offsets
 
+    def invalidate(self, *method_names):
+        """
+        Drops cached results of the given @cached methods, or of all of them when none are given, so the next call
+        goes back to the DB. Write methods decorated with @invalidates call this automatically.
+        """
+        invalidate(self, *method_names)
+
+    def prime_cache(self, method_name, value, **kwargs):
+        """
+        Stores value as the cached result of method_name(**kwargs), used by batch loaders to skip per vehicle queries
+        """
+        prime(self, method_name, value, **kwargs)
+
     def get_max_and_min_setpoints(self):
         # this is a stub, and we will add in functionality for this once we decide on how to implement the max
         # and min setpoints lookup
@@ -80,8 +136,9 @@ class Vehicle:
         return max(setpoints_lookup), min(setpoints_lookup)
 
     def get_cycle_number(self):
-        query = "SELECT cycle_number FROM meta_data WHERE vehicle_id = {}".format(self.vehicle_id)
-        self.cycle_number = self.read_database.connection.execute(query).first().cycle_number
+        # not cached, it is read again after writes such as the cycle rollover
+        self.cycle_number = self.read_database.execute(queries['cycle_number'],
+                                                       {'vehicle_id': self.vehicle_id}).first().cycle_number
         return self.cycle_number
 
     def get_zip_files_in_json_ETL_format(self, bucket='apollo-endpoint-production', only_configs=True, event_id=None, time_window_begin=None, time_window_end=datetime.now()):
@@ -102,98 +159,168 @@ class Vehicle:
         for input in inputs:
             ETL.apollo_etl('etl_test', connection, json.loads(input)['event'])
         """
-        self.read_database.create_connection()
+        payloads = self.iter_zip_files_in_json_ETL_format(bucket, only_configs, event_id, time_window_begin,
+                                                          time_window_end, dedupe=False)
+        return [json.dumps(payload) for payload in payloads]
+
+    def iter_zip_files_in_json_ETL_format(self, bucket='apollo-endpoint-production', only_configs=True, event_id=None,
+                                          time_window_begin=None, time_window_end=None, page_size=1000, after=None,
+                                          as_bytes=False, dedupe=True, with_cursor=False):
+        """
+        Streaming version of get_zip_files_in_json_ETL_format for gateways with a long upload history. file_meta_data is
+        read page_size rows at a time with keyset pagination, so only one page is ever in memory, and the ETL payloads
+        are yielded lazily.
+
+        :param time_window_end: The end of the time window.  Defaults to the time of the call
+        :param page_size: rows fetched per query
+        :param after: cursor of the last payload that was processed, to resume a previous iteration after it
+        :param as_bytes: yield json encoded bytes instead of dicts
+        :param dedupe: skip zip files of the time window that were already yielded as configurations
+        :param with_cursor: yield (cursor, payload) tuples, where cursor can be passed as after to resume
+        :return: generator of ETL inputs, configurations first, then the zip files of the time window
+
+        Example, resuming where a previous run stopped:
+        for cursor, payload in vehicle.iter_zip_files_in_json_ETL_format(after=last_cursor, with_cursor=True):
+            ETL.apollo_etl('etl_test', connection, payload['event'])
+            last_cursor = cursor
+        """
+        self.read_database.ensure_connection()
         cycle_number = self.get_cycle_number()
 
         if time_window_begin:
-            time_window_for_query = "AND file_upload_time BETWEEN '{0}' AND '{1}'".format(time_window_begin, time_window_end)
+            time_window = (time_window_begin, time_window_end or datetime.now())
         elif event_id:
             event_timestamp = self.get_event_id_timestamp(event_id)
-            six_days_before_event_ts = event_timestamp - timedelta(days=6)
-            two_days_after_event_ts = event_timestamp + timedelta(days=2)
-            time_window_for_query = "AND file_upload_time BETWEEN '{0}' AND '{1}'".format(six_days_before_event_ts, two_days_after_event_ts)
+            time_window = (event_timestamp - timedelta(days=6), event_timestamp + timedelta(days=2))
         else:
-            time_window_for_query = ""
-
-        # Pulls just zip files with configurations in them
-        configs_query = "SELECT DISTINCT(csv_file_name) FROM config_meta_data \
-                                    JOIN file_meta_data fmd on config_meta_data.file_meta_data_id = fmd.id \
-                                    WHERE fmd.cycle_number = {0} ORDER BY timestamp".format(cycle_number)
-
-        # Pulls all zip files from the beginning (or within the given time window if there is one)
-        not_just_configs_query = "SELECT DISTINCT(csv_file_name) FROM file_meta_data fmd " \
-                    "WHERE fmd.cycle_number = {0} {1} ORDER BY file_upload_time".format(cycle_number, time_window_for_query)
+            time_window = None
 
         # Grab configurations first for any event_id or time window, since this is what will setup the truck so we can run other zip files
         pull_configs = only_configs is True or event_id is not None or time_window_begin is not None
-
+        phases = []
         if pull_configs:
-            files = self.read_database.run_query(configs_query)
-        else:  # Grab everything, not just configurations
-            files = self.read_database.run_query(not_just_configs_query)
-
-        # if there is a given time window from an event_id or time_window_begin, then pull the data in that time window
-        grab_zips_in_time_window = event_id is not None or time_window_begin is not None
-        if grab_zips_in_time_window:
-            files.extend(self.read_database.run_query(not_just_configs_query))
-
-        list_of_json = []
-        list_of_files = []
-
-        for file in files:
-            list_of_files.append(file)
-            list_of_json.append({'event': {'Records': [{'s3': {'bucket': {'name': '{}'.format(bucket)},
-                                                               'object': {'key': 'default'}}}]},
-                                 'context': {}})
-        for i, file in enumerate(files):
-            list_of_json[i]['event']['Records'][0]['s3']['object']['key'] = list_of_files[i].csv_file_name
-            list_of_json[i] = json.dumps(list_of_json[i])
-        return list_of_json
-
-    def get_open_events(self, unique_id):
-        # Returns list of open events
-
-        # TODO Create MySQL view that enables easier and faster querying of OPEN events
-        get_events = "SELECT event_id, max(event_status_id) as max_event_status_id FROM event_table " \
-                     "JOIN event_status USING(event_id) WHERE unique_id = '{0}' GROUP BY event_id".format(unique_id)
-
-        events = pd.read_sql(get_events, self.read_database.connection)
-        if len(events) > 0:
-            list_of_events = events['max_event_status_id'].to_list()
-            list_of_events = [str(event_status_id) for event_status_id in list_of_events]
-            filter_open_events = "SELECT event_table.event_id, event_table.unique_id, event_table.event_type,severity,event_status.status,event_status.ts_created as status_created_at, " \
-                                 "pressure_date " \
-                                 "FROM event_table JOIN event_status USING(event_id) WHERE event_status_id IN ('{0}') " \
-                                 "AND status in ('OPEN','SUSPECTED')".format("','".join(list_of_events))
-
-            open_events = pandas.read_sql(filter_open_events,self.read_database.connection)
-            if open_events.empty:
-                return None
-            else:
-                return open_events
+            phases.append('configs')
+        if not pull_configs or time_window is not None:
+            phases.append('files')
+        if after is not None:
+            phases = phases[phases.index(after[0]):]
+
+        for phase in phases:
+            last_seen = after[1:] if after is not None and after[0] == phase else None
+            while True:
+                query, params = self.zip_files_page_query(phase, cycle_number, time_window, dedupe, last_seen,
+                                                          page_size)
+                rows = self.read_database.run_query(query, params)
+                for row in rows:
+                    payload = {'event': {'Records': [{'s3': {'bucket': {'name': '{}'.format(bucket)},
+                                                             'object': {'key': row.csv_file_name}}}]},
+                               'context': {}}
+                    if as_bytes:
+                        payload = json.dumps(payload).encode('utf-8')
+                    if with_cursor:
+                        yield (phase, str(row.sort_key), row.csv_file_name), payload
+                    else:
+                        yield payload
+                if len(rows) < page_size:
+                    break
+                last_seen = (str(rows[-1].sort_key), rows[-1].csv_file_name)
+
+    def zip_files_page_query(self, phase, cycle_number, time_window, dedupe, last_seen, page_size):
+        """
+        One keyset page of zip files ordered by (sort_key, csv_file_name). For 'configs' the sort_key is the config
+        timestamp, for 'files' the file_upload_time. The keyset compares the raw, indexed columns in WHERE instead of
+        an aggregate in HAVING, so a page only reads its own rows; a zip file with several rows is yielded at its
+        earliest one, the NOT EXISTS skips the later ones.
+        :return: query and its bound parameters
+        """
+        params = {'cycle_number': cycle_number, 'page_size': page_size}
+        if phase == 'configs':
+            sort_key = "cmd.timestamp"
+            rows = "config_meta_data cmd JOIN file_meta_data fmd on cmd.file_meta_data_id = fmd.id " \
+                   "WHERE fmd.cycle_number = :cycle_number"
+            earlier_rows = "config_meta_data earlier_cmd " \
+                           "JOIN file_meta_data earlier_fmd on earlier_cmd.file_meta_data_id = earlier_fmd.id " \
+                           "WHERE earlier_fmd.cycle_number = :cycle_number " \
+                           "AND earlier_fmd.csv_file_name = fmd.csv_file_name AND earlier_cmd.timestamp < cmd.timestamp"
         else:
+            sort_key = "fmd.file_upload_time"
+            rows = "file_meta_data fmd WHERE fmd.cycle_number = :cycle_number"
+            earlier_rows = "file_meta_data earlier_fmd WHERE earlier_fmd.cycle_number = :cycle_number " \
+                           "AND earlier_fmd.csv_file_name = fmd.csv_file_name " \
+                           "AND earlier_fmd.file_upload_time < fmd.file_upload_time"
+            if time_window is not None:
+                rows += " AND fmd.file_upload_time BETWEEN :window_begin AND :window_end"
+                earlier_rows += " AND earlier_fmd.file_upload_time BETWEEN :window_begin AND :window_end"
+                params['window_begin'], params['window_end'] = time_window
+            if dedupe:
+                rows += " AND NOT EXISTS (SELECT 1 FROM config_meta_data " \
+                        "JOIN file_meta_data config_fmd on config_meta_data.file_meta_data_id = config_fmd.id " \
+                        "WHERE config_fmd.cycle_number = :cycle_number " \
+                        "AND config_fmd.csv_file_name = fmd.csv_file_name)"
+        query = "SELECT DISTINCT fmd.csv_file_name, {0} AS sort_key FROM {1} AND NOT EXISTS (SELECT 1 FROM {2})".format(
+            sort_key, rows, earlier_rows)
+        if last_seen is not None:
+            query += " AND ({0} > :last_sort_key OR ({0} = :last_sort_key AND fmd.csv_file_name > :last_name))".format(
+                sort_key)
+            params['last_sort_key'], params['last_name'] = last_seen
+        return query + " ORDER BY sort_key, csv_file_name LIMIT :page_size", params
+
+    def get_open_events(self, unique_id, open_events_table=None):
+        """
+        Returns the OPEN and SUSPECTED events of a sensor, or None when there are none
+        :param open_events_table: optional OpenEvents.OpenEventsTable to read from instead of event_status
+        """
+        if open_events_table is not None:
+            return open_events_table.open_events(unique_id)
+
+        open_events = self.read_database.read_frame(queries['open_events_for_sensor'], {'unique_id': unique_id})
+        if open_events.empty:
             return None
+        else:
+            return open_events
 
     def get_custom_underinflation_thresholds(self,logger):
 
         fleet_id = self.get_fleet_id()
-
-        select_cap = "SELECT settings FROM custom_alert_parameters " \
-                     "WHERE scope_type = 'ACCOUNT' AND scope_id = '{0}' LIMIT 1".format(fleet_id)
-        custom_results = self.read_database.run_query(select_cap)
+        # thresholds are shared by every vehicle in the fleet, so they are fetched and parsed once per TTL window.
+        # callers get a copy since the dict is shared across vehicles
+        key = self.reference_data_key('underinflation', fleet_id)
+        thresholds = reference_data_cache.get_or_load(key, lambda: self.load_custom_underinflation_thresholds(fleet_id, logger))
+        return dict(thresholds)
+
+    def load_custom_underinflation_thresholds(self, fleet_id, logger):
+        custom_results = self.read_database.run_query(queries['account_alert_parameters'], {'fleet_id': str(fleet_id)})
         result = None
         if len(custom_results) > 0:
             result = self.find_underinflation_settings(custom_results[0])
         if result is not None:
             return result
-        global_query = "SELECT settings FROM custom_alert_parameters WHERE scope_type = 'GLOBAL' LIMIT 1"
-        global_default = self.read_database.run_query(global_query)
-        result = self.find_underinflation_settings(global_default[0])
+        result = reference_data_cache.get_or_load(self.reference_data_key('underinflation', 'GLOBAL'),
+                                                  self.load_global_underinflation_thresholds)
         if result is None:
             logger.log_warning("unable to retrieve alert parameters from DB for fleet_id {0}".format(fleet_id))
             result = {'critical': 0.6, 'major': 0.8, 'minor': 0.85}
         return result
 
+    def get_global_underinflation_thresholds(self, logger):
+        """
+        The GLOBAL alert parameters' thresholds, the ones of vehicles without a fleet
+        """
+        result = reference_data_cache.get_or_load(self.reference_data_key('underinflation', 'GLOBAL'),
+                                                  self.load_global_underinflation_thresholds)
+        if result is None:
+            logger.log_warning("unable to retrieve global alert parameters from DB")
+            result = {'critical': 0.6, 'major': 0.8, 'minor': 0.85}
+        return dict(result)
+
+    def load_global_underinflation_thresholds(self):
+        global_default = self.read_database.run_query(queries['global_alert_parameters'])
+        return self.find_underinflation_settings(global_default[0])
+
+    def reference_data_key(self, kind, fleet_id):
+        # entries are per database so test and production data never mix; fleet_id stays last for invalidate()
+        return kind, database_key(self.read_database), fleet_id
+
     def find_underinflation_settings(self,row):
         if row is not None:
             list_of_settings = json.loads(row[0])
@@ -204,17 +331,23 @@ class Vehicle:
 
     def get_fleet_id(self):
         if not self.fleet_id:
-            fleet_id_query = "select fleet_id from vehicle_meta_data where vehicle_id = {0} and archived = 0".format(self.vehicle_id)
-            fleet_id_result = self.read_database.run_query(fleet_id_query)
+            fleet_id_result = self.read_database.run_query(queries['fleet_id'], {'vehicle_id': self.vehicle_id})
             self.fleet_id = fleet_id_result[0][0]
 
         return self.fleet_id
 
-    def set_all_meta_data_to_inactive(self):
-        stmt = 'UPDATE meta_data ' \
-               'SET active = 0 ' \
-               'WHERE vehicle_id = {}'.format(self.vehicle_id)
-        self.write_database.run_statement(stmt)
+    @invalidates(*META_DATA_CACHES)
+    def set_all_meta_data_to_inactive(self, writer=None):
+        """
+        :param writer: BulkWriter to queue the update on, so many vehicles are deactivated by one set based UPDATE per
+        batch; the update is written when the writer flushes, and the caches are dropped again then since getters
+        called in between still read the active rows
+        """
+        if writer is not None:
+            writer.add_key(queries['deactivate_meta_data_for_vehicles'], 'vehicle_ids', self.vehicle_id,
+                           on_write=lambda: self.invalidate(*META_DATA_CACHES))
+            return
+        self.write_database.run_statement(queries['deactivate_meta_data'], {'vehicle_id': self.vehicle_id})
 
     def filter_open_events_by_types(self, event_types):
         filtered_open_events = None
@@ -250,45 +383,59 @@ class Vehicle:
 
     def populate_open_vehicle_events(self):
         if self.open_vehicle_events is None:
-            unique_id_string = "','".join(self.get_active_sensors())
-            open_event_query ="select event_table.event_id, event_status_id, event_table.unique_id, event_table.event_type,severity,es.status,es.ts_created as status_created_at from event_table join event_status es on event_table.event_id = es.event_id where unique_id in ('{}')".format(unique_id_string)
-            vehicle_events = pd.read_sql(open_event_query,con=self.read_database.connection)
-            max_status_ids = vehicle_events.groupby("event_id").event_status_id.max().to_list()
-            max_events = vehicle_events[vehicle_events.event_status_id.isin(max_status_ids)]
-            self.open_vehicle_events = max_events[max_events.status=="OPEN"]
+            # the latest status per event is resolved in SQL, see OpenEvents; VehicleBatch.load_open_events fills
+            # this for many vehicles with one query
+            open_events = load_open_vehicle_events(self.read_database, [self.vehicle_id])
+            self.open_vehicle_events = open_events_for_vehicle(open_events, self.vehicle_id)
 
     def get_active_sensors(self):
+        if self.active_sensors is None and self.sensor_index is not None and self.sensor_index.covers(self.vehicle_id):
+            self.active_sensors = self.sensor_index.active_sensors(self.vehicle_id)
         if self.active_sensors is None:
             self.active_sensors = self.get_active_sensors_and_setpoints().unique_id.to_list()
         return self.active_sensors
 
     def get_fleet_name_for_vehicle(self):
         if self.fleet_name is None:
-            query = "SELECT fleet_name FROM fleet_meta_data WHERE fleet_id = {0}".format(self.fleet_id)
-            fleet_name_result = self.read_database.run_query(query)
-            self.fleet_name = fleet_name_result[-1][0]
+            self.fleet_name = reference_data_cache.get_or_load(self.reference_data_key('fleet_name', self.fleet_id),
+                                                               self.load_fleet_name)
         return self.fleet_name
 
+    def load_fleet_name(self):
+        fleet_name_result = self.read_database.run_query(queries['fleet_name'], {'fleet_id': self.fleet_id})
+        return fleet_name_result[-1][0]
+
     def get_fleet_vehicle_id(self):
-        if self.fleet_id:
-            fleet_vehicle_id_query = "select fleet_vehicle_id from vehicle_meta_data where " \
-                                     "vehicle_id = {0} and archived = 0".format(
-                self.vehicle_id)
-            fleet_vehicle_id_result = self.read_database.run_query(fleet_vehicle_id_query)
+        if self.fleet_id and self.fleet_vehicle_id is None:
+            fleet_vehicle_id_result = self.read_database.run_query(queries['fleet_vehicle_id'],
+                                                                   {'vehicle_id': self.vehicle_id})
             self.fleet_vehicle_id = fleet_vehicle_id_result[0][0]
 
         return self.fleet_vehicle_id
 
+    @cached('unique_id', attributes=('meta_data_id',))
     def get_meta_data_id(self, unique_id):
         if unique_id:
-            meta_data_query = "SELECT MAX(id) FROM meta_data " \
-                              "WHERE vehicle_id = {0} and " \
-                              "unique_id = '{1}' and active = 1".format(self.vehicle_id, unique_id)
-            meta_data_id_result = self.read_database.run_query(meta_data_query)
-            self.meta_data_id = meta_data_id_result[0][0]
-
+            self.meta_data_id = self.get_sensor_index().meta_data_id(self.vehicle_id, unique_id)
             return self.meta_data_id
 
+    @cached(attributes=('sensor_index',))
+    def get_sensor_index(self):
+        """
+        SensorIndex answering get_meta_data_id and get_sensor_wheel_position: the one given to use_sensor_index when it
+        covers this vehicle, otherwise one for this vehicle's meta_data rows loaded with one query
+        """
+        if self.sensor_index is None or not self.sensor_index.covers(self.vehicle_id):
+            self.sensor_index = SensorIndex(self.read_database).load_vehicles([self.vehicle_id])
+        return self.sensor_index
+
+    def use_sensor_index(self, sensor_index):
+        """
+        Shares a SensorIndex, e.g. one loaded for the whole fleet, instead of loading one per vehicle
+        """
+        self.invalidate('get_sensor_index', 'get_meta_data_id', 'get_sensor_wheel_position')
+        self.sensor_index = sensor_index
+
     def get_event_id_timestamp(self, event_id):
         """
         Returns the pressure_date for the event_id given
@@ -296,21 +443,21 @@ class Vehicle:
         :return: event_timestamp: datetime format of pressure_date.  Returns None if the event_id isn't found
         """
 
-        query = "SELECT pressure_date FROM event_table WHERE event_id = {}".format(event_id)
-        event_timestamp = self.read_database.run_query(query)
+        event_timestamp = self.read_database.run_query(queries['event_timestamp'], {'event_id': event_id})
         if event_timestamp:
             event_timestamp = event_timestamp[0].pressure_date
             return event_timestamp
         else:
             return None
 
+    @cached('unique_id')
     def get_sensor_wheel_position(self, unique_id):
-        md_id = self.get_meta_data_id(unique_id)
-        query = "SELECT CONCAT(side, axle, position, type) as wheel_position FROM meta_data WHERE id = {}".format(md_id)
-        wheel_position = self.read_database.run_query(query)
-        if wheel_position:
-            wheel_position = wheel_position[0].wheel_position
-            return wheel_position
-        else:
-            return None
+        return self.get_sensor_index().wheel_position(self.vehicle_id, unique_id)
+
+    def wheel_positions(self, unique_ids):
+        """
+        Wheel positions of many sensors of this vehicle, from the SensorIndex
+        :return: dict of unique_id to wheel position, None for sensors without an active meta_data row
+        """
+        return self.get_sensor_index().wheel_positions(unique_ids, self.vehicle_id)
 
@@ -0,0 +1,201 @@
+import pandas as pd
+
+from OpenEvents import load_open_vehicle_events, open_events_by_vehicle
+from Queries import queries
+from Underinflation import classify_underinflation
+from Vehicle import Vehicle
+
+
+class VehicleBatch:
+    """
+    Hydrates many Vehicle objects with a handful of set based queries instead of one query per getter per vehicle.
+    Every loaded Vehicle has its cached attributes (vehicle_type, fleet_id, fleet_vehicle_id, fleet_name, sensors,
+    active_set_points, active_sensors and optionally offsets) filled in, so its getters answer from memory.
+
+    Example:
+        batch = VehicleBatch(read_database).load(vehicle_ids, start_of_analysis_date='2020-11-30')
+        for vehicle in batch:
+            vehicle.get_active_sensors()  # no query
+    """
+
+    def __init__(self, read_database, write_database=None, logger=None, chunk_size=1000):
+        self.read_database = read_database
+        self.write_database = write_database
+        self.logger = logger
+        self.chunk_size = chunk_size
+        self.vehicles = {}
+
+    def __iter__(self):
+        return iter(self.vehicles.values())
+
+    def __len__(self):
+        return len(self.vehicles)
+
+    def __getitem__(self, vehicle_id):
+        return self.vehicles[vehicle_id]
+
+    def load(self, vehicle_ids, start_of_analysis_date=None, open_events=False):
+        """
+        Loads the given vehicle ids into this batch
+        :param vehicle_ids: iterable of vehicle ids
+        :param start_of_analysis_date: when given, leak_detection_pressure_offsets for that date are loaded as well
+        :param open_events: also load the open events of every vehicle, see load_open_events
+        :return: self, so calls can be chained
+        """
+        vehicle_ids = [int(vehicle_id) for vehicle_id in dict.fromkeys(vehicle_ids)]
+        for vehicle_id in vehicle_ids:
+            if vehicle_id not in self.vehicles:
+                self.vehicles[vehicle_id] = Vehicle(vehicle_id, self.read_database, self.write_database, self.logger)
+
+        self.load_vehicle_meta_data(vehicle_ids)
+        self.load_fleet_names()
+        self.load_active_sensors_and_setpoints(vehicle_ids)
+        if start_of_analysis_date is not None:
+            self.load_sensor_pressure_offsets(start_of_analysis_date)
+        if open_events:
+            self.load_open_events()
+        return self
+
+    def load_vehicle_meta_data(self, vehicle_ids):
+        """
+        The rows come ordered by vehicle_id and id, the order the per vehicle getters see them in
+        """
+        for chunk in self.chunks(vehicle_ids):
+            for row in self.read_database.run_query(queries['vehicle_meta_data_for_vehicles'], {'vehicle_ids': chunk}):
+                vehicle = self.vehicles[row.vehicle_id]
+                # mirrors Vehicle.get_vehicle_type, which keeps the last row regardless of archived
+                vehicle.vehicle_type = row.vehicle_type
+                # mirrors Vehicle.get_fleet_id / get_fleet_vehicle_id, which keep the first non archived row
+                if not row.archived and not vehicle.fleet_id:
+                    vehicle.fleet_id = row.fleet_id
+                    vehicle.fleet_vehicle_id = row.fleet_vehicle_id
+
+    def load_fleet_names(self):
+        fleet_ids = sorted({vehicle.fleet_id for vehicle in self if vehicle.fleet_id is not None})
+        fleet_names = {}
+        for chunk in self.chunks(fleet_ids):
+            for row in self.read_database.run_query(queries['fleet_names_for_fleets'], {'fleet_ids': chunk}):
+                fleet_names[row.fleet_id] = row.fleet_name
+        for vehicle in self:
+            if vehicle.fleet_id in fleet_names:
+                vehicle.fleet_name = fleet_names[vehicle.fleet_id]
+
+    def load_active_sensors_and_setpoints(self, vehicle_ids):
+        sensors_by_vehicle = {vehicle_id: [] for vehicle_id in vehicle_ids}
+        for chunk in self.chunks(vehicle_ids):
+            # same filter as Vehicle.sensor_set_point_query_generator(active=True, exclude_pump=True)
+            for row in self.read_database.run_query(queries['active_sensors_and_set_points_for_vehicles'],
+                                                    {'vehicle_ids': chunk}):
+                sensors_by_vehicle[row.vehicle_id].append((row.unique_id, row.set_point))
+
+        for vehicle_id, sensors in sensors_by_vehicle.items():
+            self.set_active_sensors(self.vehicles[vehicle_id], sensors)
+
+    def set_active_sensors(self, vehicle, sensors):
+        vehicle.sensors = sensors
+        vehicle.active_set_points = pd.DataFrame(sensors, columns=['unique_id', 'set_point'])
+        vehicle.active_sensors = vehicle.active_set_points.unique_id.to_list()
+        vehicle.prime_cache('load_sensors_and_set_points', vehicle.active_set_points, active=True, exclude_pump=True)
+
+    def load_sensor_pressure_offsets(self, start_of_analysis_date):
+        # a sensor that moved can still be active on more than one vehicle, each of them gets its offsets
+        vehicle_ids_by_unique_id = {}
+        for vehicle in self:
+            for unique_id in vehicle.get_active_sensors():
+                vehicle_ids_by_unique_id.setdefault(unique_id, []).append(vehicle.vehicle_id)
+
+        offsets_by_vehicle = {vehicle_id: [] for vehicle_id in self.vehicles}
+        for chunk in self.chunks(list(vehicle_ids_by_unique_id)):
+            for row in self.read_database.run_query(queries['offsets_for_sensors'],
+                                                    {'unique_ids': chunk, 'date': start_of_analysis_date}):
+                for vehicle_id in vehicle_ids_by_unique_id[row.unique_id]:
+                    offsets_by_vehicle[vehicle_id].append(tuple(row))
+
+        for vehicle_id, offsets in offsets_by_vehicle.items():
+            self.set_offsets(self.vehicles[vehicle_id], offsets, start_of_analysis_date)
+
+    def set_offsets(self, vehicle, offsets, start_of_analysis_date):
+        vehicle.offsets = pd.DataFrame(offsets, columns=['date', 'pressure_offset', 'unique_id'])
+        vehicle.prime_cache('get_sensor_pressure_offsets', vehicle.offsets, start_of_analysis_date=start_of_analysis_date)
+
+    def load_open_events(self, strategy='sql'):
+        """
+        Resolves the open events of every vehicle in the batch with one query per chunk, after which
+        get_open_vehicle_events, get_open_ui_events, get_open_leak_events etc. are in memory filters
+        :return: the open events of the whole batch, indexed by vehicle_id
+        """
+        open_events = load_open_vehicle_events(self.read_database, list(self.vehicles), strategy=strategy,
+                                               chunk_size=self.chunk_size)
+        events_by_vehicle = open_events_by_vehicle(open_events, self.vehicles)
+        for vehicle_id, vehicle in self.vehicles.items():
+            vehicle.open_vehicle_events = events_by_vehicle[vehicle_id]
+        return open_events
+
+    def classify_underinflation(self, readings, start_of_analysis_date=None, logger=None):
+        """
+        Classifies pressure readings of the vehicles in this batch with Underinflation.classify_underinflation, using
+        every vehicle's active set points, its offsets for start_of_analysis_date (none when it is None) and the
+        thresholds of its fleet from get_custom_underinflation_thresholds, or get_global_underinflation_thresholds for
+        vehicles without a fleet
+        :param readings: DataFrame with unique_id and pressure columns
+        """
+        set_points = []
+        offsets = []
+        thresholds = {}
+        for vehicle in self:
+            vehicle_set_points = vehicle.get_active_sensors_and_setpoints()
+            set_points.append(vehicle_set_points.assign(fleet_id=vehicle.fleet_id))
+            if start_of_analysis_date is not None:
+                offsets.append(vehicle.get_sensor_pressure_offsets(start_of_analysis_date))
+            if vehicle.fleet_id not in thresholds:
+                # None is classify_underinflation's default entry, there are no account thresholds without a fleet
+                thresholds[vehicle.fleet_id] = vehicle.get_global_underinflation_thresholds(logger) \
+                    if vehicle.fleet_id is None else vehicle.get_custom_underinflation_thresholds(logger)
+        set_points = pd.concat(set_points, ignore_index=True) if set_points else \
+            pd.DataFrame(columns=['unique_id', 'set_point', 'fleet_id'])
+        offsets = pd.concat(offsets, ignore_index=True) if offsets else None
+        return classify_underinflation(readings, set_points, offsets, thresholds)
+
+    def load_frames(self, vehicles, set_points, offsets=None, start_of_analysis_date=None, open_events=None):
+        """
+        Loads vehicles from DataFrames instead of the DB, e.g. a snapshot read back by FleetExport.read_snapshot
+        :param vehicles: vehicle_id, vehicle_type, fleet_id, fleet_vehicle_id, fleet_name per vehicle
+        :param set_points: vehicle_id, unique_id, set_point of the active non pump sensors, in meta_data id order
+        :param offsets: vehicle_id, date, pressure_offset, unique_id for start_of_analysis_date
+        :param open_events: open events indexed by vehicle_id, as returned by load_open_vehicle_events
+        :return: self
+        """
+        for row in vehicles.itertuples(index=False):
+            vehicle = self.vehicles.get(row.vehicle_id)
+            if vehicle is None:
+                vehicle = self.vehicles[row.vehicle_id] = Vehicle(row.vehicle_id, self.read_database,
+                                                                  self.write_database, self.logger)
+            vehicle.vehicle_type = row.vehicle_type
+            vehicle.fleet_id = None if pd.isna(row.fleet_id) else int(row.fleet_id)
+            vehicle.fleet_vehicle_id = row.fleet_vehicle_id
+            vehicle.fleet_name = None if pd.isna(row.fleet_name) else row.fleet_name
+
+        sensors_by_vehicle = self.rows_by_vehicle(set_points, ['unique_id', 'set_point'])
+        for vehicle_id, vehicle in self.vehicles.items():
+            self.set_active_sensors(vehicle, sensors_by_vehicle.get(vehicle_id, []))
+        if offsets is not None:
+            offsets_by_vehicle = self.rows_by_vehicle(offsets, ['date', 'pressure_offset', 'unique_id'])
+            for vehicle_id, vehicle in self.vehicles.items():
+                self.set_offsets(vehicle, offsets_by_vehicle.get(vehicle_id, []), start_of_analysis_date)
+        if open_events is not None:
+            events_by_vehicle = open_events_by_vehicle(open_events, self.vehicles)
+            for vehicle_id, vehicle in self.vehicles.items():
+                vehicle.open_vehicle_events = events_by_vehicle[vehicle_id]
+        return self
+
+    def rows_by_vehicle(self, frame, columns):
+        rows_by_vehicle = {}
+        # categorical and numpy values are converted back to the python objects a DB row would hold
+        values = [frame[column].astype(object).tolist() for column in columns]
+        for vehicle_id, row in zip(frame.vehicle_id.tolist(), zip(*values)):
+            rows_by_vehicle.setdefault(vehicle_id, []).append(row)
+        return rows_by_vehicle
+
+    def chunks(self, values):
+        for start in range(0, len(values), self.chunk_size):
+            yield values[start:start + self.chunk_size]
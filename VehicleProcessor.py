@@ -0,0 +1,102 @@
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from Vehicle import Vehicle
+
+# error is the exception raised by the per vehicle function, in which case result is None
+VehicleResult = namedtuple('VehicleResult', ['vehicle_id', 'result', 'error'])
+
+
+class VehicleProcessor:
+    """
+    Runs a function over many vehicles on a thread pool. Each task checks its own connections out of the Database pool
+    through Database.worker_copy and returns them when done, so Vehicle getters run concurrently without sharing a
+    cursor and the number of open connections never exceeds the number of workers.
+
+    Example:
+        with VehicleProcessor(read_database, write_database, workers=8) as processor:
+            for vehicle_result in processor.map(lambda vehicle: vehicle.get_open_leak_events(), vehicle_ids):
+                ...
+    """
+
+    def __init__(self, read_database, write_database=None, workers=4, max_in_flight=None, logger=None):
+        """
+        :param workers: number of threads, should stay below the DB connection limit (pool_size + max_overflow)
+        :param max_in_flight: maximum number of submitted but unfinished vehicles, defaults to 2 * workers
+        """
+        self.read_database = read_database
+        self.write_database = write_database
+        self.workers = workers
+        self.max_in_flight = max_in_flight or 2 * workers
+        self.logger = logger
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='vehicle-worker')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def map(self, fn, vehicle_ids, ordered=True):
+        """
+        Calls fn(vehicle) for every vehicle id and yields a VehicleResult per vehicle as results come in.
+        :param fn: function taking a Vehicle, runs on a worker thread
+        :param ordered: True yields results in the order of vehicle_ids, False yields them as soon as they finish
+        """
+        vehicle_ids = iter(vehicle_ids)
+        in_flight = deque()
+        for vehicle_id in vehicle_ids:
+            in_flight.append(self.executor.submit(self.run_one, fn, vehicle_id))
+            if len(in_flight) >= self.max_in_flight:
+                break
+
+        def submit_next():
+            for next_vehicle_id in vehicle_ids:
+                in_flight.append(self.executor.submit(self.run_one, fn, next_vehicle_id))
+                return
+
+        while in_flight:
+            if ordered:
+                done = [in_flight.popleft()]
+            else:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight.remove(future)
+            for future in done:
+                yield future.result()
+                submit_next()
+
+    def run_one(self, fn, vehicle_id):
+        worker_copies = []
+        try:
+            read_database = self.read_database.worker_copy()
+            worker_copies.append(read_database)
+            if self.write_database is self.read_database:
+                write_database = read_database
+            elif self.write_database is not None:
+                write_database = self.write_database.worker_copy()
+                worker_copies.append(write_database)
+            else:
+                write_database = None
+            vehicle = Vehicle(vehicle_id, read_database, write_database, self.logger)
+            return VehicleResult(vehicle_id, fn(vehicle), None)
+        except Exception as e:
+            if self.logger is not None:
+                self.logger.log_warning("processing vehicle_id {0} failed with {1}".format(vehicle_id, e))
+            return VehicleResult(vehicle_id, None, e)
+        finally:
+            for database in worker_copies:
+                database.close_connection()
+
+
+def map_vehicles(fn, vehicle_ids, read_database, write_database=None, workers=4, ordered=True, max_in_flight=None,
+                 logger=None):
+    """
+    Convenience wrapper around VehicleProcessor.map that shuts the pool down once every result has been yielded
+    """
+    with VehicleProcessor(read_database, write_database, workers, max_in_flight, logger) as processor:
+        for vehicle_result in processor.map(fn, vehicle_ids, ordered):
+            yield vehicle_result
@@ -0,0 +1,113 @@
+"""
+Compares the latency of the open event lookups on a synthetic event_status table:
+
+    legacy      the old two round trip Vehicle.get_open_events (max status ids into pandas, then a giant IN list)
+    single      Vehicle.get_open_events, one query with a latest status subquery
+    table       Vehicle.get_open_events reading the managed OpenEventsTable
+
+Usage:
+    python benchmarks/bench_open_events.py [--rows 1000000] [--url sqlite:////tmp/open_events.db] [--lookups 50]
+"""
+import argparse
+import random
+import time
+
+import pandas as pd
+
+# fleet puts the repository root on sys.path, so it has to be imported before the repository modules
+from fleet import BenchmarkDatabase
+from OpenEvents import OpenEventsTable
+from Vehicle import Vehicle
+
+STATUSES = ['OPEN', 'OPEN', 'SUSPECTED', 'CLOSED', 'CLOSED', 'CLOSED']
+
+
+def create_event_tables(database, rows, sensors, statuses_per_event, seed=42):
+    connection = database.connection
+    for table in ('event_status', 'event_table', 'open_events', 'open_events_state'):
+        connection.exec_driver_sql("DROP TABLE IF EXISTS {0}".format(table))
+    connection.exec_driver_sql("CREATE TABLE event_table (event_id BIGINT PRIMARY KEY, unique_id VARCHAR(64), "
+                               "event_type VARCHAR(32), pressure_date DATETIME, ts_created DATETIME)")
+    connection.exec_driver_sql("CREATE INDEX event_table_unique_id ON event_table (unique_id)")
+    connection.exec_driver_sql("CREATE TABLE event_status (event_status_id BIGINT PRIMARY KEY, event_id BIGINT, "
+                               "ts_created DATETIME, severity VARCHAR(32), status VARCHAR(32), "
+                               "event_input_variables TEXT, severity_order INT)")
+    connection.exec_driver_sql("CREATE INDEX event_status_event_id ON event_status (event_id)")
+
+    generator = random.Random(seed)
+    events = rows // statuses_per_event
+    event_rows = [{'event_id': event_id, 'unique_id': '{0}_{1:06X}'.format(event_id % sensors, event_id % sensors),
+                   'event_type': generator.choice(['LEAK', 'UI', 'UI_LEAK']),
+                   'pressure_date': '2021-02-13 17:38:00', 'ts_created': '2021-02-13 17:38:00'}
+                  for event_id in range(1, events + 1)]
+    pd.DataFrame(event_rows).to_sql('event_table', connection, if_exists='append', index=False, chunksize=10000)
+
+    status_rows = [{'event_status_id': event_status_id, 'event_id': generator.randint(1, events),
+                    'ts_created': '2021-02-13 17:38:00', 'severity': 'CRITICAL',
+                    'status': generator.choice(STATUSES), 'event_input_variables': None, 'severity_order': 1}
+                   for event_status_id in range(1, rows + 1)]
+    pd.DataFrame(status_rows).to_sql('event_status', connection, if_exists='append', index=False, chunksize=10000)
+    return ['{0}_{1:06X}'.format(sensor, sensor) for sensor in range(sensors)]
+
+
+def legacy_get_open_events(database, unique_id):
+    get_events = "SELECT event_id, max(event_status_id) as max_event_status_id FROM event_table " \
+                 "JOIN event_status USING(event_id) WHERE unique_id = '{0}' GROUP BY event_id".format(unique_id)
+    events = pd.read_sql(get_events, database.connection)
+    if len(events) == 0:
+        return None
+    list_of_events = [str(event_status_id) for event_status_id in events['max_event_status_id'].to_list()]
+    filter_open_events = "SELECT event_table.event_id, event_table.unique_id, event_table.event_type,severity," \
+                         "event_status.status,event_status.ts_created as status_created_at, pressure_date " \
+                         "FROM event_table JOIN event_status USING(event_id) WHERE event_status_id IN ('{0}') " \
+                         "AND status in ('OPEN','SUSPECTED')".format("','".join(list_of_events))
+    open_events = pd.read_sql(filter_open_events, database.connection)
+    return None if open_events.empty else open_events
+
+
+def time_lookups(lookup, unique_ids):
+    latencies = []
+    for unique_id in unique_ids:
+        started = time.perf_counter()
+        lookup(unique_id)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {'mean_ms': 1000 * sum(latencies) / len(latencies),
+            'p50_ms': 1000 * latencies[len(latencies) // 2],
+            'p95_ms': 1000 * latencies[int(len(latencies) * 0.95) - 1]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000, help='event_status rows')
+    parser.add_argument('--sensors', type=int, default=2000)
+    parser.add_argument('--statuses-per-event', type=int, default=4)
+    parser.add_argument('--lookups', type=int, default=50)
+    parser.add_argument('--url', default='sqlite:////tmp/bench_open_events.db')
+    args = parser.parse_args()
+
+    database = BenchmarkDatabase(args.url)
+    started = time.perf_counter()
+    unique_ids = create_event_tables(database, args.rows, args.sensors, args.statuses_per_event)
+    print("generated {0} event_status rows in {1:.1f}s".format(args.rows, time.perf_counter() - started))
+
+    open_events_table = OpenEventsTable(database)
+    open_events_table.create()
+    started = time.perf_counter()
+    open_events_table.rebuild()
+    print("built open_events table in {0:.1f}s".format(time.perf_counter() - started))
+
+    vehicle = Vehicle(1, database, database)
+    sample = random.Random(7).sample(unique_ids, min(args.lookups, len(unique_ids)))
+    results = {
+        'legacy': time_lookups(lambda unique_id: legacy_get_open_events(database, unique_id), sample),
+        'single': time_lookups(vehicle.get_open_events, sample),
+        'table': time_lookups(lambda unique_id: vehicle.get_open_events(unique_id, open_events_table), sample),
+    }
+    for name, result in results.items():
+        print("{0:<8} mean {1[mean_ms]:8.2f} ms   p50 {1[p50_ms]:8.2f} ms   p95 {1[p95_ms]:8.2f} ms".format(name,
+                                                                                                           result))
+
+
+if __name__ == '__main__':
+    main()
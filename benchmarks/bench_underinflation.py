@@ -0,0 +1,93 @@
+"""
+Compares the throughput of underinflation classification on the synthetic fleet (see fleet.py):
+
+    row_by_row  the per sensor loop consumers run today: set point from get_active_sensors_and_setpoints, offset from
+                get_sensor_pressure_offsets and thresholds from get_custom_underinflation_thresholds per reading
+    vectorized  VehicleBatch.classify_underinflation, one NumPy pass over all readings
+
+Both run on a VehicleBatch loaded up front, so the DB is out of the timed part. The severities of both are compared.
+
+Usage:
+    python benchmarks/bench_underinflation.py [--vehicles 1000] [--readings 1000000] [--url sqlite:////tmp/fleet.db]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+# fleet puts the repository root on sys.path, so it has to be imported before the repository modules
+from fleet import BenchmarkDatabase, FIRST_DAY, generate_fleet
+from Underinflation import classify_pressure
+from VehicleBatch import VehicleBatch
+
+
+def generate_readings(batch, readings, seed):
+    """
+    Readings spread over every active sensor, between 50% and 110% of the set point
+    """
+    generator = np.random.default_rng(seed)
+    set_points = pd.concat([vehicle.get_active_sensors_and_setpoints() for vehicle in batch], ignore_index=True)
+    sensors = generator.integers(0, len(set_points), readings)
+    pressure = set_points.set_point.to_numpy(dtype='float64')[sensors] * generator.uniform(0.5, 1.1, readings)
+    return pd.DataFrame({'unique_id': set_points.unique_id.to_numpy()[sensors], 'pressure': pressure.round(1)})
+
+
+def classify_row_by_row(batch, readings):
+    vehicle_of_sensor = {unique_id: vehicle for vehicle in batch for unique_id in vehicle.get_active_sensors()}
+    severities = []
+    for unique_id, pressure in zip(readings.unique_id, readings.pressure):
+        vehicle = vehicle_of_sensor[unique_id]
+        set_points = vehicle.get_active_sensors_and_setpoints()
+        set_point = set_points[set_points.unique_id == unique_id].set_point.iloc[0]
+        offsets = vehicle.get_sensor_pressure_offsets(FIRST_DAY)
+        offset = offsets[offsets.unique_id == unique_id].pressure_offset
+        thresholds = vehicle.get_custom_underinflation_thresholds(None)
+        severities.append(classify_pressure(pressure, set_point, offset.iloc[-1] if len(offset) else 0.0, thresholds))
+    return severities
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vehicles', type=int, default=1000)
+    parser.add_argument('--readings', type=int, default=1000000)
+    parser.add_argument('--baseline-readings', type=int, default=20000,
+                        help='readings for the row by row loop, its rate is extrapolated')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--url', help='SQLAlchemy URL to load the fleet into, a sqlite temp file by default')
+    args = parser.parse_args()
+
+    url = args.url or 'sqlite:///{0}'.format(os.path.join(tempfile.gettempdir(), 'benchmark_fleet.db'))
+    database = BenchmarkDatabase(url)
+    generate_fleet(database, args.vehicles, args.seed)
+    batch = VehicleBatch(database).load(range(1, args.vehicles + 1), FIRST_DAY)
+    readings = generate_readings(batch, args.readings, args.seed)
+    # warms the per fleet threshold cache, both variants read it
+    batch.classify_underinflation(readings.head(1), FIRST_DAY)
+
+    started = time.perf_counter()
+    classified = batch.classify_underinflation(readings, FIRST_DAY)
+    vectorized_seconds = time.perf_counter() - started
+
+    sample = readings.iloc[random.Random(args.seed).sample(range(len(readings)),
+                                                           min(args.baseline_readings, len(readings)))]
+    started = time.perf_counter()
+    severities = classify_row_by_row(batch, sample)
+    baseline_seconds = time.perf_counter() - started
+
+    expected = classified.severity.iloc[[readings.index.get_loc(index) for index in sample.index]]
+    mismatches = sum(1 for severity, vectorized in zip(severities, expected.astype(object))
+                     if severity != (None if pd.isna(vectorized) else vectorized))
+    print("row_by_row  {0:>12,.0f} readings/s  ({1} readings)".format(len(sample) / baseline_seconds, len(sample)))
+    print("vectorized  {0:>12,.0f} readings/s  ({1} readings)".format(len(readings) / vectorized_seconds,
+                                                                       len(readings)))
+    print("speedup     {0:>12,.1f}x   severity mismatches: {1}".format(
+        (len(readings) / vectorized_seconds) / (len(sample) / baseline_seconds), mismatches))
+    print(classified.severity.value_counts(dropna=False).to_string())
+
+
+if __name__ == '__main__':
+    main()
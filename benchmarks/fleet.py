@@ -0,0 +1,222 @@
+"""
+Deterministic synthetic fleet for the benchmarks: the same seed and scale always produce the same rows, so timings
+of different commits are comparable. Tables are created with SQLAlchemy Core, so the data loads into SQLite, MySQL or
+Postgres alike.
+"""
+import json
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import (BigInteger, Column, Date, DateTime, Float, Integer, MetaData, String, Table, Text, create_engine,
+                        event)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Database import Database, register_sqlite_functions  # noqa: E402
+
+SENSORS_PER_VEHICLE = 10
+EVENTS_PER_VEHICLE = 2
+STATUSES_PER_EVENT = 3
+FILES_PER_VEHICLE = 20
+CONFIGS_PER_VEHICLE = 2
+OFFSET_DAYS = 3
+FLEET_SIZE = 100
+FIRST_DAY = date(2021, 2, 1)
+POSITIONS = [(side, axle, position) for axle in (1, 2, 3) for side in ('L', 'R') for position in ('O', 'I')]
+
+metadata = MetaData()
+fleet_meta_data = Table('fleet_meta_data', metadata,
+                        Column('fleet_id', Integer, primary_key=True, autoincrement=False),
+                        Column('fleet_name', String(64)))
+vehicle_meta_data = Table('vehicle_meta_data', metadata,
+                          Column('id', Integer, primary_key=True),
+                          Column('vehicle_id', Integer, index=True),
+                          Column('vehicle_type', String(32)),
+                          Column('fleet_id', Integer),
+                          Column('fleet_vehicle_id', String(32)),
+                          Column('archived', Integer))
+meta_data = Table('meta_data', metadata,
+                  Column('id', Integer, primary_key=True),
+                  Column('position', String(1)),
+                  Column('type', String(1)),
+                  Column('side', String(1)),
+                  Column('axle', Integer),
+                  Column('set_point', Integer),
+                  Column('cycle_number', Integer),
+                  Column('sensor_number', String(16)),
+                  Column('unique_id', String(64), index=True),
+                  Column('vehicle_id', Integer, index=True),
+                  Column('active', Integer),
+                  Column('created_at', DateTime))
+custom_alert_parameters = Table('custom_alert_parameters', metadata,
+                                Column('id', Integer, primary_key=True),
+                                Column('scope_type', String(16)),
+                                Column('scope_id', String(16)),
+                                Column('settings', Text))
+event_table = Table('event_table', metadata,
+                    Column('event_id', BigInteger, primary_key=True, autoincrement=False),
+                    Column('unique_id', String(64), index=True),
+                    Column('event_type', String(16)),
+                    Column('pressure_date', DateTime),
+                    Column('ts_created', DateTime))
+event_status = Table('event_status', metadata,
+                     Column('event_status_id', BigInteger, primary_key=True, autoincrement=False),
+                     Column('event_id', BigInteger, index=True),
+                     Column('ts_created', DateTime),
+                     Column('severity', String(16)),
+                     Column('status', String(16)),
+                     Column('event_input_variables', Text),
+                     Column('severity_order', Integer))
+file_meta_data = Table('file_meta_data', metadata,
+                       Column('id', Integer, primary_key=True, autoincrement=False),
+                       Column('cycle_number', Integer, index=True),
+                       Column('csv_file_name', String(128)),
+                       Column('file_upload_time', DateTime))
+config_meta_data = Table('config_meta_data', metadata,
+                         Column('id', Integer, primary_key=True),
+                         Column('file_meta_data_id', Integer, index=True),
+                         Column('timestamp', DateTime))
+leak_detection_pressure_offsets = Table('leak_detection_pressure_offsets', metadata,
+                                        Column('id', Integer, primary_key=True),
+                                        Column('date', Date),
+                                        Column('pressure_offset', Float),
+                                        Column('pressure_count', Integer),
+                                        Column('unique_id', String(64), index=True))
+
+
+class BenchmarkDatabase(Database):
+    """
+    Database on an arbitrary SQLAlchemy URL, e.g. sqlite:////tmp/fleet.db or mysql+pymysql://user:pw@host/db
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.host = None
+        self.db_name = url
+        self.engine = create_engine(url)
+        if self.engine.dialect.name == 'sqlite':
+            # Vehicle.get_sensor_wheel_position uses MySQL's CONCAT
+            event.listen(self.engine, 'connect', register_sqlite_functions)
+        self.connection = self.engine.connect()
+
+    def create_connection(self):
+        self.close_connection()
+        self.connection = self.engine.connect()
+
+
+def unique_id_for(vehicle_id, sensor):
+    return '{0}_{1:06X}'.format(cycle_number_for(vehicle_id), vehicle_id * SENSORS_PER_VEHICLE + sensor)
+
+
+def cycle_number_for(vehicle_id):
+    return 1000 + vehicle_id
+
+
+def iter_rows(vehicles, seed):
+    """
+    Yields (table, row) for the whole fleet, vehicle ids run from 1 to vehicles
+    """
+    generator = random.Random(seed)
+    for fleet_id in range(1, vehicles // FLEET_SIZE + 2):
+        yield fleet_meta_data, {'fleet_id': fleet_id, 'fleet_name': 'fleet {0}'.format(fleet_id)}
+    yield custom_alert_parameters, {'scope_type': 'GLOBAL', 'scope_id': None, 'settings': json.dumps(
+        [{'type': 'UNDERINFLATION', 'critical': 0.6, 'major': 0.8, 'minor': 0.85}])}
+
+    meta_data_id = 0
+    event_id = 0
+    event_status_id = 0
+    file_id = 0
+    for vehicle_id in range(1, vehicles + 1):
+        fleet_id = vehicle_id // FLEET_SIZE + 1
+        cycle_number = cycle_number_for(vehicle_id)
+        created_at = datetime(2021, 1, 1) + timedelta(minutes=vehicle_id)
+        yield vehicle_meta_data, {'vehicle_id': vehicle_id, 'vehicle_type': generator.choice(['tractor', 'trailer']),
+                                  'fleet_id': fleet_id, 'fleet_vehicle_id': 'T-{0}'.format(vehicle_id),
+                                  'archived': 0}
+        if vehicle_id % 10 == 0:
+            yield custom_alert_parameters, {'scope_type': 'ACCOUNT', 'scope_id': str(fleet_id), 'settings': json.dumps(
+                [{'type': 'UNDERINFLATION', 'critical': 0.65, 'major': 0.8, 'minor': 0.9}])}
+
+        unique_ids = []
+        for sensor in range(SENSORS_PER_VEHICLE):
+            side, axle, position = POSITIONS[sensor % len(POSITIONS)]
+            meta_data_id += 1
+            unique_id = unique_id_for(vehicle_id, sensor)
+            unique_ids.append(unique_id)
+            yield meta_data, {'id': meta_data_id, 'position': position, 'type': 'P' if sensor == 0 else 'T',
+                              'side': side, 'axle': axle, 'set_point': 0 if sensor == 0 else 100 + 10 * (axle - 1),
+                              'cycle_number': cycle_number, 'sensor_number': unique_id.split('_')[1],
+                              'unique_id': unique_id, 'vehicle_id': vehicle_id, 'active': 1, 'created_at': created_at}
+            for day in range(OFFSET_DAYS):
+                yield leak_detection_pressure_offsets, {'date': FIRST_DAY + timedelta(days=day),
+                                                        'pressure_offset': round(generator.uniform(-3, 3), 2),
+                                                        'pressure_count': 288, 'unique_id': unique_id}
+
+        for _ in range(EVENTS_PER_VEHICLE):
+            event_id += 1
+            pressure_date = datetime(2021, 2, 1) + timedelta(hours=generator.randrange(24 * 28))
+            yield event_table, {'event_id': event_id, 'unique_id': generator.choice(unique_ids[1:]),
+                                'event_type': generator.choice(['LEAK', 'UI', 'UI_LEAK']),
+                                'pressure_date': pressure_date, 'ts_created': pressure_date}
+            for status in range(STATUSES_PER_EVENT):
+                event_status_id += 1
+                last = status == STATUSES_PER_EVENT - 1
+                yield event_status, {'event_status_id': event_status_id, 'event_id': event_id,
+                                     'ts_created': pressure_date + timedelta(hours=status),
+                                     'severity': generator.choice(['MINOR', 'MAJOR', 'CRITICAL']),
+                                     'status': generator.choice(['OPEN', 'CLOSED', 'SUSPECTED']) if last else 'OPEN',
+                                     'event_input_variables': None, 'severity_order': 1}
+
+        for upload in range(FILES_PER_VEHICLE):
+            file_id += 1
+            uploaded_at = datetime(2021, 2, 1) + timedelta(hours=6 * upload, seconds=vehicle_id)
+            yield file_meta_data, {'id': file_id, 'cycle_number': cycle_number,
+                                   'csv_file_name': 'sensordata_{0:%Y_%m_%d}/{1}_{0:%H:%M:%S}'.format(uploaded_at,
+                                                                                                      cycle_number),
+                                   'file_upload_time': uploaded_at}
+            if upload < CONFIGS_PER_VEHICLE:
+                yield config_meta_data, {'file_meta_data_id': file_id, 'timestamp': uploaded_at}
+
+
+def generate_fleet(database, vehicles=1000, seed=0, chunk_size=5000):
+    """
+    (Re)creates the fleet tables on database and loads a fleet of the given number of vehicles
+    :return: dict of table name to row count
+    """
+    metadata.drop_all(database.engine)
+    metadata.create_all(database.engine)
+    counts = {table.name: 0 for table in metadata.sorted_tables}
+    pending = {}
+    connection = database.connection
+    for table, row in iter_rows(vehicles, seed):
+        rows = pending.setdefault(table, [])
+        rows.append(row)
+        if len(rows) >= chunk_size:
+            insert_rows(connection, table, rows, counts)
+            pending[table] = []
+    for table, rows in pending.items():
+        insert_rows(connection, table, rows, counts)
+    return counts
+
+
+def insert_rows(connection, table, rows, counts):
+    if not rows:
+        return
+    with connection.begin():
+        connection.execute(table.insert(), rows)
+    counts[table.name] += len(rows)
+
+
+def write_sql_script(path, vehicles=1000, seed=0):
+    """
+    Writes the meta_data rows of the fleet as an INSERT script, the input of the populate_db scenario
+    """
+    with open(path, 'w') as script:
+        for table, row in iter_rows(vehicles, seed):
+            if table is not meta_data:
+                continue
+            values = ', '.join('NULL' if value is None else "'{0}'".format(value) if isinstance(value, (str, datetime))
+                               else str(value) for value in row.values())
+            script.write("INSERT INTO meta_data ({0}) VALUES ({1});\n".format(', '.join(row), values))
@@ -0,0 +1,185 @@
+"""
+Benchmark suite for Vehicle and Database against a synthetic fleet (see fleet.py).
+
+    python benchmarks/run.py run --vehicles 1000 --output results.json [--url sqlite:////tmp/fleet.db]
+    python benchmarks/run.py compare baseline.json results.json [--threshold 0.15]
+
+run generates the fleet, times every scenario on a deterministic sample of vehicles and writes the latencies as JSON.
+compare prints the change of every scenario's p50 and exits with 1 when one of them got slower by more than threshold
+(and by more than --min-delta-ms).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import sqlalchemy
+
+# fleet puts the repository root on sys.path, so it has to be imported before the repository modules
+from fleet import BenchmarkDatabase, FIRST_DAY, generate_fleet, meta_data, unique_id_for, write_sql_script
+from Cache import reference_data_cache
+from SqlLoader import SqlScriptLoader
+from Vehicle import Vehicle
+from VehicleBatch import VehicleBatch
+
+
+def vehicle_scenario(method):
+    def run(database, vehicle_id):
+        return method(Vehicle(vehicle_id, database, database))
+    return run
+
+
+SCENARIOS = {
+    'get_vehicle_type': vehicle_scenario(lambda vehicle: vehicle.get_vehicle_type()),
+    'get_active_sensors': vehicle_scenario(lambda vehicle: vehicle.get_active_sensors()),
+    'get_sensor_pressure_offsets': vehicle_scenario(lambda vehicle: vehicle.get_sensor_pressure_offsets(FIRST_DAY)),
+    'get_fleet_name_for_vehicle': vehicle_scenario(
+        lambda vehicle: (vehicle.get_fleet_id(), vehicle.get_fleet_name_for_vehicle())),
+    'get_custom_underinflation_thresholds': vehicle_scenario(
+        lambda vehicle: vehicle.get_custom_underinflation_thresholds(None)),
+    'get_meta_data_id': lambda database, vehicle_id: Vehicle(vehicle_id, database, database).get_meta_data_id(
+        unique_id_for(vehicle_id, 1)),
+    'get_sensor_wheel_position': lambda database, vehicle_id: Vehicle(vehicle_id, database, database)
+    .get_sensor_wheel_position(unique_id_for(vehicle_id, 1)),
+    'get_open_events': lambda database, vehicle_id: Vehicle(vehicle_id, database, database).get_open_events(
+        unique_id_for(vehicle_id, 1)),
+    'get_open_vehicle_events': vehicle_scenario(lambda vehicle: vehicle.get_open_vehicle_events()),
+    'get_zip_files_in_json_ETL_format': vehicle_scenario(
+        lambda vehicle: vehicle.get_zip_files_in_json_ETL_format(only_configs=False)),
+}
+
+
+def time_calls(fn, arguments, repeat=1):
+    latencies = []
+    for _ in range(repeat):
+        for argument in arguments:
+            started = time.perf_counter()
+            fn(argument)
+            latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+def summarize(latencies):
+    ordered = sorted(latencies)
+    return {'calls': len(ordered), 'total_seconds': sum(ordered), 'mean_seconds': sum(ordered) / len(ordered),
+            'p50_seconds': percentile(ordered, 50), 'p95_seconds': percentile(ordered, 95),
+            'p99_seconds': percentile(ordered, 99)}
+
+
+def percentile(ordered, percent):
+    return ordered[max(0, -(-len(ordered) * percent // 100) - 1)]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    url = args.url or 'sqlite:///{0}'.format(os.path.join(tempfile.gettempdir(), 'benchmark_fleet.db'))
+    database = BenchmarkDatabase(url)
+    started = time.perf_counter()
+    counts = generate_fleet(database, args.vehicles, args.seed)
+    print("generated {0} vehicles in {1:.1f}s: {2}".format(args.vehicles, time.perf_counter() - started, counts))
+
+    sample = sorted(random.Random(args.seed).sample(range(1, args.vehicles + 1), min(args.sample, args.vehicles)))
+    selected = args.scenario or list(SCENARIOS) + ['VehicleBatch.load', 'populate_db']
+    results = {}
+    for name in selected:
+        reference_data_cache.invalidate()
+        if name == 'VehicleBatch.load':
+            results[name] = time_calls(lambda vehicle_ids: VehicleBatch(database).load(vehicle_ids, FIRST_DAY, True),
+                                       [sample], args.repeat)
+        elif name == 'populate_db':
+            results[name] = time_populate_db(database, args)
+        else:
+            scenario = SCENARIOS[name]
+            results[name] = time_calls(lambda vehicle_id: scenario(database, vehicle_id), sample, args.repeat)
+        print("{0:<40} p50 {1:9.3f} ms   p95 {2:9.3f} ms".format(name, 1000 * results[name]['p50_seconds'],
+                                                                  1000 * results[name]['p95_seconds']))
+
+    report = {'meta': {'vehicles': args.vehicles, 'seed': args.seed, 'sample': len(sample), 'repeat': args.repeat,
+                       'dialect': database.engine.dialect.name, 'python': platform.python_version(),
+                       'sqlalchemy': sqlalchemy.__version__, 'commit': git_commit(),
+                       'created_at': datetime.now().isoformat()},
+              'scenarios': results}
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    return report
+
+
+def time_populate_db(database, args):
+    """
+    Times the SqlScriptLoader that Localhost.populate_db uses, on the fleet's meta_data rows
+    """
+    script_path = os.path.join(tempfile.gettempdir(), 'benchmark_meta_data_{0}.sql'.format(args.vehicles))
+    write_sql_script(script_path, args.vehicles, args.seed)
+    latencies = []
+    for _ in range(args.repeat):
+        meta_data.drop(database.engine)
+        meta_data.create(database.engine)
+        started = time.perf_counter()
+        SqlScriptLoader(database.connection).load(script_path)
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+def compare(args):
+    with open(args.baseline) as baseline_file, open(args.current) as current_file:
+        baseline = json.load(baseline_file)['scenarios']
+        current = json.load(current_file)['scenarios']
+    regressions = []
+    for name in sorted(set(baseline) & set(current)):
+        before, after = baseline[name]['p50_seconds'], current[name]['p50_seconds']
+        change = (after - before) / before if before else 0.0
+        flag = ''
+        if change > args.threshold and (after - before) * 1000 > args.min_delta_ms:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        print("{0:<40} {1:9.3f} ms -> {2:9.3f} ms  {3:+7.1%}  {4}".format(name, 1000 * before, 1000 * after, change,
+                                                                          flag))
+    for name in sorted(set(baseline) ^ set(current)):
+        print("{0:<40} only in {1}".format(name, 'baseline' if name in baseline else 'current'))
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='generate the fleet and time the scenarios')
+    run_parser.add_argument('--vehicles', type=int, default=1000, help='fleet size, e.g. 1000, 10000 or 100000')
+    run_parser.add_argument('--url', help='SQLAlchemy URL to load the fleet into, a sqlite temp file by default')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--sample', type=int, default=100, help='vehicles timed per scenario')
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--scenario', action='append', help='only run this scenario, can be repeated')
+    run_parser.add_argument('--output', help='JSON file for the results')
+
+    compare_parser = commands.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.15,
+                                help='relative p50 slowdown that counts as a regression')
+    compare_parser.add_argument('--min-delta-ms', type=float, default=0.1,
+                                help='ignore slowdowns smaller than this, timer noise on sub millisecond scenarios')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        run(args)
+        return 0
+    return compare(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
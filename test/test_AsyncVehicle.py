@@ -0,0 +1,87 @@
+from unittest import IsolatedAsyncioTestCase
+from AsyncDatabase import AsyncLocalhost, AsyncLocalSQLite
+from AsyncVehicle import AsyncVehicle, gather_vehicles
+from Database import Localhost
+
+STATEMENTS = [
+    "CREATE TABLE vehicle_meta_data (id INTEGER PRIMARY KEY, vehicle_id INT, vehicle_type TEXT, fleet_id INT, "
+    "fleet_vehicle_id TEXT, archived INT DEFAULT 0)",
+    "CREATE TABLE meta_data (id INTEGER PRIMARY KEY, unique_id TEXT, vehicle_id INT, set_point INT, type TEXT, "
+    "active INT DEFAULT 1)",
+    "INSERT INTO vehicle_meta_data (vehicle_id, vehicle_type, fleet_id, fleet_vehicle_id) "
+    "VALUES (1, 'buckaroo', 7, 'T-1'), (2, 'trailer', 8, 'T-2'), (3, 'dolly', 9, 'T-3')",
+    "INSERT INTO meta_data (unique_id, vehicle_id, set_point, type) "
+    "VALUES ('3421_9DEC42', 1, 100, 'T'), ('3421_1F077A', 1, 110, 'T'), ('3421_9DAD06', 1, 0, 'P'), "
+    "('3421_000001', 1, 100, 'T'), ('3421_000002', 1, 100, 'T'), ('3422_000001', 2, 90, 'T')",
+]
+
+
+class TestAsyncVehicle(IsolatedAsyncioTestCase):
+    # Requirements to run: the same local MySQL as test_Vehicle, plus aiomysql
+    def setUp(self):
+        self.db = Localhost('vehicle_test')
+        self.db.setupDb('../_database_setup/vehicle_db.sql')
+        self.async_db = AsyncLocalhost('vehicle_test')
+        self.vehicle = AsyncVehicle(1, self.async_db, self.async_db)
+
+    async def asyncTearDown(self):
+        await self.async_db.dispose()
+        self.db.cleanUpDB()
+
+    async def test_get_vehicle_type(self):
+        self.assertEqual("buckaroo", await self.vehicle.get_vehicle_type())
+
+    async def test_get_active_sensors(self):
+        unique_ids = await self.vehicle.get_active_sensors()
+        self.assertEqual(10, len(unique_ids))
+
+    async def test_it_can_get_all_the_open_events_for_a_vehicle(self):
+        open_vehicle_events = await self.vehicle.get_open_vehicle_events()
+        self.assertEqual(2202672, open_vehicle_events.event_id.item())
+
+    async def test_gather_vehicles_returns_results_in_order(self):
+        results = await gather_vehicles(lambda vehicle: vehicle.get_fleet_id(), [1, 1, 1], self.async_db, concurrency=2)
+        self.assertEqual([1, 1, 1], results)
+
+    async def test_stream_query_yields_chunks(self):
+        chunks = [rows async for rows in self.async_db.stream_query('SELECT * FROM meta_data WHERE vehicle_id = 1',
+                                                                     chunk_size=4)]
+        self.assertTrue(all(len(rows) <= 4 for rows in chunks))
+
+
+class TestAsyncVehicleOnSQLite(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.async_db = AsyncLocalSQLite()
+        for statement in STATEMENTS:
+            await self.async_db.run_statement(statement)
+        self.vehicle = AsyncVehicle(1, self.async_db, self.async_db)
+
+    async def asyncTearDown(self):
+        await self.async_db.dispose()
+
+    async def test_getters(self):
+        self.assertEqual('buckaroo', await self.vehicle.get_vehicle_type())
+        self.assertEqual(7, await self.vehicle.get_fleet_id())
+        self.assertEqual(1, await AsyncVehicle(read_database=self.async_db).get_vehicle_id('3421_1F077A'))
+        self.assertEqual(['3421_9DEC42', '3421_1F077A', '3421_000001', '3421_000002'],
+                         await self.vehicle.get_active_sensors())
+        set_points = await self.vehicle.get_active_sensors_and_setpoints()
+        self.assertEqual([100, 110, 100, 100], set_points.set_point.tolist())
+
+    async def test_fleet_vehicle_id_is_cached(self):
+        await self.vehicle.get_fleet_id()
+        self.assertEqual('T-1', await self.vehicle.get_fleet_vehicle_id())
+        await self.async_db.run_statement("UPDATE vehicle_meta_data SET fleet_vehicle_id = 'T-9' WHERE vehicle_id = 1")
+        self.assertEqual('T-1', await self.vehicle.get_fleet_vehicle_id(), "the second call doesn't go to the DB")
+
+    async def test_gather_vehicles_returns_results_in_order(self):
+        results = await gather_vehicles(lambda vehicle: vehicle.get_fleet_id(), [3, 1, 2, 1], self.async_db,
+                                        concurrency=2)
+        self.assertEqual([9, 7, 8, 7], results)
+
+    async def test_stream_query_yields_chunks(self):
+        chunks = [rows async for rows in self.async_db.stream_query(
+            'SELECT unique_id FROM meta_data WHERE vehicle_id = :vehicle_id ORDER BY id', {'vehicle_id': 1},
+            chunk_size=2)]
+        self.assertEqual([2, 2, 1], [len(rows) for rows in chunks])
+        self.assertEqual('3421_9DEC42', chunks[0][0].unique_id)
@@ -0,0 +1,40 @@
+from unittest import TestCase
+
+from Database import LocalSQLite
+from Vehicle import Vehicle
+
+STATEMENTS = [
+    "CREATE TABLE meta_data (id INTEGER PRIMARY KEY, position TEXT, type TEXT, side TEXT, axle INT, set_point INT, "
+    "unique_id TEXT, vehicle_id INT, active INT DEFAULT 1)",
+    "INSERT INTO meta_data (position, type, side, axle, set_point, unique_id, vehicle_id) "
+    "VALUES ('O', 'T', 'L', 2, 100, '3421_9DEC42', 1), ('I', 'T', 'L', 2, 100, '3421_1F077A', 1), "
+    "('O', 'P', 'R', 1, 0, '3421_9DAD06', 1)",
+]
+
+
+class TestBulkWriter(TestCase):
+    def setUp(self):
+        self.db = LocalSQLite()
+        self.db.create_connection()
+        for statement in STATEMENTS:
+            self.db.run_statement(statement)
+
+    def tearDown(self):
+        self.db.cleanUpDB()
+
+    def test_it_batches_vehicle_writes(self):
+        with self.db.bulk_writer(batch_size=3) as writer:
+            for vehicle_id in (1, 2, 1):
+                Vehicle(vehicle_id=vehicle_id, read_database=self.db, write_database=self.db)\
+                    .set_all_meta_data_to_inactive(writer=writer)
+            self.assertEqual([(3,)], self.db.run_query('SELECT COUNT(*) FROM meta_data WHERE active = 1'))
+        self.assertEqual([{'query': 'deactivate_meta_data_for_vehicles', 'rows': 2, 'affected': 3}], writer.results)
+        self.assertEqual([(0,)], self.db.run_query('SELECT COUNT(*) FROM meta_data WHERE active = 1'))
+
+    def test_it_invalidates_vehicle_caches_after_the_write(self):
+        vehicle = Vehicle(vehicle_id=1, read_database=self.db, write_database=self.db)
+        writer = self.db.bulk_writer()
+        vehicle.set_all_meta_data_to_inactive(writer=writer)
+        self.assertEqual(['3421_9DEC42', '3421_1F077A'], vehicle.get_active_sensors(), "not written before flush()")
+        writer.flush()
+        self.assertEqual([], vehicle.get_active_sensors())
@@ -0,0 +1,58 @@
+from unittest import TestCase
+
+from ChangeSync import Change, ChangeSync
+from Database import LocalSQLite
+from VehicleBatch import VehicleBatch
+
+STATEMENTS = [
+    "CREATE TABLE fleet_meta_data (fleet_id INTEGER PRIMARY KEY, fleet_name TEXT)",
+    "CREATE TABLE vehicle_meta_data (id INTEGER PRIMARY KEY, vehicle_id INT, vehicle_type TEXT, fleet_id INT, "
+    "fleet_vehicle_id TEXT, archived INT)",
+    "CREATE TABLE meta_data (id INTEGER PRIMARY KEY, unique_id TEXT, vehicle_id INT, set_point INT, type TEXT, "
+    "active INT)",
+    "CREATE TABLE leak_detection_pressure_offsets (id INTEGER PRIMARY KEY, date DATE, pressure_offset REAL, "
+    "unique_id TEXT)",
+    "CREATE TABLE event_table (event_id INTEGER PRIMARY KEY, unique_id TEXT, event_type TEXT, pressure_date DATETIME)",
+    "CREATE TABLE event_status (event_status_id INTEGER PRIMARY KEY, event_id INT, ts_created DATETIME, "
+    "severity TEXT, status TEXT)",
+    "INSERT INTO vehicle_meta_data (vehicle_id, vehicle_type, fleet_id, fleet_vehicle_id, archived) "
+    "VALUES (1, 'tractor', 1, 'T-1', 0), (2, 'trailer', 1, 'T-2', 0)",
+    "INSERT INTO meta_data (unique_id, vehicle_id, set_point, type, active) "
+    "VALUES ('3421_9DEC42', 1, 100, 'T', 1), ('3422_000001', 2, 90, 'T', 1)",
+    "INSERT INTO event_table VALUES (7, '3422_000001', 'LEAK', '2021-02-01 10:00:00')",
+    "INSERT INTO event_status VALUES (1, 7, '2021-02-01 10:00:00', 'MINOR', 'OPEN')",
+]
+
+
+class TestChangeSync(TestCase):
+    def setUp(self):
+        self.db = LocalSQLite()
+        self.db.create_connection()
+        for statement in STATEMENTS:
+            self.db.run_statement(statement)
+        self.batch = VehicleBatch(self.db).load([1, 2], '2021-02-01', open_events=True)
+        self.sync = ChangeSync(self.db, self.batch, '2021-02-01')
+        self.changes = []
+        self.sync.subscribe(self.changes.append)
+        self.sync.start()
+
+    def tearDown(self):
+        self.db.cleanUpDB()
+
+    def test_nothing_changed(self):
+        self.assertEqual([], self.sync.poll())
+
+    def test_applies_deltas_to_cached_vehicles(self):
+        self.db.run_statement("INSERT INTO meta_data (unique_id, vehicle_id, set_point, type, active) "
+                              "VALUES ('3421_1F077A', 1, 110, 'T', 1)")
+        self.db.run_statement("INSERT INTO event_status VALUES (2, 7, '2021-02-02 10:00:00', 'MINOR', 'CLOSED')")
+        self.db.run_statement("INSERT INTO leak_detection_pressure_offsets (date, pressure_offset, unique_id) "
+                              "VALUES ('2021-02-01', 2.5, '3422_000001')")
+
+        self.assertEqual([Change('sensors', 1, None), Change('open_events', 2, None), Change('offsets', 2, 1)],
+                         self.sync.poll())
+        self.assertEqual(['3421_9DEC42', '3421_1F077A'], self.batch[1].get_active_sensors())
+        self.assertTrue(self.batch[2].get_open_vehicle_events().empty)
+        self.assertEqual([2.5], self.batch[2].get_sensor_pressure_offsets('2021-02-01').pressure_offset.tolist())
+        self.assertEqual(3, len(self.changes))
+        self.assertEqual([], self.sync.poll())
@@ -0,0 +1,81 @@
+import importlib.util
+import tempfile
+from datetime import date
+from unittest import TestCase, skipUnless
+
+from Database import LocalSQLite
+from FleetExport import FleetExport
+
+STATEMENTS = [
+    "CREATE TABLE fleet_meta_data (fleet_id INTEGER PRIMARY KEY, fleet_name TEXT)",
+    "CREATE TABLE vehicle_meta_data (id INTEGER PRIMARY KEY, vehicle_id INT, vehicle_type TEXT, fleet_id INT, "
+    "fleet_vehicle_id TEXT, archived INT)",
+    "CREATE TABLE meta_data (id INTEGER PRIMARY KEY, unique_id TEXT, vehicle_id INT, set_point INT, type TEXT, "
+    "active INT)",
+    "CREATE TABLE leak_detection_pressure_offsets (id INTEGER PRIMARY KEY, date DATE, pressure_offset REAL, "
+    "unique_id TEXT)",
+    "CREATE TABLE event_table (event_id INTEGER PRIMARY KEY, unique_id TEXT, event_type TEXT, pressure_date DATETIME)",
+    "CREATE TABLE event_status (event_status_id INTEGER PRIMARY KEY, event_id INT, ts_created DATETIME, "
+    "severity TEXT, status TEXT)",
+    "INSERT INTO fleet_meta_data VALUES (1, 'buckaroos'), (2, 'cowpokes')",
+    "INSERT INTO vehicle_meta_data (vehicle_id, vehicle_type, fleet_id, fleet_vehicle_id, archived) "
+    "VALUES (1, 'tractor', 1, 'T-1', 0), (2, 'trailer', 2, 'T-2', 0)",
+    "INSERT INTO meta_data (unique_id, vehicle_id, set_point, type, active) "
+    "VALUES ('3421_9DEC42', 1, 100, 'T', 1), ('3421_1F077A', 1, 110, 'T', 1), ('3421_9DAD06', 1, 0, 'P', 1), "
+    "('3422_000001', 2, 90, 'T', 1)",
+    "INSERT INTO leak_detection_pressure_offsets (date, pressure_offset, unique_id) "
+    "VALUES ('2021-02-01', 1.5, '3421_9DEC42'), ('2021-02-02', 2.5, '3421_9DEC42')",
+    "INSERT INTO event_table VALUES (7, '3421_1F077A', 'LEAK', '2021-02-01 10:00:00')",
+    "INSERT INTO event_status VALUES (1, 7, '2021-02-01 10:00:00', 'MINOR', 'OPEN')",
+]
+
+
+@skipUnless(importlib.util.find_spec('pyarrow'), "FleetExport needs pyarrow")
+class TestFleetExport(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = LocalSQLite()
+        self.db.create_connection()
+        for statement in STATEMENTS:
+            self.db.run_statement(statement)
+
+    def tearDown(self):
+        self.db.cleanUpDB()
+        self.directory.cleanup()
+
+    def test_exports_fleets_and_reloads_vehicle_caches(self):
+        export = FleetExport(self.db, self.directory.name, chunk_size=1)
+        counts = export.export(date(2021, 2, 1))
+        self.assertEqual({'vehicles': 2, 'set_points': 3, 'offsets': 1, 'open_events': 1}, counts)
+        self.assertEqual('category', str(export.read_dataset('set_points', date(2021, 2, 1)).unique_id.dtype))
+
+        batch = FleetExport(None, self.directory.name).read_snapshot(date(2021, 2, 1), fleet_ids=[1])
+        vehicle = batch[1]
+        self.assertEqual(1, len(batch))
+        self.assertEqual('buckaroos', vehicle.get_fleet_name_for_vehicle())
+        self.assertEqual(['3421_9DEC42', '3421_1F077A'], vehicle.get_active_sensors())
+        self.assertEqual([1.5], vehicle.get_sensor_pressure_offsets(date(2021, 2, 1)).pressure_offset.tolist())
+        self.assertEqual([7], vehicle.get_open_vehicle_events().event_id.tolist())
+
+    def test_feather_export_replaces_partitions(self):
+        export = FleetExport(self.db, self.directory.name, file_format='feather')
+        export.export('2021-02-01', fleet_ids=[2])
+        self.db.run_statement("UPDATE vehicle_meta_data SET vehicle_type = 'dolly' WHERE vehicle_id = 2")
+        export.export('2021-02-01', fleet_ids=[2])
+        self.assertEqual(['dolly'], export.read_dataset('vehicles', '2021-02-01').vehicle_type.tolist())
+
+    def test_re_export_removes_partitions_without_rows(self):
+        export = FleetExport(self.db, self.directory.name)
+        export.export('2021-02-01', fleet_ids=[1])
+        self.db.run_statement("INSERT INTO event_status VALUES (2, 7, '2021-02-02 10:00:00', 'MINOR', 'CLOSED')")
+        counts = export.export('2021-02-01', fleet_ids=[1])
+        self.assertEqual(0, counts['open_events'])
+        self.assertTrue(export.read_dataset('open_events', '2021-02-01').empty)
+        vehicle = export.read_snapshot('2021-02-01', fleet_ids=[1])[1]
+        self.assertTrue(vehicle.get_open_vehicle_events().empty)
+
+    def test_snapshot_offsets_answer_string_dates(self):
+        FleetExport(self.db, self.directory.name).export('2021-02-01', fleet_ids=[1])
+        vehicle = FleetExport(None, self.directory.name).read_snapshot('2021-02-01', fleet_ids=[1])[1]
+        self.assertEqual([1.5], vehicle.get_sensor_pressure_offsets('2021-02-01').pressure_offset.tolist())
+        self.assertEqual([1.5], vehicle.get_sensor_pressure_offsets(date(2021, 2, 1)).pressure_offset.tolist())
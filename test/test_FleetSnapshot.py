@@ -0,0 +1,42 @@
+from datetime import date, datetime
+from unittest import TestCase
+
+import pandas as pd
+
+from FleetSnapshot import FleetSnapshot
+
+
+class TestFleetSnapshot(TestCase):
+    def setUp(self):
+        vehicles = pd.DataFrame({'vehicle_id': [2, 1], 'vehicle_type': ['trailer', 'tractor'], 'fleet_id': [7, None],
+                                 'fleet_vehicle_id': ['T-2', None], 'fleet_name': ['buckaroos', None]})
+        set_points = pd.DataFrame({'vehicle_id': [2, 1, 2, 3], 'unique_id': ['B', 'A', 'C', 'Z'],
+                                   'set_point': [100, 90, 110, 1]})
+        offsets = pd.DataFrame({'vehicle_id': [2], 'date': [date(2021, 2, 1)], 'pressure_offset': [1.5],
+                                'unique_id': ['C']})
+        open_events = pd.DataFrame({'vehicle_id': [2, 2], 'event_id': [8, 9], 'event_status_id': [80, 90],
+                                    'unique_id': ['B', 'C'], 'event_type': ['UI', 'LEAK'],
+                                    'severity': ['MINOR', 'MAJOR'], 'status': ['OPEN', 'OPEN'],
+                                    'status_created_at': [datetime(2021, 2, 1), datetime(2021, 2, 2)]})
+        self.snapshot = FleetSnapshot(vehicles, set_points, offsets, open_events, date(2021, 2, 1))
+
+    def test_views_answer_vehicle_getters(self):
+        vehicle = self.snapshot[2]
+        self.assertEqual(2, len(self.snapshot))
+        self.assertNotIn(3, self.snapshot)
+        self.assertEqual('trailer', vehicle.get_vehicle_type())
+        self.assertEqual('buckaroos', vehicle.get_fleet_name_for_vehicle())
+        self.assertEqual(['B', 'C'], vehicle.get_active_sensors())
+        self.assertEqual([100, 110], vehicle.get_active_sensors_and_setpoints().set_point.tolist())
+        self.assertEqual([1.5], vehicle.get_sensor_pressure_offsets(date(2021, 2, 1)).pressure_offset.tolist())
+        self.assertEqual([9], vehicle.get_open_leak_events().event_id.tolist())
+        self.assertIsNone(vehicle.get_open_ui_leak_events())
+
+    def test_vehicle_without_data(self):
+        vehicle = self.snapshot[1]
+        self.assertIsNone(vehicle.get_fleet_id())
+        self.assertEqual(['A'], vehicle.get_active_sensors())
+        self.assertTrue(vehicle.get_open_vehicle_events().empty)
+        self.assertFalse(vehicle.has_open_events())
+        with self.assertRaises(AttributeError):
+            vehicle.cached_value = 1
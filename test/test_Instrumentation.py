@@ -0,0 +1,69 @@
+import json
+from unittest import TestCase
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from Instrumentation import Profiler, fingerprint
+
+
+class Sensors:
+    def __init__(self, connection):
+        self.connection = connection
+        self.unique_ids = None
+
+    def get_unique_ids(self):
+        if self.unique_ids is None:
+            self.unique_ids = [row[0] for row in self.connection.execute(text("SELECT unique_id FROM meta_data"))]
+        return self.unique_ids
+
+
+class TestProfiler(TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        self.connection = self.engine.connect()
+        self.connection.exec_driver_sql("CREATE TABLE meta_data (unique_id TEXT)")
+        self.connection.exec_driver_sql("INSERT INTO meta_data VALUES ('3421_1F077A'), ('3421_9DEC42')")
+
+    def tearDown(self):
+        self.connection.close()
+
+    def test_it_records_queries_and_methods_only_while_enabled(self):
+        original = Sensors.get_unique_ids
+        with Profiler().enabled(self.engine, classes=(Sensors,)) as profiler:
+            sensors = Sensors(self.connection)
+            sensors.get_unique_ids()
+            sensors.get_unique_ids()
+        self.assertIs(original, Sensors.get_unique_ids)
+        Sensors(self.connection).get_unique_ids()
+
+        stats = profiler.as_dict()
+        method = stats['methods']['Sensors.get_unique_ids']
+        self.assertEqual(2, method['calls'])
+        self.assertEqual(1, method['cache_hits'], "The second call didn't run a query")
+        self.assertEqual(1, stats['queries']['SELECT unique_id FROM meta_data']['calls'])
+        self.assertLessEqual(method['p50_seconds'], method['p99_seconds'])
+
+    def test_a_failed_statement_leaves_no_start_time_behind(self):
+        with Profiler().enabled(self.engine, classes=(Sensors,)) as profiler:
+            with self.assertRaises(OperationalError):
+                self.connection.execute(text("SELECT unique_id FROM missing_table"))
+            self.assertEqual([], self.connection.info['profiler_started_at'])
+            Sensors(self.connection).get_unique_ids()
+        self.assertEqual([], self.connection.info['profiler_started_at'])
+        self.assertEqual(1, profiler.as_dict()['queries']['SELECT unique_id FROM meta_data']['calls'])
+        self.assertNotIn('SELECT unique_id FROM missing_table', profiler.as_dict()['queries'])
+
+    def test_it_exports_prometheus_text_and_json_lines(self):
+        with Profiler().enabled(self.engine, classes=(Sensors,)) as profiler:
+            Sensors(self.connection).get_unique_ids()
+        prometheus = profiler.prometheus_text()
+        self.assertIn('python_training_method_seconds_count{method="Sensors.get_unique_ids"} 1', prometheus)
+        self.assertIn('quantile="0.99"', prometheus)
+        lines = [json.loads(line) for line in profiler.json_lines()]
+        self.assertEqual({'query', 'method'}, {line['kind'] for line in lines})
+
+    def test_fingerprint_collapses_literals_and_in_lists(self):
+        self.assertEqual("SELECT * FROM meta_data WHERE unique_id IN (...) AND vehicle_id = ?",
+                         fingerprint("SELECT *  FROM meta_data\nWHERE unique_id IN ('1_22043F', '3421_9DEC42') "
+                                     "AND vehicle_id = 12"))
@@ -0,0 +1,137 @@
+import gc
+import os
+import tempfile
+from unittest import TestCase
+
+from Cache import database_key, reference_data_cache
+from Database import LocalSQLite
+from SqlLoader import translate_mysql_to_sqlite
+from Vehicle import Vehicle
+
+SCHEMA = """/*!40101 SET @OLD_CHARACTER_SET_CLIENT=@@CHARACTER_SET_CLIENT */;
+SET FOREIGN_KEY_CHECKS=0;
+CREATE TABLE `vehicle_meta_data` (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `vehicle_id` int(11) NOT NULL,
+  `vehicle_type` varchar(45) DEFAULT NULL,
+  `fleet_id` int(11) DEFAULT NULL,
+  `fleet_vehicle_id` varchar(45) DEFAULT NULL,
+  `archived` tinyint(1) NOT NULL DEFAULT '0',
+  PRIMARY KEY (`id`),
+  KEY `vehicle_id` (`vehicle_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+CREATE TABLE `meta_data` (
+  `id` int(11) unsigned NOT NULL AUTO_INCREMENT,
+  `position` enum('O','I') DEFAULT NULL,
+  `type` char(1) DEFAULT NULL COMMENT 'T is a tire, P the pump',
+  `side` char(1) DEFAULT NULL,
+  `axle` int(11) DEFAULT NULL,
+  `set_point` int(11) DEFAULT NULL,
+  `unique_id` varchar(45) COLLATE utf8_bin DEFAULT NULL,
+  `vehicle_id` int(11) DEFAULT NULL,
+  `active` tinyint(1) DEFAULT '1',
+  `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  KEY `unique_id` (`unique_id`)
+) ENGINE=InnoDB AUTO_INCREMENT=12 DEFAULT CHARSET=utf8;
+"""
+
+DATA = """LOCK TABLES `meta_data` WRITE;
+INSERT INTO `vehicle_meta_data` (vehicle_id, vehicle_type, fleet_id, fleet_vehicle_id) VALUES (1,'buckaroo',1,'T\\'1');
+INSERT INTO `meta_data` (position,type,side,axle,set_point,unique_id,vehicle_id) VALUES ('O','T','L',2,100,'3421_9DEC42',1);
+INSERT INTO `meta_data` (position,type,side,axle,set_point,unique_id,vehicle_id) VALUES ('I','T','L',2,100,'3421_1F077A',1);
+INSERT INTO `meta_data` (position,type,side,axle,set_point,unique_id,vehicle_id) VALUES ('O','P','R',1,0,'3421_9DAD06',1);
+UNLOCK TABLES;
+"""
+
+
+class TestLocalSQLite(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.tables_file_path = os.path.join(self.directory.name, 'schema.sql')
+        self.sql_data_file_path = os.path.join(self.directory.name, 'data.sql')
+        with open(self.tables_file_path, 'w') as schema, open(self.sql_data_file_path, 'w') as data:
+            schema.write(SCHEMA)
+            data.write(DATA)
+        self.db = LocalSQLite()
+        self.db.snapshot_directory = self.directory.name
+
+    def tearDown(self):
+        self.db.cleanUpDB()
+        self.directory.cleanup()
+
+    def test_it_loads_mysql_schema_and_data_files(self):
+        self.db.setupDb(self.sql_data_file_path, tables_file_path=self.tables_file_path)
+        self.assertEqual([(3,)], self.db.run_query('SELECT COUNT(*) FROM meta_data'))
+        self.assertEqual([("T'1",)], self.db.run_query('SELECT fleet_vehicle_id FROM vehicle_meta_data'))
+
+    def test_vehicle_getters_run_on_sqlite(self):
+        self.db.setupDb(self.sql_data_file_path, tables_file_path=self.tables_file_path)
+        vehicle = Vehicle(vehicle_id=1, read_database=self.db, write_database=self.db)
+        self.assertEqual(['3421_9DEC42', '3421_1F077A'], vehicle.get_active_sensors())
+        self.assertEqual('buckaroo', vehicle.get_vehicle_type())
+        self.assertEqual('L2OT', vehicle.get_sensor_wheel_position('3421_9DEC42'), "CONCAT should work on SQLite")
+
+    def test_reference_data_is_cached_per_in_memory_db(self):
+        reference_data_cache.invalidate()
+        other_db = LocalSQLite()
+        for db, fleet_name in ((self.db, 'buckaroos'), (other_db, 'cowpokes')):
+            db.setupDb(self.sql_data_file_path, tables_file_path=self.tables_file_path)
+            db.run_statement("CREATE TABLE fleet_meta_data (fleet_id INTEGER PRIMARY KEY, fleet_name TEXT)")
+            db.run_statement("INSERT INTO fleet_meta_data VALUES (1, :fleet_name)", {'fleet_name': fleet_name})
+        try:
+            names = []
+            for db in (self.db, other_db):
+                vehicle = Vehicle(vehicle_id=1, read_database=db, write_database=db)
+                vehicle.get_fleet_id()
+                names.append(vehicle.get_fleet_name_for_vehicle())
+        finally:
+            other_db.cleanUpDB()
+            reference_data_cache.invalidate()
+        self.assertEqual(['buckaroos', 'cowpokes'], names)
+
+    def test_in_memory_db_keys_are_never_reused(self):
+        self.db.create_connection()
+        key = database_key(self.db)
+        self.assertEqual(key, database_key(self.db))
+        keys = {key}
+        for _ in range(20):
+            db = LocalSQLite()
+            db.create_connection()
+            keys.add(database_key(db))
+            db.cleanUpDB()
+            del db
+            gc.collect()
+        self.assertEqual(21, len(keys))
+
+    def test_setup_db_restores_snapshots(self):
+        self.db.setupDb(self.sql_data_file_path, tables_file_path=self.tables_file_path, use_snapshot=True)
+        self.db.run_statement('DELETE FROM meta_data')
+        self.db.setupDb(self.sql_data_file_path, tables_file_path=self.tables_file_path, use_snapshot=True)
+        self.assertEqual([(3,)], self.db.run_query('SELECT COUNT(*) FROM meta_data'))
+
+    def test_setup_db_only_drops_outdated_snapshots_of_the_same_files(self):
+        other_data_file_path = os.path.join(self.directory.name, 'other_data.sql')
+        with open(other_data_file_path, 'w') as data:
+            data.write(DATA)
+        self.db.setupDb(self.sql_data_file_path, tables_file_path=self.tables_file_path, use_snapshot=True)
+        other = self.db.snapshot_name(other_data_file_path, self.tables_file_path, False)
+        self.db.setupDb(other_data_file_path, tables_file_path=self.tables_file_path, use_snapshot=True)
+        outdated = self.db.snapshot_name(self.sql_data_file_path, self.tables_file_path, False)
+        with open(self.sql_data_file_path, 'a') as data:
+            data.write("DELETE FROM meta_data WHERE type = 'P';\n")
+        self.db.setupDb(self.sql_data_file_path, tables_file_path=self.tables_file_path, use_snapshot=True)
+        current = self.db.snapshot_name(self.sql_data_file_path, self.tables_file_path, False)
+        self.assertEqual([(2,)], self.db.run_query('SELECT COUNT(*) FROM meta_data'))
+        self.assertTrue(os.path.exists(current))
+        self.assertTrue(os.path.exists(other), "snapshots of other data files must survive")
+        self.assertFalse(os.path.exists(outdated))
+
+    def test_it_translates_mysql_ddl(self):
+        create_table, create_index = translate_mysql_to_sqlite(
+            "CREATE TABLE `t` (`id` int(11) NOT NULL AUTO_INCREMENT, `name` varchar(8) COLLATE utf8_bin, "
+            "PRIMARY KEY (`id`), KEY `name` (`name`)) ENGINE=InnoDB")
+        self.assertEqual("CREATE TABLE `t` (\n  `id` INTEGER PRIMARY KEY AUTOINCREMENT,\n  `name` varchar(8)\n)",
+                         create_table)
+        self.assertEqual("CREATE INDEX IF NOT EXISTS `t_name` ON `t` (`name`)", create_index)
+        self.assertEqual([], translate_mysql_to_sqlite("SET FOREIGN_KEY_CHECKS = 0"))
@@ -0,0 +1,39 @@
+from unittest import TestCase
+
+from sqlalchemy import create_engine
+
+from Queries import QueryRegistry
+
+
+class TestQueryRegistry(TestCase):
+    def setUp(self):
+        self.registry = QueryRegistry()
+        self.registry.register('sensors', "SELECT unique_id FROM meta_data WHERE unique_id IN :unique_ids "
+                                          "ORDER BY unique_id", expanding=('unique_ids',))
+        self.connection = create_engine('sqlite://').connect()
+        self.connection.exec_driver_sql("CREATE TABLE meta_data (unique_id TEXT)")
+        self.connection.exec_driver_sql("INSERT INTO meta_data VALUES ('3421_1F077A'), ('3421_9DEC42'), ('1_22043F')")
+
+    def tearDown(self):
+        self.connection.close()
+
+    def run_registered(self, name, params):
+        statement = self.registry[name]
+        result = self.connection.execute(statement, params)
+        self.registry.record(statement, result)
+        return result.fetchall()
+
+    def test_it_binds_expanding_in_lists(self):
+        rows = self.run_registered('sensors', {'unique_ids': ['3421_9DEC42', '3421_1F077A']})
+        self.assertEqual([('3421_1F077A',), ('3421_9DEC42',)], rows)
+        self.assertEqual([], self.run_registered('sensors', {'unique_ids': []}))
+
+    def test_it_counts_compiled_cache_hits(self):
+        for unique_ids in (['3421_1F077A'], ['1_22043F', "x' OR '1'='1"], ['3421_9DEC42']):
+            self.run_registered('sensors', {'unique_ids': unique_ids})
+        stats = self.registry.stats()
+        self.assertEqual(3, stats['sensors']['executions'])
+        self.assertEqual(2, stats['sensors']['cache_hits'])
+        self.assertEqual(stats['sensors'], stats['total'])
+        self.registry.reset_stats()
+        self.assertEqual(0, self.registry.stats()['total']['executions'])
@@ -0,0 +1,62 @@
+from unittest import TestCase
+
+from sqlalchemy.exc import DBAPIError
+
+from Database import LocalSQLite
+from RoutedDatabase import RoutedDatabase
+from VehicleProcessor import map_vehicles
+
+
+class TestRoutedDatabase(TestCase):
+    def setUp(self):
+        self.databases = []
+        for name in ('primary', 'replica_1', 'replica_2'):
+            database = LocalSQLite()
+            database.create_connection()
+            database.run_statement("CREATE TABLE meta_data (id INTEGER PRIMARY KEY, unique_id TEXT)")
+            database.run_statement("INSERT INTO meta_data (unique_id) VALUES (:name)", {'name': name})
+            database.run_statement("CREATE TABLE vehicle_meta_data (id INTEGER PRIMARY KEY, vehicle_id INT, "
+                                   "vehicle_type TEXT)")
+            database.run_statement("INSERT INTO vehicle_meta_data (vehicle_id, vehicle_type) VALUES (1, :name)",
+                                   {'name': name})
+            self.databases.append(database)
+        self.primary, self.replica_1, self.replica_2 = self.databases
+        self.db = RoutedDatabase(self.primary, [self.replica_1, self.replica_2], pin_seconds=60)
+
+    def tearDown(self):
+        for database in self.databases:
+            database.cleanUpDB()
+
+    def test_reads_go_round_robin_over_replicas(self):
+        reads = [self.db.run_query("SELECT unique_id FROM meta_data")[0][0] for _ in range(4)]
+        self.assertEqual(['replica_1', 'replica_2', 'replica_1', 'replica_2'], reads)
+
+    def test_reads_after_a_write_are_pinned_to_the_primary(self):
+        self.db.run_statement("UPDATE meta_data SET unique_id = 'written'")
+        self.assertEqual([('written',)], self.db.run_query("SELECT unique_id FROM meta_data"))
+        self.assertEqual([('replica_1',)], self.replica_1.run_query("SELECT unique_id FROM meta_data"))
+
+    def test_failing_replica_is_taken_out_of_rotation(self):
+        # a lost connection, the next statement on it fails with connection_invalidated
+        self.replica_1.connection.connection.dbapi_connection.close()
+        reads = [self.db.run_query("SELECT unique_id FROM meta_data")[0][0] for _ in range(3)]
+        self.assertEqual(['replica_2'] * 3, reads)
+        replica_1_stats = self.db.replica_stats()[0]
+        self.assertFalse(replica_1_stats['healthy'])
+        self.assertEqual(1, replica_1_stats['errors'])
+
+    def test_query_errors_leave_the_replica_in_rotation(self):
+        with self.assertRaises(DBAPIError):
+            self.db.run_query("SELEC unique_id FROM meta_data")
+        self.assertTrue(all(stats['healthy'] and stats['errors'] == 0 for stats in self.db.replica_stats()))
+        reads = [self.db.run_query("SELECT unique_id FROM meta_data")[0][0] for _ in range(2)]
+        self.assertEqual(['replica_2', 'replica_1'], reads)
+
+    def test_vehicle_processor_workers_read_from_the_replicas(self):
+        results = list(map_vehicles(lambda vehicle: vehicle.get_vehicle_type(), [1, 1, 1, 1], self.db, self.db,
+                                    workers=2))
+        self.assertEqual([None] * 4, [vehicle_result.error for vehicle_result in results])
+        self.assertTrue(all(vehicle_result.result in ('replica_1', 'replica_2') for vehicle_result in results))
+        stats = self.db.replica_stats()
+        self.assertEqual(4, stats[0]['calls'] + stats[1]['calls'])
+        self.assertEqual(0, stats[2]['calls'], "the primary served no reads")
@@ -0,0 +1,70 @@
+import threading
+from unittest import TestCase
+
+from Database import LocalSQLite
+from SensorDirectory import SensorDirectory, SensorOwner, clear_sensor_directories, sensor_directory
+from Vehicle import Vehicle
+
+STATEMENTS = [
+    "CREATE TABLE vehicle_meta_data (id INTEGER PRIMARY KEY, vehicle_id INT, fleet_id INT, archived INT)",
+    "CREATE TABLE meta_data (id INTEGER PRIMARY KEY, unique_id TEXT, vehicle_id INT, active INT)",
+    "INSERT INTO vehicle_meta_data (vehicle_id, fleet_id, archived) VALUES (1, 7, 0), (2, 8, 0), (2, 9, 1)",
+    "INSERT INTO meta_data (unique_id, vehicle_id, active) VALUES ('A', 1, 1), ('B', 1, 1), ('C', 2, 1), "
+    "('D', 2, 0), ('A', 2, 1)",
+]
+
+
+class TestSensorDirectory(TestCase):
+    def setUp(self):
+        self.db = LocalSQLite()
+        self.db.create_connection()
+        for statement in STATEMENTS:
+            self.db.run_statement(statement)
+        self.directory = SensorDirectory(self.db, batch_window=0.05)
+
+    def tearDown(self):
+        self.db.cleanUpDB()
+
+    def test_lookups_load_once(self):
+        self.directory.load_all()
+        self.assertEqual(SensorOwner(1, 7), self.directory.lookup('A'), "first active row wins")
+        self.assertEqual(SensorOwner(2, 8), self.directory.lookup('C'))
+        self.assertIsNone(self.directory.lookup('D'))
+        self.assertEqual(1, Vehicle.for_sensor('B', self.db, directory=self.directory).vehicle_id)
+
+    def test_concurrent_misses_share_one_query(self):
+        results = {}
+
+        def lookup(unique_id):
+            results[unique_id] = self.directory.vehicle_id(unique_id)
+
+        threads = [threading.Thread(target=lookup, args=(unique_id,)) for unique_id in ('A', 'B', 'C', 'D')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual({'A': 1, 'B': 1, 'C': 2, 'D': None}, results)
+        # the high water mark and one IN query for all four misses
+        self.assertEqual(2, self.directory.stats['queries'])
+        self.directory.lookup('D')
+        self.assertEqual(2, self.directory.stats['queries'], "unknown sensors are remembered")
+
+    def test_refresh_applies_new_and_deactivated_rows(self):
+        self.directory.load_all()
+        self.db.run_statement("UPDATE meta_data SET active = 0 WHERE vehicle_id = 1")
+        self.db.run_statement("INSERT INTO meta_data (unique_id, vehicle_id, active) VALUES ('E', 2, 1)")
+        self.assertEqual({'new_rows': 1, 'reloaded_vehicles': 1}, self.directory.refresh())
+        self.assertEqual(SensorOwner(2, 8), self.directory.lookup('A'))
+        self.assertEqual(SensorOwner(2, 8), self.directory.lookup('E'))
+        self.assertIsNone(self.directory.owners.get('B'))
+
+    def test_in_memory_dbs_get_their_own_directory(self):
+        other_db = LocalSQLite()
+        other_db.create_connection()
+        try:
+            self.assertIs(sensor_directory(self.db), sensor_directory(self.db))
+            self.assertIsNot(sensor_directory(self.db), sensor_directory(other_db))
+            self.assertIs(other_db, sensor_directory(other_db).read_database)
+        finally:
+            clear_sensor_directories()
+            other_db.cleanUpDB()
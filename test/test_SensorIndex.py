@@ -0,0 +1,39 @@
+from unittest import TestCase
+
+from Database import LocalSQLite
+from SensorIndex import SensorIndex
+from Vehicle import Vehicle
+
+STATEMENTS = [
+    "CREATE TABLE vehicle_meta_data (id INTEGER PRIMARY KEY, vehicle_id INT, vehicle_type TEXT, fleet_id INT, "
+    "fleet_vehicle_id TEXT, archived INT DEFAULT 0)",
+    "CREATE TABLE meta_data (id INTEGER PRIMARY KEY, position TEXT, type TEXT, side TEXT, axle INT, set_point INT, "
+    "unique_id TEXT, vehicle_id INT, active INT DEFAULT 1)",
+    "INSERT INTO vehicle_meta_data (vehicle_id, vehicle_type, fleet_id, fleet_vehicle_id) "
+    "VALUES (1, 'buckaroo', 1, 'T-1')",
+    "INSERT INTO meta_data (position, type, side, axle, set_point, unique_id, vehicle_id) "
+    "VALUES ('O', 'T', 'L', 2, 100, '3421_9DEC42', 1), ('I', 'T', 'L', 2, 100, '3421_1F077A', 1), "
+    "('O', 'P', 'R', 1, 0, '3421_9DAD06', 1)",
+]
+
+
+class TestSensorIndex(TestCase):
+    def setUp(self):
+        self.db = LocalSQLite()
+        self.db.create_connection()
+        for statement in STATEMENTS:
+            self.db.run_statement(statement)
+
+    def tearDown(self):
+        self.db.cleanUpDB()
+
+    def test_it_answers_sensor_lookups(self):
+        index = SensorIndex(self.db).load_vehicles([1])
+        self.assertEqual({'3421_9DEC42': 'L2OT', '3421_1F077A': 'L2IT', 'unknown': None},
+                         index.wheel_positions(['3421_9DEC42', '3421_1F077A', 'unknown']))
+        vehicle = Vehicle(read_database=self.db, write_database=self.db)
+        vehicle.use_sensor_index(index)
+        self.assertEqual(1, vehicle.get_vehicle_id('3421_9DEC42'))
+        self.assertEqual(['3421_9DEC42', '3421_1F077A'], vehicle.get_active_sensors())
+        self.assertEqual(3, vehicle.get_meta_data_id('3421_9DAD06'))
+        self.assertEqual('R1OP', vehicle.get_sensor_wheel_position('3421_9DAD06'))
@@ -0,0 +1,65 @@
+import io
+from unittest import TestCase
+
+from sqlalchemy import create_engine
+
+from SqlLoader import SqlScriptLoader, iter_sql_statements
+
+SCRIPT = """-- a comment; with a semicolon
+CREATE TABLE meta_data (id INTEGER PRIMARY KEY, unique_id TEXT, note TEXT);
+/* block ; comment */
+INSERT INTO meta_data (id, unique_id, note) VALUES (1, '3421_1F077A', 'it''s; fine');
+INSERT INTO meta_data (id, unique_id, note) VALUES (2, '3421_9DEC42', '50% -- not a comment');
+INSERT INTO meta_data (id, unique_id, note) VALUES (1, '3421_9DAD06', 'duplicate key');
+INSERT INTO meta_data (id, unique_id, note)
+VALUES (3, '3421_1F0B31', 'multi
+line;');
+UPDATE meta_data SET note = 'updated' WHERE id = 3;
+"""
+
+
+class TestIterSqlStatements(TestCase):
+    def test_it_splits_on_semicolons_outside_of_literals_and_comments(self):
+        statements = list(iter_sql_statements(io.StringIO(SCRIPT)))
+        self.assertEqual(6, len(statements))
+        self.assertEqual("INSERT INTO meta_data (id, unique_id, note) VALUES (1, '3421_1F077A', 'it''s; fine')",
+                         statements[1])
+        self.assertIn("'multi\nline;'", statements[4])
+
+    def test_it_honours_delimiter_commands(self):
+        script = "DELIMITER $$\nCREATE TRIGGER t BEFORE INSERT ON x FOR EACH ROW BEGIN SET NEW.a = 1; END$$\n" \
+                 "DELIMITER ;\nSELECT 1;\n"
+        statements = list(iter_sql_statements(io.StringIO(script)))
+        self.assertEqual(["CREATE TRIGGER t BEFORE INSERT ON x FOR EACH ROW BEGIN SET NEW.a = 1; END", "SELECT 1"],
+                         statements)
+
+    def test_it_handles_backslash_escapes(self):
+        statements = list(iter_sql_statements(io.StringIO("INSERT INTO x VALUES ('a\\';b');SELECT 2;")))
+        self.assertEqual(["INSERT INTO x VALUES ('a\\';b')", "SELECT 2"], statements)
+
+    def test_it_splits_long_multi_line_statements(self):
+        lines = ["INSERT INTO x VALUES\n"] + ["({0}, 'a;b'),\n".format(i) for i in range(20000)] + ["(0, 'c');\n"]
+        statements = list(iter_sql_statements(lines + ["\n", "SELECT 1;\n"]))
+        self.assertEqual(2, len(statements))
+        self.assertTrue(statements[0].endswith("(19999, 'a;b'),\n(0, 'c')"))
+
+
+class TestSqlScriptLoader(TestCase):
+    def setUp(self):
+        self.connection = create_engine('sqlite://').connect()
+
+    def tearDown(self):
+        self.connection.close()
+
+    def test_it_batches_inserts_and_collects_integrity_errors(self):
+        report = SqlScriptLoader(self.connection, batch_size=2).load_statements(iter_sql_statements(io.StringIO(SCRIPT)))
+        self.assertEqual(1, len(report.errors))
+        self.assertIn('duplicate key', report.errors[0][0])
+        self.assertEqual(3, report.rows)
+        rows = self.connection.exec_driver_sql('SELECT id, note FROM meta_data ORDER BY id').fetchall()
+        self.assertEqual([(1, "it's; fine"), (2, '50% -- not a comment'), (3, 'updated')], rows)
+
+    def test_it_merges_consecutive_inserts(self):
+        statements = ["INSERT INTO x (a) VALUES (1)", "INSERT INTO x (a) VALUES (2)", "INSERT INTO y (a) VALUES (3)"]
+        merged = list(SqlScriptLoader(self.connection).merge_inserts(statements))
+        self.assertEqual(["INSERT INTO x (a) VALUES (1),(2)", "INSERT INTO y (a) VALUES (3)"], merged)
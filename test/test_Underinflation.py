@@ -0,0 +1,58 @@
+from unittest import TestCase
+
+import pandas as pd
+
+from Cache import reference_data_cache
+from Database import LocalSQLite
+from Underinflation import classify_pressure, classify_underinflation
+from VehicleBatch import VehicleBatch
+
+
+class TestUnderinflation(TestCase):
+    def setUp(self):
+        self.set_points = pd.DataFrame({'unique_id': ['A', 'B', 'P'], 'set_point': [100, 100, 0],
+                                        'fleet_id': [1, 2, 1]})
+        self.offsets = pd.DataFrame({'unique_id': ['A'], 'pressure_offset': [5.0]})
+        self.thresholds = {1: {'critical': 0.6, 'major': 0.8, 'minor': 0.85},
+                           2: {'critical': 0.5, 'major': 0.7, 'minor': 0.9}}
+
+    def test_classifies_readings_with_fleet_thresholds_and_offsets(self):
+        readings = pd.DataFrame({'unique_id': ['A', 'A', 'A', 'A', 'B', 'B', 'P', 'X'],
+                                 'pressure': [60, 80, 88, 95, 60, 88, 10, 10]})
+        classified = classify_underinflation(readings, self.set_points, self.offsets, self.thresholds)
+        self.assertEqual(['CRITICAL', 'MAJOR', 'MINOR', None, 'MAJOR', 'MINOR', None, None],
+                         [None if pd.isna(severity) else severity for severity in classified.severity])
+        self.assertEqual([5.0, 0.0], classified.pressure_offset.iloc[[0, 4]].tolist())
+
+    def test_matches_the_single_reading_rules(self):
+        readings = pd.DataFrame({'unique_id': ['B'] * 100, 'pressure': [float(pressure) for pressure in range(100)]})
+        classified = classify_underinflation(readings, self.set_points, thresholds=self.thresholds)
+        expected = [classify_pressure(pressure, 100, 0.0, self.thresholds[2]) for pressure in readings.pressure]
+        self.assertEqual(expected, [None if pd.isna(severity) else severity for severity in classified.severity])
+
+
+class TestVehicleBatchUnderinflation(TestCase):
+    def setUp(self):
+        reference_data_cache.invalidate()
+        self.db = LocalSQLite()
+        self.db.create_connection()
+        self.db.run_statement("CREATE TABLE vehicle_meta_data (vehicle_id INT, fleet_id INT, archived INT)")
+        self.db.run_statement("INSERT INTO vehicle_meta_data VALUES (1, 1, 0), (2, NULL, 0)")
+        self.db.run_statement("CREATE TABLE custom_alert_parameters (scope_type TEXT, scope_id TEXT, settings TEXT)")
+        for scope_type, scope_id, critical in (('GLOBAL', None, 0.6), ('ACCOUNT', '1', 0.5), ('ACCOUNT', 'None', 0.4)):
+            settings = '[{{"type": "UNDERINFLATION", "critical": {0}, "major": 0.95, "minor": 0.97}}]'.format(critical)
+            self.db.run_statement("INSERT INTO custom_alert_parameters VALUES (:scope_type, :scope_id, :settings)",
+                                  {'scope_type': scope_type, 'scope_id': scope_id, 'settings': settings})
+
+    def tearDown(self):
+        self.db.cleanUpDB()
+        reference_data_cache.invalidate()
+
+    def test_vehicles_without_a_fleet_get_the_global_thresholds(self):
+        vehicles = pd.DataFrame({'vehicle_id': [1, 2], 'vehicle_type': ['tractor', 'trailer'], 'fleet_id': [1, None],
+                                 'fleet_vehicle_id': ['T-1', None], 'fleet_name': ['buckaroos', None]})
+        set_points = pd.DataFrame({'vehicle_id': [1, 2], 'unique_id': ['A', 'B'], 'set_point': [100, 100]})
+        batch = VehicleBatch(self.db, self.db).load_frames(vehicles, set_points)
+        readings = pd.DataFrame({'unique_id': ['A', 'B'], 'pressure': [55, 55]})
+        classified = batch.classify_underinflation(readings)
+        self.assertEqual(['MAJOR', 'CRITICAL'], classified.severity.tolist())
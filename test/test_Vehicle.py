@@ -1,7 +1,10 @@
 from datetime import datetime
+import json
 from unittest import TestCase
 from Vehicle import Vehicle
 from Database import Localhost
+from Cache import reference_data_cache
+from OpenEvents import OpenEventsTable
 import pandas as pd
 
 
@@ -10,6 +13,7 @@ class TestVehicle(TestCase):
         self.db = Localhost('vehicle_test')
         self.db.setupDb('../_database_setup/vehicle_db.sql')
         self.vehicle = Vehicle(1, self.db, self.db)
+        reference_data_cache.invalidate()
 
     def tearDown(self):
         self.db.cleanUpDB()
@@ -53,6 +57,11 @@ VALUES ('O', 'T', 'L', 3, 100, 3421, '9DEC42', null, '3421_9DEC42', null, 1, 0,
         cycle_number = self.vehicle.get_cycle_number()
         self.assertEqual(3421, cycle_number)
 
+    def test_get_cycle_number_reads_the_current_cycle(self):
+        self.vehicle.get_cycle_number()
+        self.db.run_statement("UPDATE meta_data SET cycle_number = 3422 WHERE vehicle_id = 1")
+        self.assertEqual(3422, self.vehicle.get_cycle_number())
+
     def test_get_events(self):
         open_events = self.vehicle.get_open_events('3421_1F077A')
         open_list = open_events.loc[0:].values.tolist()
@@ -85,6 +94,16 @@ VALUES ('O', 'T', 'L', 3, 100, 3421, '9DEC42', null, '3421_9DEC42', null, 1, 0,
         self.assertEqual(0.82, params['major'])
         self.assertEqual(0.68, params['critical'])
 
+    def test_ui_thresholds_are_shared_across_vehicles_in_a_fleet(self):
+        self.db.populate_db('../_database_setup/custom_alert_params.sql')
+        from logging import Logger
+        logger = Logger("mush")
+        self.vehicle.get_custom_underinflation_thresholds(logger)
+        misses = reference_data_cache.misses
+        params = Vehicle(1, self.db, self.db).get_custom_underinflation_thresholds(logger)
+        self.assertEqual(misses, reference_data_cache.misses, "The second vehicle in the fleet should not go to the DB")
+        self.assertEqual(0.85, params['minor'])
+
     def test_set_all_meta_data_to_inactive(self):
         self.db.populate_db('../_database_setup/sql_inserts_meta_data_3_cycles_2_days_lite.sql')
         self.vehicle.vehicle_id = 2527
@@ -138,6 +157,17 @@ VALUES ('O', 'T', 'L', 3, 100, 3421, '9DEC42', null, '3421_9DEC42', null, 1, 0,
         self.assertTrue('sensordata_2021_02_01' in zips[1], "There should be 2 zips from 2021-02-01 (the configurations) and no more from that day")
         self.assertTrue('sensordata_2021_02_15/C63DCE68B8ED866258040548411_17:36:48' in zips[-1], "The last zip file should be before 2021-02-15 17:38 because that's 2 days after the timestamp for the event_id")
 
+    def test_iter_zip_files_in_json_etl_format_resumes_after_cursor(self):
+        self.db.populate_db('../_database_setup/sql_inserts_file_meta_data_cycle_3421.sql')
+        vehicle = Vehicle(vehicle_id=1, read_database=self.db, write_database=self.db)
+        window = {'time_window_begin': '2021-02-10 04:11:44', 'time_window_end': '2021-02-10 23:56:38'}
+        zips = list(vehicle.iter_zip_files_in_json_ETL_format(page_size=2, with_cursor=True, **window))
+        keys = [payload['event']['Records'][0]['s3']['object']['key'] for cursor, payload in zips]
+        self.assertEqual(len(keys), len(set(keys)), "Configurations in the time window should only be yielded once")
+        self.assertTrue('sensordata_2021_02_10' in keys[2], "The configurations should come before the time window")
+        resumed = list(vehicle.iter_zip_files_in_json_ETL_format(page_size=2, after=zips[2][0], as_bytes=True, **window))
+        self.assertEqual([json.dumps(payload).encode('utf-8') for cursor, payload in zips[3:]], resumed)
+
     def test_finds_open_events(self):
         self.db.setupDb()
         self.db.populate_db('../_database_setup/sql_inserts_open_event.sql', disable_foreign_keys=True)
@@ -148,8 +178,35 @@ VALUES ('O', 'T', 'L', 3, 100, 3421, '9DEC42', null, '3421_9DEC42', null, 1, 0,
         self.assertEqual('UI', events.event_type[0], "Should be finding a UI")
         self.assertEqual(1, events.event_id[0], "Returning incorrect event_id")
 
+    def test_finds_open_events_in_open_events_table(self):
+        self.db.setupDb()
+        self.db.populate_db('../_database_setup/sql_inserts_open_event.sql', disable_foreign_keys=True)
+        open_events_table = OpenEventsTable(self.db)
+        open_events_table.create()
+        open_events_table.rebuild()
+        self.assertEqual(0, open_events_table.refresh(), "Nothing changed since the rebuild")
+        vehicle = Vehicle(vehicle_id=1, read_database=self.db, write_database=self.db)
+        events = vehicle.get_open_events(unique_id='1_22043F', open_events_table=open_events_table)
+        expected = vehicle.get_open_events(unique_id='1_22043F')
+        self.assertEqual(expected.event_id.to_list(), events.event_id.to_list())
+        self.assertEqual(expected.event_type.to_list(), events.event_type.to_list())
+        open_events_table.drop()
+
     def test_gets_current_sensor_wheel_position(self):
         self.db.run_statement("INSERT INTO meta_data (position, type, side, axle, set_point, cycle_number, sensor_number, md_id, unique_id, fleet_name, vehicle_id, active, halo_id, sensor_attribute_id, tire_model, tire_make, tire_diameter, tire_width, tire_aspect_ratio, tire_load_rating, tire_id, created_at, deactivated_at) VALUES ('O', 'T', 'L', 2, 100, 3421, '9DEC42', null, '3421_9DEC42', null, 1, 0, null, null, null, null, null, null, null, null, null, '2022-02-16 13:28:17', null);")
         vehicle = Vehicle(vehicle_id=1, read_database=self.db, write_database=self.db)
         wheel_position = vehicle.get_sensor_wheel_position('3421_9DEC42')
         self.assertEqual('L3OT', wheel_position, "Not returning the correct wheel position. Should be returning the latest active meta_data row.")
+
+    def test_active_sensors_and_setpoints_are_cached(self):
+        sensors = self.vehicle.get_active_sensors_and_setpoints()
+        self.db.run_statement("UPDATE meta_data SET active = 0 WHERE vehicle_id = 1")
+        # the second call does not go to the DB
+        self.assertIs(sensors, self.vehicle.get_active_sensors_and_setpoints())
+        self.assertIs(sensors, self.vehicle.active_set_points)
+
+    def test_set_all_meta_data_to_inactive_invalidates_cached_sensors(self):
+        self.assertEqual(10, len(self.vehicle.get_active_sensors()))
+        self.vehicle.set_all_meta_data_to_inactive()
+        self.assertIsNone(self.vehicle.active_set_points)
+        self.assertEqual(0, len(self.vehicle.get_active_sensors()))
@@ -0,0 +1,96 @@
+from unittest import TestCase
+from Vehicle import Vehicle
+from VehicleBatch import VehicleBatch
+from Database import Localhost, LocalSQLite
+
+STATEMENTS = [
+    "CREATE TABLE vehicle_meta_data (id INTEGER PRIMARY KEY, vehicle_id INT, vehicle_type TEXT, fleet_id INT, "
+    "fleet_vehicle_id TEXT, archived INT)",
+    "CREATE TABLE fleet_meta_data (fleet_id INTEGER PRIMARY KEY, fleet_name TEXT)",
+    "CREATE TABLE meta_data (id INTEGER PRIMARY KEY, unique_id TEXT, vehicle_id INT, set_point INT, type TEXT, "
+    "active INT)",
+    "CREATE TABLE leak_detection_pressure_offsets (id INTEGER PRIMARY KEY, date DATE, pressure_offset REAL, "
+    "unique_id TEXT)",
+    "INSERT INTO vehicle_meta_data (id, vehicle_id, vehicle_type, fleet_id, fleet_vehicle_id, archived) "
+    "VALUES (4, 2, 'trailer', 1, 'T-2', 0), (3, 1, 'dolly', 1, 'T-1', 0), (1, 1, 'tractor', 1, 'T-0', 1)",
+    "INSERT INTO fleet_meta_data VALUES (1, 'buckaroos')",
+    "INSERT INTO meta_data (unique_id, vehicle_id, set_point, type, active) "
+    "VALUES ('3421_9DEC42', 1, 100, 'T', 1), ('3421_9DEC42', 2, 100, 'T', 1), ('3422_000001', 2, 90, 'T', 1)",
+    "INSERT INTO leak_detection_pressure_offsets (date, pressure_offset, unique_id) "
+    "VALUES ('2021-02-01', 1.5, '3421_9DEC42')",
+]
+
+
+class TestVehicleBatch(TestCase):
+    def setUp(self):
+        self.db = Localhost('vehicle_test')
+        self.db.setupDb('../_database_setup/vehicle_db.sql')
+
+    def tearDown(self):
+        self.db.cleanUpDB()
+
+    def test_it_hydrates_vehicle_attributes(self):
+        batch = VehicleBatch(self.db, self.db).load([1])
+        vehicle = batch[1]
+        self.assertEqual("buckaroo", vehicle.vehicle_type)
+        self.assertEqual(1, vehicle.fleet_id)
+        self.assertEqual(10, len(vehicle.active_sensors))
+        self.assertEqual(10, vehicle.active_set_points.shape[0])
+
+    def test_getters_do_not_go_to_the_db_after_loading(self):
+        batch = Vehicle.load_many([1], self.db, self.db)
+        vehicle = batch[1]
+        self.db.run_statement("UPDATE meta_data SET active = 0 WHERE vehicle_id = 1")
+        self.assertEqual(10, len(vehicle.get_active_sensors()))
+        self.assertEqual("buckaroo", vehicle.get_vehicle_type())
+
+    def test_fleet_vehicle_id_is_not_queried_after_loading(self):
+        vehicle = Vehicle.load_many([1], self.db, self.db)[1]
+        fleet_vehicle_id = vehicle.fleet_vehicle_id
+        self.db.run_statement("UPDATE vehicle_meta_data SET fleet_vehicle_id = 'changed' WHERE vehicle_id = 1")
+        self.assertEqual(fleet_vehicle_id, vehicle.get_fleet_vehicle_id())
+
+    def test_it_loads_offsets_for_the_whole_batch(self):
+        add_a_row = "INSERT INTO vehicle_test.leak_detection_pressure_offsets (date, pressure_offset, pressure_count, unique_id) VALUES('2020-12-06', -1, 288, '3421_9DEC42');"
+        self.db.run_statement(add_a_row)
+        batch = VehicleBatch(self.db, self.db).load([1], start_of_analysis_date='2020-11-30')
+        offsets = batch[1].get_sensor_pressure_offsets(start_of_analysis_date='2020-11-30')
+        self.assertEqual(5, offsets.shape[0])
+        self.assertEqual(-1.0, offsets[offsets['unique_id'] == '3421_9DAD06']['pressure_offset'].item())
+
+    def test_unknown_vehicles_get_empty_sensor_lists(self):
+        batch = VehicleBatch(self.db, self.db).load([1, 987654])
+        self.assertEqual([], batch[987654].get_active_sensors())
+        self.assertIsNone(batch[987654].vehicle_type)
+
+    def test_it_loads_open_events_for_the_whole_batch(self):
+        batch = VehicleBatch(self.db, self.db).load([1], open_events=True)
+        self.db.run_statement("DELETE FROM event_status")
+        open_vehicle_events = batch[1].get_open_vehicle_events()
+        self.assertEqual(2202672, open_vehicle_events.event_id.item())
+        self.assertIsNone(batch[1].get_open_ui_events())
+
+
+class TestVehicleBatchOnSQLite(TestCase):
+    def setUp(self):
+        self.db = LocalSQLite()
+        self.db.create_connection()
+        for statement in STATEMENTS:
+            self.db.run_statement(statement)
+
+    def tearDown(self):
+        self.db.cleanUpDB()
+
+    def test_it_picks_the_same_rows_as_the_getters(self):
+        batch = VehicleBatch(self.db, self.db).load([2, 1])
+        for vehicle_id in (1, 2):
+            vehicle = Vehicle(vehicle_id, self.db, self.db)
+            self.assertEqual(vehicle.get_vehicle_type(), batch[vehicle_id].vehicle_type)
+            self.assertEqual(vehicle.get_fleet_id(), batch[vehicle_id].fleet_id)
+            self.assertEqual(vehicle.get_fleet_vehicle_id(), batch[vehicle_id].fleet_vehicle_id)
+
+    def test_a_sensor_active_on_two_vehicles_gets_its_offsets_on_both(self):
+        batch = VehicleBatch(self.db, self.db).load([1, 2], start_of_analysis_date='2021-02-01')
+        for vehicle_id in (1, 2):
+            offsets = batch[vehicle_id].get_sensor_pressure_offsets('2021-02-01')
+            self.assertEqual([1.5], offsets.pressure_offset.tolist())
@@ -0,0 +1,32 @@
+from unittest import TestCase
+from Database import Localhost
+from VehicleProcessor import VehicleProcessor, map_vehicles
+
+
+class TestVehicleProcessor(TestCase):
+    def setUp(self):
+        self.db = Localhost('vehicle_test')
+        self.db.setupDb('../_database_setup/vehicle_db.sql')
+
+    def tearDown(self):
+        self.db.cleanUpDB()
+
+    def test_it_returns_results_in_order(self):
+        results = list(map_vehicles(lambda vehicle: vehicle.get_vehicle_type(), [1, 1, 1], self.db, self.db, workers=2))
+        self.assertEqual([1, 1, 1], [vehicle_result.vehicle_id for vehicle_result in results])
+        self.assertEqual(["buckaroo"] * 3, [vehicle_result.result for vehicle_result in results])
+
+    def test_it_captures_errors_per_vehicle(self):
+        def fail_for_missing_vehicles(vehicle):
+            return vehicle.get_vehicle_type()
+
+        with VehicleProcessor(self.db, self.db, workers=2) as processor:
+            results = list(processor.map(fail_for_missing_vehicles, [1, 987654], ordered=False))
+        errors = {vehicle_result.vehicle_id: vehicle_result.error for vehicle_result in results}
+        self.assertIsNone(errors[1])
+        self.assertIsInstance(errors[987654], IndexError)
+
+    def test_workers_do_not_share_the_main_connection(self):
+        connections = list(map_vehicles(lambda vehicle: vehicle.read_database.connection, [1, 1], self.db, self.db))
+        for vehicle_result in connections:
+            self.assertIsNot(self.db.connection, vehicle_result.result)
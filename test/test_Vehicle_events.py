@@ -2,7 +2,8 @@ import datetime
 
 from unittest import TestCase
 from Vehicle import Vehicle
-from Database import Localhost
+from Database import Localhost, LocalSQLite
+from OpenEvents import EVENT_COLUMNS, OpenEventsTable, load_open_vehicle_events, open_events_by_vehicle
 import pandas as pd
 
 
@@ -135,3 +136,56 @@ class TestVehicleEvents(TestCase):
             "INSERT INTO event_status (event_status_id, event_id, ts_created, severity, status, event_input_variables, severity_order) VALUES (1811777, 2200475, '2021-04-07 16:03:55', NULL, 'CLOSED',NULL, 3);")
         leak_events = self.vehicle.get_open_leak_and_ui_leak_events()
         self.assertIsNone(leak_events)
+
+    def test_sql_and_pandas_strategies_agree(self):
+        self.db.run_statement(
+            "INSERT INTO event_table (event_id, unique_id, event_type, pressure_date, ts_created)" \
+            "VALUES(2200474,'3421_1F0B31', 'UI', '2021-06-20 20:45:14', '2021-06-20 20:45:14');")
+        self.db.run_statement(
+            "INSERT INTO event_status (event_status_id, event_id, ts_created, severity, status, event_input_variables, severity_order) VALUES (1811773, 2200474, '2021-04-07 16:03:55', NULL, 'OPEN',NULL, 3);")
+        sql_events = load_open_vehicle_events(self.db, [1], strategy='sql')
+        pandas_events = load_open_vehicle_events(self.db, [1], strategy='pandas')
+        self.assertEqual(sql_events.event_id.to_list(), pandas_events.event_id.to_list())
+        self.assertEqual([1, 1], sql_events.index.to_list())
+
+
+class TestOpenEventsByVehicle(TestCase):
+    def test_it_splits_events_by_vehicle(self):
+        open_events = pd.DataFrame([[1, 7, 70, '3421_9DEC42', 'UI', 'MINOR', 'OPEN', None],
+                                    [2, 8, 80, '3422_000001', 'LEAK', 'MAJOR', 'OPEN', None],
+                                    [1, 9, 90, '3421_1F077A', 'UI', 'MINOR', 'OPEN', None]],
+                                   columns=EVENT_COLUMNS).set_index('vehicle_id')
+        events = open_events_by_vehicle(open_events, [1, 2, 3])
+        self.assertEqual([7, 9], events[1].event_id.to_list())
+        self.assertEqual([0, 1], events[1].index.to_list())
+        self.assertEqual([8], events[2].event_id.to_list())
+        self.assertTrue(events[3].empty)
+        self.assertEqual(EVENT_COLUMNS[1:], events[3].columns.to_list())
+
+
+class TestOpenEventsTable(TestCase):
+    def setUp(self):
+        self.db = LocalSQLite()
+        self.db.create_connection()
+        for statement in ("CREATE TABLE event_table (event_id INTEGER PRIMARY KEY, unique_id TEXT, event_type TEXT, "
+                          "pressure_date DATETIME)",
+                          "CREATE TABLE event_status (event_status_id INTEGER PRIMARY KEY, event_id INT, "
+                          "ts_created DATETIME, severity TEXT, status TEXT)",
+                          "INSERT INTO event_table VALUES (7, '3421_9DEC42', 'LEAK', '2021-02-01 10:00:00'), "
+                          "(8, '3421_9DEC42', 'UI', '2021-02-01 11:00:00')",
+                          "INSERT INTO event_status VALUES (1, 7, '2021-02-01 10:00:00', 'MINOR', 'OPEN'), "
+                          "(2, 8, '2021-02-01 11:00:00', 'MINOR', 'SUSPECTED')"):
+            self.db.run_statement(statement)
+        self.open_events_table = OpenEventsTable(self.db)
+        self.open_events_table.create()
+
+    def tearDown(self):
+        self.db.cleanUpDB()
+
+    def test_refresh_applies_the_statuses_since_the_last_refresh(self):
+        self.assertEqual(2, self.open_events_table.refresh())
+        self.db.run_statement("INSERT INTO event_status VALUES (3, 7, '2021-02-02 10:00:00', 'MINOR', 'CLOSED')")
+        self.assertEqual(1, self.open_events_table.refresh())
+        self.assertEqual(0, self.open_events_table.refresh())
+        self.assertEqual(3, self.open_events_table.high_water_mark())
+        self.assertEqual([(8, 'SUSPECTED')], self.db.run_query('SELECT event_id, status FROM open_events'))
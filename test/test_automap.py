@@ -0,0 +1,44 @@
+import os
+import tempfile
+from unittest import TestCase, skipUnless
+
+from Database import LocalSQLite
+
+
+class TestAutomapReflection(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.directory.name, 'schema_cache')
+        self.db = LocalSQLite(os.path.join(self.directory.name, 'automap.db'))
+        self.db.create_connection()
+        self.db.run_statement("CREATE TABLE meta_data (id INTEGER PRIMARY KEY, unique_id TEXT, vehicle_id INT)")
+        self.db.run_statement("INSERT INTO meta_data (unique_id, vehicle_id) VALUES ('3421_9DEC42', 1), "
+                              "('3421_1F077A', 1), ('3421_9DAD06', 1)")
+
+    def tearDown(self):
+        self.db.cleanUpDB()
+        self.directory.cleanup()
+
+    def cache_files(self):
+        return [name for name in os.listdir(self.cache_dir) if name.endswith('.pickle')]
+
+    def test_automap_reflection_is_cached(self):
+        base, session = self.db.create_base_with_session(tables=['meta_data'], cache_dir=self.cache_dir)
+        self.assertEqual(['meta_data'], list(base.classes.keys()))
+        self.assertEqual(3, session.query(base.classes.meta_data).count())
+        self.assertEqual(1, len(self.cache_files()))
+        self.assertEqual(0o700, os.stat(self.cache_dir).st_mode & 0o777)
+
+        same_base, _ = self.db.create_base_with_session(tables=['meta_data'], cache_dir=self.cache_dir)
+        self.assertIs(base, same_base)
+        self.db.run_statement('ALTER TABLE meta_data ADD COLUMN note TEXT')
+        changed_base, _ = self.db.create_base_with_session(tables=['meta_data'], cache_dir=self.cache_dir)
+        self.assertIn('note', changed_base.classes.meta_data.__table__.c)
+
+    @skipUnless(hasattr(os, 'getuid'), "permissions are only checked where there are uids")
+    def test_cache_is_not_used_in_a_directory_others_can_write_to(self):
+        os.makedirs(self.cache_dir)
+        os.chmod(self.cache_dir, 0o777)
+        base, _ = self.db.create_base_with_session(tables=['meta_data'], cache_dir=self.cache_dir)
+        self.assertEqual(['meta_data'], list(base.classes.keys()))
+        self.assertEqual([], self.cache_files())
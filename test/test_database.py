@@ -30,6 +30,33 @@ class TestLocalhost(TestCase):
 
         self.assertIsNotNone(self.db.run_query('SELECT * FROM meta_data'))
 
+    def test_it_reuses_the_engine_for_the_same_database(self):
+        self.db.create_connection()
+        other_db = Localhost("test_dbm")
+        other_db.create_connection()
+        self.assertIs(self.db.get_engine(), other_db.get_engine())
+        self.assertIsNot(self.db.connection, other_db.connection)
+        pool = self.db.get_engine().pool
+        other_db.cleanUpDB()
+        self.assertIs(pool, self.db.get_engine().pool, "cleaning up one instance must keep the shared pool")
+        self.assertEqual([(1,)], self.db.run_query('SELECT 1'))
+
+    def test_it_can_check_out_a_pooled_connection(self):
+        self.db.create_connection()
+        with self.db.pooled_connection() as connection:
+            self.assertIsNot(self.db.connection, connection)
+            self.assertEqual(1, connection.execute(sqlalchemy.text('SELECT 1')).scalar())
+
+    def test_it_can_stream_a_query_in_chunks(self):
+        self.db.setupDb("../_database_setup/cycle_596_data.sql")
+        rows = self.db.run_query('SELECT * FROM meta_data')
+        chunks = list(self.db.stream_query('SELECT * FROM meta_data WHERE id > :id', {'id': 0}, chunk_size=2))
+        self.assertTrue(all(len(chunk) <= 2 for chunk in chunks))
+        self.assertEqual(len(rows), sum(len(chunk) for chunk in chunks))
+        frames = list(self.db.read_frame_chunks('SELECT unique_id FROM meta_data', chunk_size=2))
+        self.assertEqual(len(rows), sum(len(frame) for frame in frames))
+        self.assertEqual(['unique_id'], list(frames[0].columns))
+
     def test_it_can_insert_and_update(self):
         self.db.create_connection()
         self.assertIsNotNone(self.db.run_statement('insert into meta_data (position,type,side,axle,sensor_number,set_point,unique_id,active) values ("I","T","R",3,23455,100,"3456_23455",1)'))
@@ -75,6 +102,28 @@ class TestCleanupDB(TestCase):
         self.operational_db.cleanUpDB()
         self.analytics_db.cleanUpDB()
 
+class TestSnapshot(TestCase):
+    def setUp(self):
+        self.db = Localhost("snapshot_db")
+
+    def tearDown(self):
+        self.db.cleanUpDB()
+
+    def test_it_restores_a_populated_db_from_a_snapshot(self):
+        self.db.setupDb("../_database_setup/cycle_596_data.sql", use_snapshot=True)
+        expected = self.db.run_query("SELECT COUNT(*) FROM meta_data")
+        self.db.run_statement("DELETE FROM meta_data")
+        self.db.setupDb("../_database_setup/cycle_596_data.sql", use_snapshot=True)
+        self.assertEqual(expected, self.db.run_query("SELECT COUNT(*) FROM meta_data"))
+
+    def test_snapshot_name_changes_with_the_data_file(self):
+        first = self.db.snapshot_name("../_database_setup/cycle_596_data.sql",
+                                      "../_database_setup/grace_production_schema.sql", False)
+        second = self.db.snapshot_name("../_database_setup/vehicle_db.sql",
+                                       "../_database_setup/grace_production_schema.sql", False)
+        self.assertNotEqual(first, second)
+
+
 class TestDBCreation(TestCase):
     def test_it_can_make_a_db_when_it_does_not_exist(self):
         localhost = Localhost("make_a_db")